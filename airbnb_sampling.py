@@ -0,0 +1,107 @@
+# airbnb_sampling.py
+
+import logging
+import statistics
+from datetime import date, timedelta
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def get_sampling_settings(config):
+    settings = config.get('airbnb_sampling', {})
+    return {
+        "candidates_to_cover": settings.get('candidates_to_cover', 50),
+        "date_window_days": settings.get('date_window_days', 7),
+        "night_tolerance": settings.get('night_tolerance', 0.3),
+        "max_searches": settings.get('max_searches', 4),
+        "stable_tolerance": settings.get('stable_tolerance', 0.1),
+    }
+
+def _covers(search, checkin_ordinals, num_nights, date_window_days, night_tolerance):
+    """Mask of the stays (checkin, nights) that a search at search = (checkin, nights) is representative of."""
+    search_checkin, search_nights = search
+    night_slack = max(1, round(search_nights * night_tolerance))
+    return (np.abs(checkin_ordinals - search_checkin) <= date_window_days) & (np.abs(num_nights - search_nights) <= night_slack)
+
+def plan_airbnb_searches(candidates, settings):
+    """
+    Picks the fewest (checkin ordinal, nights) searches that cover the stays
+    of the best flight candidates, greedily: each pick is the candidate stay
+    whose search would cover the most still-uncovered stays. Stays are
+    covered by a search whose check-in is within date_window_days and whose
+    night count is within night_tolerance of theirs. Returns the searches in
+    pick order, at most max_searches of them.
+    """
+    top = np.arange(min(len(candidates), settings['candidates_to_cover']))
+    top = top[candidates.num_nights[top] > 0]
+    checkin_ordinals, num_nights = candidates.outbound_ordinals[top], candidates.num_nights[top]
+    stays = list(dict.fromkeys(zip(checkin_ordinals.tolist(), num_nights.tolist())))
+    coverage = {stay: _covers(stay, checkin_ordinals, num_nights, settings['date_window_days'], settings['night_tolerance'])
+                for stay in stays}
+
+    searches = []
+    uncovered = np.ones(len(top), dtype=bool)
+    while uncovered.any() and len(searches) < settings['max_searches']:
+        # Stays are in candidate rank order, so ties go to the better candidate.
+        best_stay = max(stays, key=lambda stay: np.count_nonzero(coverage[stay] & uncovered))
+        searches.append(best_stay)
+        uncovered &= ~coverage[best_stay]
+    return searches
+
+
+class AirbnbSampler:
+    """
+    Phase 3 search plan: iterating yields (nights, checkin, checkout) for each
+    planned search, and record() takes the listings it found. A planned stay
+    that one of the stored searches ({(checkin ordinal, nights): listings},
+    from earlier runs) is representative of reuses its listings instead of
+    being yielded. Iteration stops early once another search moves the
+    per-night price estimate by less than stable_tolerance.
+    """
+    def __init__(self, candidates, config, stored=None):
+        self.settings = get_sampling_settings(config)
+        self.searches = plan_airbnb_searches(candidates, self.settings)
+        self.stored = stored or {}
+        self.reused = set()
+        self.skipped = 0
+        self.listings_by_nights = {}
+        self.estimates = []
+
+    def _stored_search(self, search):
+        """The stored search representative of a planned one: the same search, else one that covers its stay."""
+        if search in self.stored:
+            return search
+        checkin_ordinal, nights = search
+        return next((stored_search for stored_search in self.stored
+                     if _covers(stored_search, checkin_ordinal, nights, self.settings['date_window_days'], self.settings['night_tolerance'])),
+                    None)
+
+    def __iter__(self):
+        for index, (checkin_ordinal, nights) in enumerate(self.searches):
+            if self.is_stable():
+                self.skipped = len(self.searches) - index
+                return
+            stored_search = self._stored_search((checkin_ordinal, nights))
+            if stored_search is not None:
+                if stored_search not in self.reused:
+                    self.reused.add(stored_search)
+                    self.record(stored_search[1], self.stored[stored_search])
+                continue
+            checkin = date.fromordinal(checkin_ordinal)
+            yield nights, checkin.strftime("%Y-%m-%d"), (checkin + timedelta(days=nights)).strftime("%Y-%m-%d")
+
+    def record(self, nights, listings):
+        """Adds a search's listings and updates the per-night price estimate."""
+        if listings:
+            known_links = {listing['link'] for listing in self.listings_by_nights.get(nights, [])}
+            self.listings_by_nights.setdefault(nights, []).extend(l for l in listings if l['link'] not in known_links)
+        per_night_prices = [listing['total_accommodation_cost'] / n
+                            for n, nights_listings in self.listings_by_nights.items() for listing in nights_listings]
+        self.estimates.append(statistics.median(per_night_prices) if per_night_prices else None)
+
+    def is_stable(self):
+        if len(self.estimates) < 2 or None in self.estimates[-2:]:
+            return False
+        previous, latest = self.estimates[-2:]
+        return abs(latest - previous) <= self.settings['stable_tolerance'] * previous
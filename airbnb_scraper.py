@@ -1,130 +1,219 @@
-import json
-import time
-from playwright.sync_api import Page, Error
+import logging
+from playwright.sync_api import Page, Error, TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import Page as AsyncPage, Error as AsyncError
 from urllib.parse import quote
 import re
-from datetime import datetime, timedelta
-import random
-import sys
+from datetime import date, datetime
+import calendar
+import heapq
 
-# Seed random generator
-random.seed(time.time())
+from scraping_utils import parse_price_text
+from pacing import get_pacer
+from metrics import span, increment
 
-def get_cheapest_accommodations(page, destination_city, specific_location_query, checkin, checkout, config, log_func):
-    """Scrapes Airbnb for cheapest listings."""
+logger = logging.getLogger(__name__)
+
+def _search_url(specific_location_query, checkin, checkout):
+    """Builds the Airbnb search URL for a location and date range."""
     encoded_query = quote(specific_location_query)
-    search_url = f"https://www.airbnb.com/s/homes?query={encoded_query}&checkin={checkin}&checkout={checkout}&adults=2&room_types%5B%5D=Private%20room"
-    
-    print(f" - Navigating to Airbnb: {specific_location_query}")
+    return f"https://www.airbnb.com/s/homes?query={encoded_query}&checkin={checkin}&checkout={checkout}&adults=2&room_types%5B%5D=Private%20room"
+
+def _parse_rating(rating_text_full):
+    """Extracts the numeric rating from a card's rating text."""
+    rating_match = re.search(r'([\d.]+)', rating_text_full or "")
+    return rating_match.group(1) if rating_match else "N/A"
+
+def _parse_calendar_day(full_date_str, is_blocked, aria_disabled):
+    """Turns a calendar day's test id and flags into (YYYY-MM-DD, is_available)."""
+    date_part = full_date_str.replace('calendar-day-', '')
+    date_obj = datetime.strptime(date_part, '%m/%d/%Y').strftime('%Y-%m-%d')
+    return date_obj, not (is_blocked or aria_disabled)
+
+# Reads every listing card's fields in one browser round trip. Cards missing a
+# name or price also send back their HTML so failures can be reported.
+LISTING_CARDS_JS = """
+() => Array.from(document.querySelectorAll('[data-testid="card-container"]')).map(card => {
+    const name = card.querySelector('[data-testid="listing-card-name"]');
+    const link = card.querySelector('a');
+    const priceSummary = Array.from(card.querySelectorAll('span'))
+        .find(span => /for/i.test(span.textContent) && /night/i.test(span.textContent));
+    const rating = card.querySelector('div.t1a9j9y7');
+    const complete = Boolean(name && priceSummary);
+    return {
+        name: name ? name.textContent.trim() : null,
+        href: link ? link.getAttribute('href') : null,
+        price_summary: priceSummary ? priceSummary.textContent : null,
+        rating: rating ? rating.textContent : null,
+        html: complete ? null : card.outerHTML,
+    };
+})
+"""
+
+# True once the search results have cards and every card shows its price. Airbnb
+# keeps long-polling and analytics requests open, so network idle comes late or never.
+LISTING_PRICES_READY_JS = """
+() => {
+    const cards = document.querySelectorAll('[data-testid="card-container"]');
+    return cards.length > 0 && Array.from(cards).every(card => Array.from(card.querySelectorAll('span'))
+        .some(span => /for/i.test(span.textContent) && /night/i.test(span.textContent)));
+}
+"""
+
+# Whichever appears first on a listing page: the date picker button or an already open calendar.
+LISTING_DATES_SELECTOR = '[data-testid="change-dates-checkIn"], div[data-testid^="calendar-day-"]'
+
+def _parse_listing_cards(raw_cards, checkin, checkout):
+    """Turns raw card fields into listings. Returns (listings, failures)."""
+    scraped_accommodations, failed_cards = [], []
+    for raw_card in raw_cards:
+        title = raw_card.get('name') or "Unknown Listing"
+        total_accommodation_cost = parse_price_text(raw_card.get('price_summary'))
+        if not raw_card.get('name') or total_accommodation_cost is None:
+            failed_cards.append({"name": title, "error": "Missing name or price.", "html": raw_card.get('html')})
+            continue
+
+        link_suffix = raw_card.get('href')
+        full_link = f"https://www.airbnb.com{link_suffix.split('?')[0]}" if link_suffix else "N/A"
+        scraped_accommodations.append({
+            "name": title, "total_accommodation_cost": total_accommodation_cost, "rating": _parse_rating(raw_card.get('rating')),
+            "link": full_link, "checkin": checkin, "checkout": checkout})
+    return scraped_accommodations, failed_cards
+
+def _select_cheapest_listings(raw_cards, checkin, checkout, config, log_func):
+    """Parses all cards, reports the ones that failed together, and returns the cheapest N."""
+    scraped_accommodations, failed_cards = _parse_listing_cards(raw_cards, checkin, checkout)
+    if failed_cards:
+        logger.error(f" - ⚠️ {len(failed_cards)} of {len(raw_cards)} listing cards could not be parsed: {', '.join(card['name'] for card in failed_cards)}")
+        log_func({"checkin": checkin, "checkout": checkout, "failed_cards": failed_cards}, "get_cheapest_accommodations")
+
+    num_listings = config['search_parameters'].get('airbnb_listings_per_search', 3)
+    cheapest = heapq.nsmallest(num_listings, scraped_accommodations, key=lambda x: x['total_accommodation_cost'])
+    logger.debug(f" - Extracted {len(scraped_accommodations)} listings, keeping the cheapest {len(cheapest)}.")
+    return cheapest
+
+# Reads every visible calendar day's test id and blocked/disabled flags in one
+# browser round trip.
+CALENDAR_DAYS_JS = """
+() => {
+    let containers = Array.from(document.querySelectorAll('div[data-visible="true"]'));
+    if (!containers.length) containers = [document];
+    const days = [];
+    for (const container of containers) {
+        for (const day of container.querySelectorAll('div[data-testid^="calendar-day-"]')) {
+            const parent = day.parentElement;
+            days.push([
+                day.getAttribute('data-testid'),
+                day.getAttribute('data-is-day-blocked') === 'true',
+                Boolean(parent) && parent.getAttribute('aria-disabled') === 'true',
+            ]);
+        }
+    }
+    return days;
+}
+"""
+
+def _calendar_horizon(search_months):
+    """Last day the calendar scan has to cover: search_months months from today."""
+    today = date.today()
+    month_index = today.month - 1 + search_months
+    year, month = today.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(today.day, calendar.monthrange(year, month)[1]))
+
+def _record_calendar_days(raw_days, availability_data):
+    """Adds the raw calendar days to availability_data. Returns the dates seen."""
+    current_page_dates = set()
+    for full_date_str, is_blocked, aria_disabled in raw_days:
+        try:
+            if not full_date_str: continue
+            date_obj, is_available = _parse_calendar_day(full_date_str, is_blocked, aria_disabled)
+        except ValueError:
+            continue
+        current_page_dates.add(date_obj)
+        availability_data[date_obj] = is_available
+    return current_page_dates
+
+# True once the first visible calendar day differs from the one shown before clicking next.
+CALENDAR_MOVED_JS = """
+(previous) => {
+    const day = document.querySelector('div[data-visible="true"] div[data-testid^="calendar-day-"]')
+        || document.querySelector('div[data-testid^="calendar-day-"]');
+    return Boolean(day) && day.getAttribute('data-testid') !== previous;
+}
+"""
+
+NEXT_MONTH_BUTTON_SELECTOR = 'button[aria-label="Move forward to switch to the next month."]'
+
+def get_cheapest_accommodations(page, destination_city, specific_location_query, checkin, checkout, config, log_func):
+    """
+    Scrapes Airbnb for cheapest listings. All cards are read in one in-page
+    call; cards that fail to parse are reported together and skipped.
+    """
+    search_url = _search_url(specific_location_query, checkin, checkout)
+
+    logger.debug(f" - Navigating to Airbnb: {specific_location_query}")
+    pacer = get_pacer(config)
 
     try:
-        page.goto(search_url, timeout=90000)
+        pacer.throttle(search_url)
+        increment("page_loads_total", site="airbnb.com")
+        with span("page_load", site="airbnb.com", url=search_url):
+            page.goto(search_url, timeout=90000)
 
         # Close translation pop-up
         translation_close_button = page.locator('button[aria-label="Close"]')
         try:
             translation_close_button.wait_for(state='visible', timeout=5000)
             translation_close_button.click()
-            time.sleep(random.uniform(1, 2))
+            pacer.jitter("popup")
         except Error:
             pass # No pop-up
 
         page.wait_for_selector('[data-testid="listing-card-title"]', timeout=60000)
-        time.sleep(random.uniform(2, 4))
+        pacer.wait_for_function(page, LISTING_PRICES_READY_JS, None, "search_results")
 
     except Exception as e:
-        print(f" - ❌ ERROR: Loading Airbnb search page failed. {e}")
+        logger.error(f" - ❌ ERROR: Loading Airbnb search page failed. {e}")
         return []
 
-    listing_cards = page.locator('[data-testid="card-container"]').all()
-    if not listing_cards:
-        print(" - ❌ No listings found.")
+    try:
+        raw_cards = page.evaluate(LISTING_CARDS_JS)
+    except Error as e:
+        logger.error(f" - ❌ ERROR: Reading listing cards failed. {e}")
         return []
 
-    print(f" - Found {len(listing_cards)} listings.")
-    scraped_accommodations = []
+    if not raw_cards:
+        logger.error(" - ❌ No listings found.")
+        return []
 
-    for i, card in enumerate(listing_cards):
-        title = "Unknown Listing"
-        try:
-            # Announce processing
-            title = card.locator('[data-testid="listing-card-name"]').inner_text(timeout=5000)
-            print(f"--> Processing: '{title}'")
+    logger.debug(f" - Found {len(raw_cards)} listings.")
+    return _select_cheapest_listings(raw_cards, checkin, checkout, config, log_func)
 
-            try:
-                link_suffix = card.locator('a').first.get_attribute('href')
-                full_link = f"https://www.airbnb.com{link_suffix.split('?')[0]}"
-            except Error:
-                full_link = "N/A"
-
-            total_accommodation_cost = 0
-            
-            # Get price from summary
-            price_summary_element = card.locator('span:has-text("for"):has-text("night")').first
-            price_summary_text = price_summary_element.inner_text(timeout=2000)
-            
-            price_match = re.search(r'(\d[\d,.]*)', price_summary_text)
-            if price_match:
-                total_accommodation_cost = int(float(price_match.group(1).replace(',', '')))
-            else:
-                raise ValueError("Could not extract price.")
-
-            # Get rating
-            rating_text = "N/A"
-            try:
-                rating_element_container = card.locator('div.t1a9j9y7').first
-                if rating_element_container.is_visible():
-                    rating_text_full = rating_element_container.inner_text(timeout=500)
-                    rating_match = re.search(r'([\d.]+)', rating_text_full)
-                    if rating_match:
-                        rating_text = rating_match.group(1)
-            except Error:
-                pass # No rating found
-
-            scraped_accommodations.append({
-                "name": title, "total_accommodation_cost": total_accommodation_cost, "rating": rating_text,
-                "link": full_link, "checkin": checkin, "checkout": checkout})
-
-        except Exception as e:
-            # Error handling
-            print("\n----------------- ❌ ERROR ❌ -----------------")
-            print(f"Failed on: '{title}'")
-            print(f"Error: {type(e).__name__}, {e}")
-            print("\n--- Failing Card HTML ---")
-            print(card.evaluate("node => node.outerHTML"))
-            print("-------------------------------------------------")
-            
-            # Pause for inspection
-            input("Browser is open for inspection. Press Enter to exit.")
-            
-            # Stop program
-            sys.exit(1)
-            
-        time.sleep(random.uniform(0.5, 1.5))
-
-    scraped_accommodations.sort(key=lambda x: x.get('total_accommodation_cost', float('inf')))
-    print(f" - Extracted and sorted {len(scraped_accommodations)} listings.")
-    return scraped_accommodations[:3]
-
-
-def get_listing_calendar_availability(page: Page, listing_url: str, search_months: int = 6):
-    """Scrapes Airbnb calendar availability."""
-    print(f" - Scraping calendar: {listing_url}")
+
+def get_listing_calendar_availability(page: Page, listing_url: str, search_months: int = 6, config: dict = None):
+    """
+    Scrapes Airbnb calendar availability until search_months months from
+    today are covered, reading each page of visible months in one call.
+    """
+    logger.debug(f" - Scraping calendar: {listing_url}")
     availability_data = {}
+    pacer = get_pacer(config)
     
     try:
-        page.goto(listing_url, timeout=90000)
-        
+        pacer.throttle(listing_url)
+        increment("page_loads_total", site="airbnb.com")
+        with span("page_load", site="airbnb.com", url=listing_url):
+            page.goto(listing_url, timeout=90000)
+
         # Close translation pop-up
         translation_close_button = page.locator('button[aria-label="Close"]')
         try:
             translation_close_button.wait_for(state='visible', timeout=5000)
             translation_close_button.click()
-            time.sleep(random.uniform(1, 2))
+            pacer.jitter("popup")
         except Error:
             pass
 
-        time.sleep(random.uniform(2, 4))
+        pacer.wait_for_selector(page, LISTING_DATES_SELECTOR, "listing_page")
 
         # Open calendar view
         try:
@@ -134,64 +223,147 @@ def get_listing_calendar_availability(page: Page, listing_url: str, search_month
                 page.locator('button:has-text("Check availability")').click(timeout=3000)
             except Error:
                 pass # Calendar likely visible
-        
-        time.sleep(random.uniform(1, 2))
 
-        # Scrape calendar data
+        pacer.wait_for_selector(page, 'div[data-testid^="calendar-day-"]', "calendar")
+
+        # Scrape calendar data, one evaluate per page of visible months
+        horizon = _calendar_horizon(search_months).strftime('%Y-%m-%d')
         all_scraped_dates = set()
         for _ in range(search_months + 1):
-            current_page_dates = set()
-            
-            visible_month_containers = page.locator('div[data-visible="true"]').all()
-            if not visible_month_containers:
-                visible_month_containers = [page]
-
-            day_elements = []
-            for container in visible_month_containers:
-                day_elements.extend(container.locator('div[data-testid^="calendar-day-"]').all())
-            
-            if not day_elements:
-                break
-
-            for day_div in day_elements:
-                try:
-                    full_date_str = day_div.get_attribute('data-testid')
-                    if not full_date_str: continue
-                    
-                    date_part = full_date_str.replace('calendar-day-', '')
-                    date_obj = datetime.strptime(date_part, '%m/%d/%Y').strftime('%Y-%m-%d')
-                    current_page_dates.add(date_obj)
-
-                    is_blocked = day_div.get_attribute('data-is-day-blocked') == 'true'
-                    parent_td = day_div.locator('xpath=..')
-                    aria_disabled = parent_td.get_attribute('aria-disabled') == 'true'
-                    is_available = not (is_blocked or aria_disabled)
-                    
-                    availability_data[date_obj] = is_available
-                except (ValueError, Error):
-                    continue
-            
-            if current_page_dates.issubset(all_scraped_dates):
+            raw_days = page.evaluate(CALENDAR_DAYS_JS)
+            current_page_dates = _record_calendar_days(raw_days, availability_data)
+            if not current_page_dates or current_page_dates.issubset(all_scraped_dates):
                 break # No new dates
-            
+
             all_scraped_dates.update(current_page_dates)
+            if max(all_scraped_dates) >= horizon:
+                break # Requested months covered
 
             # Click "Next month"
             try:
-                next_button_selector = 'button[aria-label="Move forward to switch to the next month."]'
-                next_button = page.locator(next_button_selector)
+                next_button = page.locator(NEXT_MONTH_BUTTON_SELECTOR)
 
                 if next_button.is_visible():
                     next_button.click()
-                    time.sleep(random.uniform(1, 2))
+                    pacer.wait_for_function(page, CALENDAR_MOVED_JS, raw_days[0][0], "calendar_month")
                 else:
                     break # No next button
             except Error:
                 break
 
     except Exception as e:
-        print(f" - ❌ ERROR scraping calendar. {type(e).__name__}, {e}")
+        if isinstance(e, PlaywrightTimeoutError):
+            increment("timeouts_total", operation="airbnb_calendar")
+        logger.error(f" - ❌ ERROR scraping calendar. {type(e).__name__}, {e}")
+        return {}
+
+    logger.debug(f" - Finished calendar scan for {listing_url}.")
+    return availability_data
+
+
+# --- Async counterparts, used when several browser contexts scrape at once ---
+
+async def get_cheapest_accommodations_async(page: AsyncPage, destination_city, specific_location_query, checkin, checkout, config, log_func):
+    """Async version of get_cheapest_accommodations."""
+    search_url = _search_url(specific_location_query, checkin, checkout)
+
+    logger.debug(f" - Navigating to Airbnb: {specific_location_query}")
+    pacer = get_pacer(config)
+
+    try:
+        await pacer.throttle_async(search_url)
+        increment("page_loads_total", site="airbnb.com")
+        with span("page_load", site="airbnb.com", url=search_url):
+            await page.goto(search_url, timeout=90000)
+
+        translation_close_button = page.locator('button[aria-label="Close"]')
+        try:
+            await translation_close_button.wait_for(state='visible', timeout=5000)
+            await translation_close_button.click()
+            await pacer.jitter_async("popup")
+        except AsyncError:
+            pass # No pop-up
+
+        await page.wait_for_selector('[data-testid="listing-card-title"]', timeout=60000)
+        await pacer.wait_for_function_async(page, LISTING_PRICES_READY_JS, None, "search_results")
+
+    except Exception as e:
+        logger.error(f" - ❌ ERROR: Loading Airbnb search page failed. {e}")
+        return []
+
+    try:
+        raw_cards = await page.evaluate(LISTING_CARDS_JS)
+    except AsyncError as e:
+        logger.error(f" - ❌ ERROR: Reading listing cards failed. {e}")
+        return []
+
+    if not raw_cards:
+        logger.error(" - ❌ No listings found.")
+        return []
+
+    logger.debug(f" - Found {len(raw_cards)} listings.")
+    return _select_cheapest_listings(raw_cards, checkin, checkout, config, log_func)
+
+
+async def get_listing_calendar_availability_async(page: AsyncPage, listing_url: str, search_months: int = 6, config: dict = None):
+    """Async version of get_listing_calendar_availability."""
+    logger.debug(f" - Scraping calendar: {listing_url}")
+    availability_data = {}
+    pacer = get_pacer(config)
+
+    try:
+        await pacer.throttle_async(listing_url)
+        increment("page_loads_total", site="airbnb.com")
+        with span("page_load", site="airbnb.com", url=listing_url):
+            await page.goto(listing_url, timeout=90000)
+
+        translation_close_button = page.locator('button[aria-label="Close"]')
+        try:
+            await translation_close_button.wait_for(state='visible', timeout=5000)
+            await translation_close_button.click()
+            await pacer.jitter_async("popup")
+        except AsyncError:
+            pass
+
+        await pacer.wait_for_selector_async(page, LISTING_DATES_SELECTOR, "listing_page")
+
+        try:
+            await page.locator('[data-testid="change-dates-checkIn"]').click(timeout=3000)
+        except AsyncError:
+            try:
+                await page.locator('button:has-text("Check availability")').click(timeout=3000)
+            except AsyncError:
+                pass # Calendar likely visible
+
+        await pacer.wait_for_selector_async(page, 'div[data-testid^="calendar-day-"]', "calendar")
+
+        horizon = _calendar_horizon(search_months).strftime('%Y-%m-%d')
+        all_scraped_dates = set()
+        for _ in range(search_months + 1):
+            raw_days = await page.evaluate(CALENDAR_DAYS_JS)
+            current_page_dates = _record_calendar_days(raw_days, availability_data)
+            if not current_page_dates or current_page_dates.issubset(all_scraped_dates):
+                break # No new dates
+
+            all_scraped_dates.update(current_page_dates)
+            if max(all_scraped_dates) >= horizon:
+                break # Requested months covered
+
+            try:
+                next_button = page.locator(NEXT_MONTH_BUTTON_SELECTOR)
+                if await next_button.is_visible():
+                    await next_button.click()
+                    await pacer.wait_for_function_async(page, CALENDAR_MOVED_JS, raw_days[0][0], "calendar_month")
+                else:
+                    break # No next button
+            except AsyncError:
+                break
+
+    except Exception as e:
+        if isinstance(e, PlaywrightTimeoutError):
+            increment("timeouts_total", operation="airbnb_calendar")
+        logger.error(f" - ❌ ERROR scraping calendar. {type(e).__name__}, {e}")
         return {}
 
-    print(f" - Finished calendar scan for {listing_url}.")
-    return availability_data
\ No newline at end of file
+    logger.debug(f" - Finished calendar scan for {listing_url}.")
+    return availability_data
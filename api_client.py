@@ -1,48 +1,138 @@
 # api_client.py
+import logging
 import requests
 import json
-import re
 
-def call_openrouter(api_key: str, prompt: str) -> dict:
+from json_stream import JSONObjectStream, first_json_object
+from llm_cache import make_cache_key, completion_record
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+FREE_MODEL = "deepseek/deepseek-r1:free" # Using the one free model for all calls
+SYSTEM_PROMPT = "You are a highly accurate data extraction assistant that responds ONLY in valid JSON format. Do not include any other text, explanations, or conversational filler in your response."
+
+def call_openrouter(api_key: str, prompt: str, cache=None) -> dict:
     """
     Calls the OpenRouter API with the single free model, extracts the JSON from
-    the response, and returns it as a Python dictionary.
+    the response, and returns it as a Python dictionary. With an
+    LLMResponseCache, a prompt seen before is answered without a network call.
     """
+    request_body = {
+        "model": FREE_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    }
+    cache_key = make_cache_key(request_body) if cache else None
+
     try:
-        response = requests.post(
-            url="https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            data=json.dumps({
-                "model": "deepseek/deepseek-r1:free", # Using the one free model for all calls
-                "messages": [
-                    {"role": "system", "content": "You are a highly accurate data extraction assistant that responds ONLY in valid JSON format. Do not include any other text, explanations, or conversational filler in your response."},
-                    {"role": "user", "content": prompt}
-                ]
-            })
-        )
-        response.raise_for_status()
-
-        response_text = response.json()['choices'][0]['message']['content']
+        completion = cache.get(cache_key) if cache else None
+        if completion is None:
+            response = requests.post(
+                url=OPENROUTER_URL,
+                headers={
+                    "Authorization": f"Bearer {api_key}",
+                    "Content-Type": "application/json",
+                },
+                data=json.dumps(request_body)
+            )
+            response.raise_for_status()
+            completion = response.json()
+            if cache and completion['choices'][0]['message']['content']:
+                cache.put(cache_key, request_body['model'], completion)
+
+        response_text = completion['choices'][0]['message']['content']
 
         # --- ROBUST JSON EXTRACTION ---
-        # Find the JSON block using a regular expression
-        # This looks for a string starting with { and ending with }
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+        # Take the first complete JSON object, ignoring any text around it
+        extracted = first_json_object(response_text)
 
-        if json_match:
-            json_string = json_match.group(0)
-            return json.loads(json_string)
+        if extracted is not None:
+            return extracted
         else:
-            print(f"  - ❌ ERROR: No JSON object found in the model's response.")
-            print(f"  - Raw Response Text: {response_text}")
+            logger.error(f"  - ❌ ERROR: No JSON object found in the model's response.")
+            logger.debug(f"  - Raw Response Text: {response_text}")
             return {}
 
     except requests.exceptions.RequestException as e:
-        print(f"  - ❌ ERROR: API request to OpenRouter failed. Error: {e}")
+        logger.error(f"  - ❌ ERROR: API request to OpenRouter failed. Error: {e}")
         return {}
     except (KeyError, IndexError, json.JSONDecodeError) as e:
-        print(f"  - ❌ ERROR: Failed to parse response from OpenRouter. Error: {e}")
-        return {}
\ No newline at end of file
+        logger.error(f"  - ❌ ERROR: Failed to parse response from OpenRouter. Error: {e}")
+        return {}
+
+
+def call_openrouter_batch(api_key: str, prompts: dict, cache=None):
+    """
+    Sends several extraction prompts in one streaming request. prompts maps a
+    key to its prompt; yields (key, result dict) as each keyed JSON object
+    finishes streaming, then (key, {}) for any the model left out.
+    """
+    search_ids = {key: f"P{i + 1}" for i, key in enumerate(prompts)}
+    keys_by_search_id = {search_id: key for key, search_id in search_ids.items()}
+    sections = "\n\n".join(f"=== PROMPT {search_ids[key]} ===\n{prompt}" for key, prompt in prompts.items())
+    request_body = {
+        "model": FREE_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": (
+                "Answer each prompt below, in the order given, with one JSON object on its own line "
+                'in the form {"prompt": "<id>", "result": <the JSON object the prompt asks for>}.\n\n' + sections)}
+        ]
+    }
+    cache_key = make_cache_key(request_body) if cache else None
+    parser = JSONObjectStream()
+    response_text = []
+    done = set()
+
+    def matched(objects):
+        for extracted in objects:
+            key = keys_by_search_id.get(str(extracted.get('prompt')))
+            if key is not None and key not in done and isinstance(extracted.get('result'), dict):
+                done.add(key)
+                yield key, extracted['result']
+
+    def feed(text):
+        response_text.append(text)
+        return matched(parser.feed(text))
+
+    try:
+        completion = cache.get(cache_key) if cache else None
+        if completion is not None:
+            yield from feed(completion['choices'][0]['message']['content'])
+            yield from matched(parser.finish())
+        else:
+            with requests.post(
+                url=OPENROUTER_URL,
+                headers={
+                    "Authorization": f"Bearer {api_key}",
+                    "Content-Type": "application/json",
+                },
+                data=json.dumps({**request_body, "stream": True}),
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    # Server-sent events: "data: {chunk}" lines, ": comment" keep-alives, "data: [DONE]" at the end
+                    if not line or not line.startswith("data: ") or line == "data: [DONE]":
+                        continue
+                    choices = json.loads(line[len("data: "):]).get('choices') or [{}]
+                    content = choices[0].get('delta', {}).get('content')
+                    if content:
+                        yield from feed(content)
+            # Objects a stray brace in the response held back until it ended
+            yield from matched(parser.finish())
+            # A batch with any prompt unanswered is not cached, or the gaps would be served from cache.
+            if cache and len(done) == len(prompts):
+                cache.put(cache_key, FREE_MODEL, completion_record(FREE_MODEL, "".join(response_text)))
+
+    except requests.exceptions.RequestException as e:
+        logger.error(f"  - ❌ ERROR: Batch API request to OpenRouter failed. Error: {e}")
+    except (KeyError, IndexError, json.JSONDecodeError) as e:
+        logger.error(f"  - ❌ ERROR: Failed to parse streamed response from OpenRouter. Error: {e}")
+
+    for key in prompts:
+        if key not in done:
+            yield key, {}
@@ -1,9 +1,20 @@
 # api_handler.py
 
-from openai import OpenAI, RateLimitError
+import logging
+from openai import OpenAI, AsyncOpenAI, RateLimitError, APIConnectionError, InternalServerError
+from openai.types.chat import ChatCompletion
+from email.utils import parsedate_to_datetime
+import asyncio
+import re
 import sys
+import threading
 import time
 
+from llm_cache import initialize_llm_cache, make_cache_key
+from metrics import span, increment
+
+logger = logging.getLogger(__name__)
+
 # --- Corrected Wrapper Classes ---
 
 # This class represents the '.completions' level
@@ -23,104 +34,407 @@ class _CompletionsWrapper:
         """
         return self._owner._execute_completion_with_rotation(**kwargs)
 
+# Async counterpart of _CompletionsWrapper: await client.chat.completions.create()
+class _AsyncCompletionsWrapper:
+    def __init__(self, owner):
+        self._owner = owner
+
+    async def create(self, **kwargs):
+        return await self._owner._execute_completion_with_rotation(**kwargs)
+
 # This class represents the '.chat' level
 class _ChatWrapper:
-    def __init__(self, owner):
+    def __init__(self, owner, completions_wrapper=_CompletionsWrapper):
         """
         Initializes the wrapper for the 'chat' object. It holds the
         'completions' object.
         Args:
             owner: The instance of the main RotatingClient.
         """
-        self.completions = _CompletionsWrapper(owner)
+        self.completions = completions_wrapper(owner)
+
+
+# --- Key scheduling ---
+
+def _seconds_until(value, now):
+    """
+    Reads a rate-limit reset header as seconds from now. Accepts plain seconds
+    ("30"), epoch seconds or milliseconds (OpenRouter's x-ratelimit-reset),
+    durations like "1m30s" and HTTP dates (Retry-After).
+    """
+    value = str(value).strip()
+    try:
+        number = float(value)
+        if number > 1e12:
+            return number / 1000 - now
+        if number > 1e9:
+            return number - now
+        return number
+    except ValueError:
+        pass
+
+    duration = re.fullmatch(r"(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m(?!s))?(?:(\d+(?:\.\d+)?)s)?(?:(\d+)ms)?", value)
+    if duration and any(duration.groups()):
+        hours, minutes, seconds, millis = (float(g) if g else 0.0 for g in duration.groups())
+        return hours * 3600 + minutes * 60 + seconds + millis / 1000
+
+    try:
+        return parsedate_to_datetime(value).timestamp() - now
+    except (TypeError, ValueError):
+        return None
+
+def _cooldown_from_headers(headers, default_seconds):
+    """How long a key should rest according to Retry-After and rate-limit headers."""
+    if headers is None:
+        return default_seconds
+    now = time.time()
+    for name in ('retry-after', 'x-ratelimit-reset', 'x-ratelimit-reset-requests', 'x-ratelimit-reset-tokens'):
+        value = headers.get(name)
+        if value is None:
+            continue
+        seconds = _seconds_until(value, now)
+        if seconds is not None:
+            return max(1.0, seconds)
+    return default_seconds
+
+
+class _KeySlot:
+    """One API key with its persistent clients and scheduling state."""
+    def __init__(self, number, key):
+        self.number = number
+        self.key = key
+        self.client = None
+        self.async_client = None
+        self.in_flight = 0
+        self.last_used = 0.0
+        self.cooldown_until = 0.0
+
+
+class _KeyScheduler:
+    """
+    Hands out the healthy key with the fewest requests in flight, so
+    concurrent calls spread over every key instead of queueing on one.
+    A rate-limited key rests until its Retry-After/reset time; a key that
+    is about to run out of requests rests pre-emptively.
+    """
+    def __init__(self, keys, default_cooldown_seconds):
+        self.slots = [_KeySlot(i + 1, key) for i, key in enumerate(keys)]
+        self.default_cooldown_seconds = default_cooldown_seconds
+        self._lock = threading.Lock()
+
+    def acquire(self, tried):
+        """
+        Returns (slot, 0) for the best untried key that is not cooling down,
+        or (None, seconds) until the first untried key becomes healthy again.
+        (None, None) means every key has been tried.
+        """
+        with self._lock:
+            now = time.monotonic()
+            untried = [slot for slot in self.slots if slot.number not in tried]
+            if not untried:
+                return None, None
+            ready = [slot for slot in untried if slot.cooldown_until <= now]
+            if not ready:
+                return None, min(slot.cooldown_until for slot in untried) - now
+            slot = min(ready, key=lambda s: (s.in_flight, s.last_used))
+            slot.in_flight += 1
+            slot.last_used = now
+            return slot, 0
+
+    def release(self, slot):
+        with self._lock:
+            slot.in_flight -= 1
+
+    def cool_down(self, slot, headers):
+        seconds = _cooldown_from_headers(headers, self.default_cooldown_seconds)
+        with self._lock:
+            slot.cooldown_until = max(slot.cooldown_until, time.monotonic() + seconds)
+        logger.error(f"      - ❌ Key #{slot.number} is rate-limited. Resting it for {seconds:.0f}s.")
+
+    def note_headers(self, slot, headers):
+        """Rests a key early when a successful response says its quota is used up."""
+        remaining = headers.get('x-ratelimit-remaining', headers.get('x-ratelimit-remaining-requests'))
+        try:
+            exhausted = remaining is not None and int(float(remaining)) <= 0
+        except ValueError:
+            exhausted = False
+        if exhausted:
+            self.cool_down(slot, headers)
+
+
+def _count_tokens(model, response):
+    """Adds a completion's (or a stream chunk's) token usage to the run metrics."""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    increment("llm_tokens_total", usage.prompt_tokens or 0, model=model, kind="prompt")
+    increment("llm_tokens_total", usage.completion_tokens or 0, model=model, kind="completion")
+
+def _request_stream_usage(kwargs):
+    """Asks for a final usage chunk on streamed requests, which otherwise report no token counts."""
+    if kwargs.get('stream'):
+        kwargs['stream_options'] = {"include_usage": True, **(kwargs.get('stream_options') or {})}
+
+def _counting_stream(model, stream):
+    """Passes a completion stream through, counting the usage its final chunk carries."""
+    for chunk in stream:
+        _count_tokens(model, chunk)
+        yield chunk
+
+async def _counting_stream_async(model, stream):
+    """Async version of _counting_stream."""
+    async for chunk in stream:
+        _count_tokens(model, chunk)
+        yield chunk
+
+def _load_provider_settings(config):
+    """Returns (base_url, keys) for the configured provider, exiting if they are unusable."""
+    provider = config['api_settings'].get('provider')
+    api_key_name = f'{provider}_key'
+
+    if provider == 'openrouter':
+        base_url = "https://openrouter.ai/api/v1"
+        logger.info("--- Initializing RotatingClient for OpenRouter ---")
+    elif provider == 'deepseek':
+        base_url = "https://api.deepseek.com/v1"
+        logger.info("--- Initializing RotatingClient for DeepSeek ---")
+    else:
+        logger.critical(f"FATAL ERROR: Unknown API provider '{provider}' in config.json. Please use 'openrouter' or 'deepseek'.")
+        sys.exit(1)
+
+    key_string = config['api_settings']['keys'].get(api_key_name)
+
+    if not key_string or "YOUR_API_KEY_HERE" in key_string:
+        logger.critical(f"FATAL ERROR: API key(s) for '{provider}' are missing or not set in config.json under '{api_key_name}'.")
+        logger.critical("Please provide keys as a comma-separated string: \"key1,key2,key3\"")
+        sys.exit(1)
+
+    return base_url, [key.strip() for key in key_string.split(',') if key.strip()]
 
 
 class RotatingClient:
     """
-    A wrapper for the OpenAI client that handles multiple API keys and rotates
-    them automatically when a rate limit error is encountered.
+    A wrapper for the OpenAI client that handles multiple API keys. Each key
+    keeps one persistent client (and so one connection pool), concurrent
+    calls are spread across healthy keys, and rate-limited keys rest until
+    their reset time instead of being retried on the next rotation.
     This version correctly mimics the 'client.chat.completions.create()' structure.
     """
-    def __init__(self, config):
+    def __init__(self, config, completions_wrapper=_CompletionsWrapper):
         """
         Initializes the rotating client from the configuration.
         """
-        provider = config['api_settings'].get('provider')
-        api_key_name = f'{provider}_key'
-        
-        if provider == 'openrouter':
-            self.base_url = "https://openrouter.ai/api/v1"
-            print("--- Initializing RotatingClient for OpenRouter ---")
-        elif provider == 'deepseek':
-            self.base_url = "https://api.deepseek.com/v1"
-            print("--- Initializing RotatingClient for DeepSeek ---")
-        else:
-            print(f"FATAL ERROR: Unknown API provider '{provider}' in config.json. Please use 'openrouter' or 'deepseek'.")
-            sys.exit(1)
-
-        key_string = config['api_settings']['keys'].get(api_key_name)
-        
-        if not key_string or "YOUR_API_KEY_HERE" in key_string:
-            print(f"FATAL ERROR: API key(s) for '{provider}' are missing or not set in config.json under '{api_key_name}'.")
-            print("Please provide keys as a comma-separated string: \"key1,key2,key3\"")
-            sys.exit(1)
-
-        self.keys = [key.strip() for key in key_string.split(',')]
-        self.current_key_index = 0
-        
+        api_settings = config['api_settings']
+        self.base_url, self.keys = _load_provider_settings(config)
+        self.max_key_wait_seconds = api_settings.get('max_key_wait_seconds', 30)
+        self.transient_retries = api_settings.get('transient_retries', 2)
+        self._scheduler = _KeyScheduler(self.keys, api_settings.get('key_cooldown_seconds', 60))
+        self.response_cache = initialize_llm_cache(config)
+
         # This now correctly creates the client.chat.completions structure
-        self.chat = _ChatWrapper(self)
-        
-        print(f"--- Loaded {len(self.keys)} API key(s). ---")
+        self.chat = _ChatWrapper(self, completions_wrapper)
+
+        logger.info(f"--- Loaded {len(self.keys)} API key(s). ---")
+
+    def _client_for(self, slot):
+        """
+        The key's persistent OpenAI client. The SDK's own retries are off so a
+        429 moves on to another key instead of retrying the same one; timeouts,
+        connection errors and 5xx responses are retried by the rotation loop.
+        """
+        if slot.client is None:
+            slot.client = OpenAI(base_url=self.base_url, api_key=slot.key, max_retries=0)
+        return slot.client
+
+    def _cached_completion(self, kwargs):
+        """
+        Returns (cache key, cached ChatCompletion or None). The key is None when
+        caching is off; streamed requests are cached by their callers, which see the whole text.
+        """
+        if self.response_cache is None or kwargs.get('stream'):
+            return None, None
+        cache_key = make_cache_key(kwargs)
+        cached = self.response_cache.get(cache_key)
+        if cached is None:
+            return cache_key, None
+        logger.debug("    - Using cached API response.")
+        return cache_key, ChatCompletion.model_validate(cached)
+
+    def _remember_completion(self, cache_key, kwargs, response):
+        """Caches a response that actually has content."""
+        if cache_key and response.choices and response.choices[0].message.content:
+            self.response_cache.put(cache_key, kwargs.get('model'), response.model_dump(mode="json"))
 
-    def _get_current_client(self):
+    def _transient_retry_delay(self, slot, error, attempt):
         """
-        Initializes an OpenAI client with the current key.
+        Seconds to back off before retrying after a timeout, connection error
+        or 5xx, or None once transient_retries retries have been used.
         """
-        key = self.keys[self.current_key_index]
-        return OpenAI(base_url=self.base_url, api_key=key)
+        if attempt >= self.transient_retries:
+            return None
+        delay = 0.5 * (2 ** attempt)
+        logger.warning(f"      - ⚠️ Transient API error with key #{slot.number} ({type(error).__name__}). Retrying in {delay:.1f}s.")
+        increment("llm_transient_errors_total", key=slot.number)
+        return delay
 
-    def _rotate_key(self):
+    def _next_slot(self, tried, last_error):
         """
-        Moves to the next key in the list.
+        Picks the next key to try, or raises once every key has been tried.
+        Returns (slot, seconds to wait first); slot is None while waiting.
         """
-        self.current_key_index = (self.current_key_index + 1) % len(self.keys)
-        print(f"      - Rotated to key #{self.current_key_index + 1}")
+        slot, wait_seconds = self._scheduler.acquire(tried)
+        if slot is not None:
+            return slot, 0
+        if wait_seconds is not None and wait_seconds <= self.max_key_wait_seconds:
+            logger.info(f"      - All keys are resting. Waiting {wait_seconds:.0f}s for the next one.")
+            return None, max(wait_seconds, 0.1)
+        logger.error("      - ❌ All available API keys are rate-limited or failed. Stopping attempt.")
+        raise last_error or Exception("Failed to get a response from the API: all keys are rate-limited.")
 
     def _execute_completion_with_rotation(self, **kwargs):
         """
         Executes the API call, attempting with each key until one succeeds
-        or all have been rate-limited.
+        or all have been rate-limited. Identical requests are answered from
+        the response cache without touching the network.
         """
-        start_index = self.current_key_index
-        
-        for i in range(len(self.keys)):
-            client = self._get_current_client()
+        cache_key, cached_response = self._cached_completion(kwargs)
+        if cached_response is not None:
+            return cached_response
+
+        _request_stream_usage(kwargs)
+        tried = set()
+        last_error = None
+        transient_attempts = 0
+
+        while True:
+            slot, wait_seconds = self._next_slot(tried, last_error)
+            if slot is None:
+                time.sleep(wait_seconds)
+                continue
+            retry_delay = None
             try:
-                print(f"    - Attempting API call with key #{self.current_key_index + 1}...")
-                response = client.chat.completions.create(**kwargs)
+                logger.debug(f"    - Attempting API call with key #{slot.number}...")
+                increment("llm_requests_total", model=kwargs.get('model'))
+                with span("llm_call", model=kwargs.get('model'), key=slot.number, stream=bool(kwargs.get('stream'))):
+                    raw_response = self._client_for(slot).chat.completions.with_raw_response.create(**kwargs)
+                self._scheduler.note_headers(slot, raw_response.headers)
+                response = raw_response.parse()
+                if kwargs.get('stream'):
+                    response = _counting_stream(kwargs.get('model'), response)
+                else:
+                    _count_tokens(kwargs.get('model'), response)
+                self._remember_completion(cache_key, kwargs, response)
                 return response
-            
+
             except RateLimitError as e:
-                print(f"      - ❌ Key #{self.current_key_index + 1} is rate-limited.")
-                self._rotate_key()
-                if self.current_key_index == start_index:
-                    print("      - ❌ All available API keys are currently rate-limited. Stopping attempt.")
-                    raise e
-            
+                increment("llm_rate_limited_total", key=slot.number)
+                self._scheduler.cool_down(slot, e.response.headers)
+                tried.add(slot.number)
+                last_error = e
+
+            except (APIConnectionError, InternalServerError) as e:
+                last_error = e
+                retry_delay = self._transient_retry_delay(slot, e, transient_attempts)
+                if retry_delay is None:
+                    logger.error(f"      - ❌ API error with key #{slot.number} persisted after {transient_attempts} retries: {e}")
+                    increment("llm_errors_total", key=slot.number)
+                    tried.add(slot.number)
+                    transient_attempts = 0
+                else:
+                    transient_attempts += 1
+
             except Exception as e:
-                print(f"      - ❌ An unexpected API error occurred with key #{self.current_key_index + 1}: {e}")
-                self._rotate_key()
-                if self.current_key_index == start_index:
-                   print("      - ❌ All available API keys failed with errors. Stopping attempt.")
-                   raise e
+                logger.error(f"      - ❌ An unexpected API error occurred with key #{slot.number}: {e}")
+                increment("llm_errors_total", key=slot.number)
+                tried.add(slot.number)
+                last_error = e
+
+            finally:
+                self._scheduler.release(slot)
+
+            if retry_delay:
+                time.sleep(retry_delay)
+
+
+class AsyncRotatingClient(RotatingClient):
+    """
+    RotatingClient for async code: await client.chat.completions.create().
+    Uses one AsyncOpenAI client per key, so concurrent destinations can use
+    the combined quota of all keys without blocking the event loop.
+    """
+    def __init__(self, config):
+        super().__init__(config, completions_wrapper=_AsyncCompletionsWrapper)
+
+    def _client_for(self, slot):
+        if slot.async_client is None:
+            slot.async_client = AsyncOpenAI(base_url=self.base_url, api_key=slot.key, max_retries=0)
+        return slot.async_client
+
+    async def _execute_completion_with_rotation(self, **kwargs):
+        """Async version of RotatingClient._execute_completion_with_rotation."""
+        cache_key, cached_response = self._cached_completion(kwargs)
+        if cached_response is not None:
+            return cached_response
+
+        _request_stream_usage(kwargs)
+        tried = set()
+        last_error = None
+        transient_attempts = 0
+
+        while True:
+            slot, wait_seconds = self._next_slot(tried, last_error)
+            if slot is None:
+                await asyncio.sleep(wait_seconds)
+                continue
+            retry_delay = None
+            try:
+                logger.debug(f"    - Attempting API call with key #{slot.number}...")
+                increment("llm_requests_total", model=kwargs.get('model'))
+                with span("llm_call", model=kwargs.get('model'), key=slot.number, stream=bool(kwargs.get('stream'))):
+                    raw_response = await self._client_for(slot).chat.completions.with_raw_response.create(**kwargs)
+                self._scheduler.note_headers(slot, raw_response.headers)
+                response = raw_response.parse()
+                if kwargs.get('stream'):
+                    response = _counting_stream_async(kwargs.get('model'), response)
+                else:
+                    _count_tokens(kwargs.get('model'), response)
+                self._remember_completion(cache_key, kwargs, response)
+                return response
+
+            except RateLimitError as e:
+                increment("llm_rate_limited_total", key=slot.number)
+                self._scheduler.cool_down(slot, e.response.headers)
+                tried.add(slot.number)
+                last_error = e
+
+            except (APIConnectionError, InternalServerError) as e:
+                last_error = e
+                retry_delay = self._transient_retry_delay(slot, e, transient_attempts)
+                if retry_delay is None:
+                    logger.error(f"      - ❌ API error with key #{slot.number} persisted after {transient_attempts} retries: {e}")
+                    increment("llm_errors_total", key=slot.number)
+                    tried.add(slot.number)
+                    transient_attempts = 0
+                else:
+                    transient_attempts += 1
+
+            except Exception as e:
+                logger.error(f"      - ❌ An unexpected API error occurred with key #{slot.number}: {e}")
+                increment("llm_errors_total", key=slot.number)
+                tried.add(slot.number)
+                last_error = e
+
+            finally:
+                self._scheduler.release(slot)
 
-        raise Exception("Failed to get a response from the API after trying all available keys.")
+            if retry_delay:
+                await asyncio.sleep(retry_delay)
 
 
-def initialize_client(config):
+def initialize_client(config, use_async=False):
     """
     This function acts as a factory, returning an instance of our new
-    RotatingClient, which will be used throughout the application.
+    RotatingClient (or AsyncRotatingClient for async code), which will be
+    used throughout the application.
     """
-    return RotatingClient(config)
\ No newline at end of file
+    return AsyncRotatingClient(config) if use_async else RotatingClient(config)
@@ -0,0 +1,45 @@
+# availability_index.py
+
+from datetime import date
+import numpy as np
+
+class AvailabilityIndex:
+    """
+    Cumulative blocked-night counts for one listing's calendar, indexed by
+    ordinal day. Answers "is every night of [checkin, checkout) free?" in O(1).
+    Days the calendar does not cover count as blocked.
+    """
+    def __init__(self, calendar):
+        available_ordinals = [date.fromisoformat(day).toordinal() for day, is_available in calendar.items() if is_available]
+        all_ordinals = [date.fromisoformat(day).toordinal() for day in calendar]
+        if not all_ordinals:
+            self.first_ordinal, self.end_ordinal = 0, 0
+            self._blocked_before = np.zeros(1, dtype=np.int64)
+            return
+
+        self.first_ordinal = min(all_ordinals)
+        self.end_ordinal = max(all_ordinals) + 1
+        blocked = np.ones(self.end_ordinal - self.first_ordinal, dtype=np.int64)
+        blocked[np.array(available_ordinals, dtype=np.int64) - self.first_ordinal] = 0
+        self._blocked_before = np.concatenate(([0], np.cumsum(blocked)))
+
+    def is_available(self, checkin_ordinal, checkout_ordinal):
+        """True if every night from checkin up to (not including) checkout is free."""
+        if checkin_ordinal < self.first_ordinal or checkout_ordinal > self.end_ordinal or checkin_ordinal > checkout_ordinal:
+            return False
+        blocked_nights = self._blocked_before[checkout_ordinal - self.first_ordinal] - self._blocked_before[checkin_ordinal - self.first_ordinal]
+        return blocked_nights == 0
+
+    def available_mask(self, checkin_ordinals, checkout_ordinals):
+        """Batch is_available over arrays of stays; returns a boolean array."""
+        in_range = (checkin_ordinals >= self.first_ordinal) & (checkout_ordinals <= self.end_ordinal) & (checkin_ordinals <= checkout_ordinals)
+        max_offset = len(self._blocked_before) - 1
+        checkin_offsets = np.clip(checkin_ordinals - self.first_ordinal, 0, max_offset)
+        checkout_offsets = np.clip(checkout_ordinals - self.first_ordinal, 0, max_offset)
+        blocked_nights = self._blocked_before[checkout_offsets] - self._blocked_before[checkin_offsets]
+        return in_range & (blocked_nights == 0)
+
+
+def build_availability_indexes(airbnb_calendar_cache):
+    """One AvailabilityIndex per listing link."""
+    return {link: AvailabilityIndex(calendar) for link, calendar in airbnb_calendar_cache.items()}
@@ -0,0 +1,65 @@
+# benchmarks/bench_phases.py
+"""
+Microbenchmark of the pure-Python/NumPy trip engine: Phase 2 (pairing
+outbound and return prices) and Phase 5 (matching listings and scoring),
+on synthetic price lists and calendars. Needs no browser or network.
+
+    python benchmarks/bench_phases.py [--days 60] [--iterations 200] [--save FILE] [--baseline FILE]
+"""
+
+import random
+from datetime import date, timedelta
+
+from harness import argument_parser, measure, finish
+from trip_engine import build_trip_candidates, match_accommodation_costs, score_trip_candidates
+
+SAMPLE_DURATIONS = [1, 2, 3, 5, 7, 10, 14]
+
+def synthetic_prices(start_date, days, rng):
+    return [{"full_date": (start_date + timedelta(days=i)).strftime("%Y-%m-%d"), "price": rng.randint(150, 1800)}
+            for i in range(days)]
+
+def synthetic_listings(start_date, days, max_num_nights, rng, listings_per_duration=3):
+    """Listings per sampled duration plus a calendar for each, roughly 30% of nights booked."""
+    listings_by_duration, calendars = {}, {}
+    for duration in (d for d in SAMPLE_DURATIONS if d <= max_num_nights):
+        listings = []
+        for n in range(listings_per_duration):
+            link = f"https://www.airbnb.com/rooms/{duration * 100 + n}"
+            listings.append({"name": f"Listing {duration}-{n}", "total_accommodation_cost": rng.randint(80, 220) * duration,
+                             "rating": "4.8", "link": link})
+            calendars[link] = {(start_date + timedelta(days=i)).strftime("%Y-%m-%d"): rng.random() > 0.3
+                               for i in range(days + max_num_nights + 1)}
+        listings_by_duration[duration] = listings
+    return listings_by_duration, calendars
+
+def main():
+    parser = argument_parser("Benchmarks trip engine Phases 2 and 5 on synthetic data.", default_iterations=200)
+    parser.add_argument("--days", type=int, default=60, help="Days of prices in each direction")
+    parser.add_argument("--max-nights", type=int, default=14, help="Longest stay considered")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the synthetic data")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start_date = date.today() + timedelta(days=1)
+    config = {"search_parameters": {"min_exploration_hours": 10, "day_starts_at_hour": 8, "day_ends_at_hour": 22, "airport_buffer_hours": 2}}
+    outbound_prices = synthetic_prices(start_date, args.days, rng)
+    return_prices = synthetic_prices(start_date, args.days, rng)
+    listings_by_duration, calendars = synthetic_listings(start_date, args.days, args.max_nights, rng)
+    candidates = build_trip_candidates(outbound_prices, return_prices, args.max_nights, config, top_k=500)
+    accommodation_costs, matched_listings = match_accommodation_costs(candidates, listings_by_duration, calendars)
+
+    results = [
+        measure(f"phase2_combinations[{args.days}d]",
+                lambda: build_trip_candidates(outbound_prices, return_prices, args.max_nights, config, top_k=500), args.iterations),
+        measure(f"phase2_combinations_all[{args.days}d]",
+                lambda: build_trip_candidates(outbound_prices, return_prices, args.max_nights, config), args.iterations),
+        measure(f"phase5_match_listings[{len(candidates)}]",
+                lambda: match_accommodation_costs(candidates, listings_by_duration, calendars), args.iterations),
+        measure(f"phase5_score[{len(candidates)}]",
+                lambda: score_trip_candidates(candidates, accommodation_costs, matched_listings, top_k=5), args.iterations),
+    ]
+    finish(results, args)
+
+if __name__ == "__main__":
+    main()
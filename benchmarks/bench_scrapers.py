@@ -0,0 +1,116 @@
+# benchmarks/bench_scrapers.py
+"""
+Replays recorded Kiwi and Airbnb pages to the scrapers without touching the
+network, and reports throughput, latency percentiles and peak memory for
+extract_prices_from_calendar, get_cheapest_accommodations and
+get_listing_calendar_availability.
+
+Pages are served with Playwright route fulfillment: by default from the HTML
+snapshots in benchmarks/fixtures, or from a HAR file recorded with
+--record-har against the live sites. Every other request is aborted.
+
+    python benchmarks/bench_scrapers.py [--iterations 20] [--har FILE] [--save FILE] [--baseline FILE]
+"""
+
+import logging
+import os
+from datetime import date, timedelta
+from urllib.parse import urlparse
+
+from playwright.sync_api import sync_playwright
+
+from harness import argument_parser, measure, finish
+from flight_scraper import extract_prices_from_calendar, get_daily_prices_from_graph
+from airbnb_scraper import get_cheapest_accommodations, get_listing_calendar_availability
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# (host suffix, path prefix) -> snapshot served for it
+FIXTURE_ROUTES = [
+    ("kiwi.com", "/en/search/results/", "kiwi_search.html"),
+    ("airbnb.com", "/s/homes", "airbnb_search.html"),
+    ("airbnb.com", "/rooms/", "airbnb_listing.html"),
+]
+
+# No pacing delays, and the rendered Kiwi calendar rather than its API payload.
+BENCHMARK_CONFIG = {
+    "search_parameters": {"days_to_search": 20, "airbnb_listings_per_search": 3},
+    "browser_settings": {"capture_kiwi_responses": False},
+    "pacing": {
+        "jitter_seconds": [0, 0], "retry_backoff_seconds": 0, "ready_timeout_seconds": 5,
+        "hosts": {}, "default": {"requests_per_minute": 1000000, "burst": 1000000}
+    },
+}
+
+def _fixture_for(url):
+    parsed = urlparse(url)
+    host = parsed.hostname or ""
+    for host_suffix, path_prefix, fixture in FIXTURE_ROUTES:
+        if (host == host_suffix or host.endswith("." + host_suffix)) and parsed.path.startswith(path_prefix):
+            return os.path.join(FIXTURES_DIR, fixture)
+    return None
+
+def _serve_fixture(route):
+    fixture = _fixture_for(route.request.url)
+    if fixture and route.request.resource_type == "document":
+        route.fulfill(path=fixture, content_type="text/html; charset=utf-8")
+    else:
+        route.abort()
+
+def _ignore_log(response_data, function_name):
+    pass
+
+def main():
+    parser = argument_parser("Benchmarks the scrapers against recorded Kiwi and Airbnb pages.", default_iterations=20)
+    parser.add_argument("--har", metavar="FILE", help="Replay this HAR file instead of the HTML fixtures")
+    parser.add_argument("--record-har", metavar="FILE", help="Record the live pages the benchmark visits into this HAR file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    start_date = date.today() + timedelta(days=1)
+    checkin, checkout = start_date.strftime("%Y-%m-%d"), (start_date + timedelta(days=3)).strftime("%Y-%m-%d")
+    kiwi_url = f"https://www.kiwi.com/en/search/results/warsaw-poland/paris-france/{checkin}/no-return"
+    listing_url = "https://www.airbnb.com/rooms/41007919"
+    config = BENCHMARK_CONFIG
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        context = browser.new_context()
+        if args.record_har:
+            context.route_from_har(args.record_har, update=True)
+        elif args.har:
+            context.route_from_har(args.har, not_found="abort")
+        else:
+            context.route("**/*", _serve_fixture)
+        page = context.new_page()
+
+        # extract_prices_from_calendar reads whatever calendar is open, so open it once.
+        page.goto(kiwi_url)
+        page.locator('[data-test="SearchFieldDateInput"]').click()
+        page.locator('[data-test="CalendarDay"]').first.wait_for(state="visible")
+
+        benchmarks = [
+            ("extract_prices_from_calendar", lambda: extract_prices_from_calendar(page), args.iterations * 10),
+            ("get_daily_prices_from_graph",
+             lambda: get_daily_prices_from_graph(page, "warsaw-poland", "paris-france", start_date, config, _ignore_log),
+             args.iterations),
+            ("get_cheapest_accommodations",
+             lambda: get_cheapest_accommodations(page, "Paris", "Paris, France", checkin, checkout, config, _ignore_log),
+             args.iterations),
+            ("get_listing_calendar_availability",
+             lambda: get_listing_calendar_availability(page, listing_url, 6, config), args.iterations),
+        ]
+        results = []
+        for name, func, iterations in benchmarks:
+            # The scrapers return nothing rather than raising, so check they still read the pages
+            # before timing them; a broken selector would otherwise look like a speedup.
+            if not func():
+                raise SystemExit(f"{name} returned no data from the replayed pages.")
+            results.append(measure(name, func, iterations, warmup=0))
+        context.close()
+        browser.close()
+
+    finish(results, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# benchmarks/harness.py
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+# The benchmarks import the scraper and engine modules from the project root.
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+def measure(name, func, iterations, warmup=1):
+    """
+    Calls func warmup + iterations times and returns its stats: throughput,
+    per-call latency percentiles (ms) and the peak Python memory allocated
+    by one call. At least two calls are timed. Memory is traced in a
+    separate call, since tracemalloc would slow the timed ones.
+    """
+    iterations = max(2, iterations)
+    for _ in range(warmup):
+        func()
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - call_started) * 1000)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    func()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "name": name,
+        "iterations": iterations,
+        "calls_per_second": round(iterations / elapsed, 2) if elapsed > 0 else None,
+        "p50_ms": round(percentiles[49], 3),
+        "p90_ms": round(percentiles[89], 3),
+        "p99_ms": round(percentiles[98], 3),
+        "max_ms": round(max(latencies), 3),
+        "peak_memory_kb": round(peak_bytes / 1024, 1),
+    }
+
+def print_report(results):
+    print(f"{'benchmark':<40} {'calls/s':>9} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'peak KB':>10}")
+    for result in results:
+        print(f"{result['name']:<40} {result['calls_per_second'] or 0:>9.2f} {result['p50_ms']:>10.3f} "
+              f"{result['p90_ms']:>10.3f} {result['p99_ms']:>10.3f} {result['peak_memory_kb']:>10.1f}")
+
+def find_regressions(results, baseline_path, tolerance):
+    """
+    Compares p50 latencies with a saved baseline. Returns a message for every
+    benchmark that got slower than baseline * (1 + tolerance).
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {result['name']: result for result in json.load(f)}
+    regressions = []
+    for result in results:
+        previous = baseline.get(result['name'])
+        if previous and result['p50_ms'] > previous['p50_ms'] * (1 + tolerance):
+            regressions.append(f"{result['name']}: p50 {result['p50_ms']:.3f} ms vs baseline {previous['p50_ms']:.3f} ms")
+    return regressions
+
+def argument_parser(description, default_iterations):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--iterations", type=int, default=default_iterations, help="Timed calls per benchmark")
+    parser.add_argument("--save", metavar="FILE", help="Write the results as JSON, e.g. to use as a baseline")
+    parser.add_argument("--baseline", metavar="FILE", help="Fail if any p50 latency regressed against this saved run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p50 slowdown against the baseline (0.25 = 25%%)")
+    return parser
+
+def finish(results, args):
+    """Prints the report, saves it if asked and exits non-zero on a baseline regression."""
+    print_report(results)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        regressions = find_regressions(results, args.baseline, args.tolerance)
+        if regressions:
+            print("\nPerformance regressions:")
+            for regression in regressions:
+                print(f" - {regression}")
+            sys.exit(1)
@@ -0,0 +1,86 @@
+# browser_daemon.py
+"""
+Keeps one Chromium with a persistent profile (cookies, HTTP cache, consent
+state) running between runs. Runs attach to it over CDP when
+browser_daemon.enabled is set, and launch their own browser when it is down.
+
+    python browser_daemon.py
+"""
+
+import logging
+from urllib.parse import urlparse
+
+from playwright.sync_api import sync_playwright, Error
+from playwright.async_api import Error as AsyncError
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"
+
+def get_daemon_settings(config):
+    settings = config.get('browser_daemon', {})
+    return {
+        "enabled": settings.get('enabled', False),
+        "cdp_endpoint": settings.get('cdp_endpoint', "http://127.0.0.1:9222"),
+        "connect_timeout_ms": settings.get('connect_timeout_seconds', 5) * 1000,
+    }
+
+def connect_to_daemon(playwright, config):
+    """The daemon's browser, attached over CDP, or None if the daemon is disabled or not running."""
+    settings = get_daemon_settings(config)
+    if not settings['enabled']:
+        return None
+    try:
+        browser = playwright.chromium.connect_over_cdp(settings['cdp_endpoint'], timeout=settings['connect_timeout_ms'])
+    except Error as e:
+        logger.warning(f"--- Browser daemon not reachable at {settings['cdp_endpoint']}, launching a local browser. Error: {e} ---")
+        return None
+    logger.debug(f"--- Attached to the browser daemon at {settings['cdp_endpoint']} ---")
+    return browser
+
+async def connect_to_daemon_async(playwright, config):
+    """Async version of connect_to_daemon."""
+    settings = get_daemon_settings(config)
+    if not settings['enabled']:
+        return None
+    try:
+        browser = await playwright.chromium.connect_over_cdp(settings['cdp_endpoint'], timeout=settings['connect_timeout_ms'])
+    except AsyncError as e:
+        logger.warning(f"--- Browser daemon not reachable at {settings['cdp_endpoint']}, launching a local browser. Error: {e} ---")
+        return None
+    logger.debug(f"--- Attached to the browser daemon at {settings['cdp_endpoint']} ---")
+    return browser
+
+def run_daemon(config):
+    """Launches the persistent-profile browser with its CDP port open and keeps it up until interrupted."""
+    settings = get_daemon_settings(config)
+    endpoint = urlparse(settings['cdp_endpoint'])
+    profile_dir = config['file_paths'].get('browser_profile_dir', 'browser_profile')
+    headless = config.get('browser_settings', {}).get('headless', True)
+
+    with sync_playwright() as p:
+        context = p.chromium.launch_persistent_context(
+            profile_dir,
+            headless=headless,
+            user_agent=USER_AGENT,
+            args=[f"--remote-debugging-address={endpoint.hostname or '127.0.0.1'}", f"--remote-debugging-port={endpoint.port or 9222}"],
+        )
+        logger.info(f"--- Browser daemon listening on {settings['cdp_endpoint']} with the profile in '{profile_dir}'. Stop it with Ctrl+C. ---")
+        try:
+            context.wait_for_event("close", timeout=0)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            try:
+                context.close()
+            except Error:
+                pass
+        logger.info("--- Browser daemon stopped ---")
+
+if __name__ == "__main__":
+    from main_controller import load_config
+    from structured_logging import setup_logging
+
+    config = load_config()
+    setup_logging(config)
+    run_daemon(config)
@@ -0,0 +1,188 @@
+# checkpoint_journal.py
+
+import logging
+import hashlib
+import json
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Search parameters each scraped stage depends on. Its checkpoints are
+# reused by later runs while these (and, for the stages that scan a date
+# range, the start date) are unchanged and the checkpoint is younger than the
+# stage's TTL. num_adults is part of every scraped stage since it changes the
+# prices shown. Airbnb searches are keyed by the stay they searched
+# ("checkin+nights"), so a new search plan reuses the ones already run.
+SCRAPED_STAGE_PARAMETERS = {
+    "outbound_prices": ("origin_city_id", "days_to_search", "num_adults"),
+    "return_prices": ("origin_city_id", "days_to_search", "num_adults"),
+    "listings": ("num_adults", "airbnb_listings_per_search"),
+    "calendar": ("airbnb_calendar_months_to_scan",),
+    "flights": ("num_adults",),
+}
+DATED_STAGES = ("outbound_prices", "return_prices")
+
+# Default hours a scraped stage's checkpoints stay fresh; cache_settings.checkpoint_ttl_hours overrides them.
+CHECKPOINT_TTL_HOURS = {
+    "outbound_prices": 12,
+    "return_prices": 12,
+    "flights": 12,
+    "listings": 24,
+    "calendar": 24,
+}
+
+# Search parameters of the stages recomputed from the scraped data: the ranked
+# candidates (Phases 2-5) and the validated trips (Phase 6).
+SCORING_PARAMETERS = {
+    "candidates": ("max_trip_duration_days", "min_exploration_hours", "day_starts_at_hour", "day_ends_at_hour",
+                   "airport_buffer_hours", "num_combinations_to_keep", "num_candidates_to_validate"),
+    "results": ("min_exploration_hours", "day_starts_at_hour", "day_ends_at_hour", "airport_buffer_hours",
+                "num_final_results_to_store"),
+}
+
+def fingerprint(inputs):
+    """Short stable hash of any JSON-serializable value."""
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+class CheckpointJournal:
+    """
+    Append-only JSONL record of each destination's phase outputs (price graphs,
+    Airbnb listings and calendars, ranked candidates, flight details and the
+    final trips), kept between runs. A run that dies mid-city resumes from the
+    last completed step, and a later run only repeats the stages whose inputs
+    changed.
+
+    Each line is one checkpoint: {"dest_id", "phase", "key", "data", "inputs",
+    "at"}, where inputs fingerprints what the data was computed from. Scraped
+    stages are fingerprinted by their search parameters (stage_fingerprints),
+    recomputed stages by the caller. A checkpoint only counts while its inputs
+    match and, for phases in ttl_hours, while it is younger than their TTL.
+    A half-written last line from a crash is skipped, and superseded and
+    expired lines are dropped when the journal is opened. With path=None
+    checkpoints are only kept in memory.
+    """
+    def __init__(self, path, fingerprints, ttl_hours=None):
+        self.path = path
+        self.fingerprints = fingerprints or {}
+        self.max_age_seconds = {phase: hours * 3600 for phase, hours in (ttl_hours or {}).items() if hours and hours > 0}
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            self._load()
+            self._file = open(path, "a", encoding="utf-8")
+
+    def _is_expired(self, entry, now):
+        max_age = self.max_age_seconds.get(entry['phase'])
+        return max_age is not None and now - entry.get('at', 0) > max_age
+
+    def _load(self):
+        """Reads an existing journal and rewrites it without superseded or expired checkpoints."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        for line in lines:
+            try:
+                entry = json.loads(line)
+                self._entries[(entry['dest_id'], entry['phase'], entry.get('key'))] = entry
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue # Half-written line from an interrupted run, or an old journal's header
+        now = time.time()
+        self._entries = {entry_key: entry for entry_key, entry in self._entries.items() if not self._is_expired(entry, now)}
+
+        # Compact in one step so a crash cannot leave the journal half-written.
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(temp_path, self.path)
+        logger.info(f"--- Loaded checkpoint journal '{self.path}' ({len(self._entries)} checkpoints, {len(lines) - len(self._entries)} superseded or expired lines dropped) ---")
+
+    def _append(self, entry):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def get(self, dest_id, phase, key=None, inputs=None):
+        """
+        The checkpointed data for a phase (and item key within it), or None if
+        there is none, it was computed from other inputs or it is older than
+        the phase's TTL. inputs defaults to the phase's stage fingerprint.
+        """
+        inputs = inputs or self.fingerprints.get(phase)
+        with self._lock:
+            entry = self._entries.get((dest_id, phase, key))
+        if entry is None or inputs is None or entry.get('inputs') != inputs or self._is_expired(entry, time.time()):
+            return None
+        return entry['data']
+
+    def digest(self, dest_id, phase, key=None, inputs=None):
+        """Fingerprint of the data get() would return, or None."""
+        data = self.get(dest_id, phase, key, inputs)
+        return None if data is None else fingerprint(data)
+
+    def record(self, dest_id, phase, data, key=None, inputs=None):
+        """Checkpoints a phase's output. data must be JSON-serializable and not None."""
+        entry = {"dest_id": dest_id, "phase": phase, "key": key, "data": data,
+                 "inputs": inputs or self.fingerprints.get(phase), "at": time.time()}
+        with self._lock:
+            self._entries[(dest_id, phase, key)] = entry
+            if self._file:
+                self._append(entry)
+
+    def items(self, dest_id, phase):
+        """{key: data} of a destination's current checkpoints for a phase."""
+        with self._lock:
+            keys = [key for entry_dest_id, entry_phase, key in self._entries if (entry_dest_id, entry_phase) == (dest_id, phase)]
+        items = {key: self.get(dest_id, phase, key) for key in keys}
+        return {key: data for key, data in items.items() if data is not None}
+
+    def has_destination(self, dest_id):
+        """True if any checkpoint, current or not, exists for the destination."""
+        with self._lock:
+            return any(entry_dest_id == dest_id for entry_dest_id, _, _ in self._entries)
+
+    def results(self):
+        """{dest_name: trips} for every finished destination that found trips, whatever they were computed from."""
+        with self._lock:
+            entries = [entry['data'] for (_, phase, _), entry in self._entries.items() if phase == "results"]
+        return {entry['dest_name']: entry['trips'] for entry in entries if entry.get('trips')}
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+def stage_fingerprints(config, start_date):
+    """{phase: fingerprint} of the search parameters each scraped stage depends on."""
+    params = config['search_parameters']
+    fingerprints = {}
+    for phase, names in SCRAPED_STAGE_PARAMETERS.items():
+        inputs = {name: params.get(name) for name in names}
+        if phase in DATED_STAGES:
+            inputs['start_date'] = start_date.strftime("%Y-%m-%d")
+        fingerprints[phase] = fingerprint({"phase": phase, **inputs})
+    return fingerprints
+
+def scoring_fingerprint(config, phase, upstream):
+    """Fingerprint of a recomputed stage: its scoring parameters and the digests of the data it was computed from."""
+    params = config['search_parameters']
+    return fingerprint({"phase": phase, "parameters": {name: params.get(name) for name in SCORING_PARAMETERS[phase]}, "upstream": upstream})
+
+def checkpoint_ttls(config):
+    """{phase: hours} each scraped stage's checkpoints stay fresh; 0 or null means they never expire."""
+    return {**CHECKPOINT_TTL_HOURS, **config.get('cache_settings', {}).get('checkpoint_ttl_hours', {})}
+
+def run_fingerprint(config, start_date):
+    """Identifies a search by its parameters and resolved start date."""
+    return fingerprint({"search_parameters": config['search_parameters'], "start_date": start_date.strftime("%Y-%m-%d")})
+
+def initialize_checkpoint_journal(config, start_date):
+    """Opens (or resumes) the checkpoint journal named by file_paths.journal_file."""
+    path = config['file_paths'].get('journal_file', 'trip_journal.jsonl')
+    return CheckpointJournal(path, stage_fingerprints(config, start_date), checkpoint_ttls(config))
@@ -0,0 +1,51 @@
+# destination_scheduler.py
+
+import heapq
+import logging
+
+logger = logging.getLogger(__name__)
+
+class DestinationScheduler:
+    """
+    Branch-and-bound ordering of destinations. Each destination gets a lower
+    bound on its cost per exploration hour from its flight prices alone;
+    destinations are processed best bound first, and one is skipped when its
+    bound cannot beat the top_trips_to_beat best trips found so far across
+    all destinations. Disabled (the default), it keeps the config order and
+    skips nothing.
+    """
+    def __init__(self, config, all_results):
+        settings = config.get('branch_and_bound', {})
+        self.enabled = settings.get('enabled', False)
+        self.top_trips_to_beat = max(1, settings.get('top_trips_to_beat', 10))
+        self.all_results = all_results
+        self._destinations = []
+        self.skipped = 0
+
+    def add(self, dest_id, dest_name, bound=None):
+        self._destinations.append((dest_id, dest_name, bound))
+
+    def ordered(self):
+        """(dest_id, dest_name, bound) for every destination, lowest bound first when enabled."""
+        if not self.enabled:
+            return list(self._destinations)
+        # sorted() is stable, so equal bounds keep the config order.
+        return sorted(self._destinations, key=lambda destination: destination[2] if destination[2] is not None else float('inf'))
+
+    def cutoff(self):
+        """Cost per hour of the top_trips_to_beat-th best trip found so far, or inf while there are fewer."""
+        costs = [trip.get('cost_per_hour_of_exploration', float('inf')) for trips in self.all_results.values() for trip in trips]
+        if len(costs) < self.top_trips_to_beat:
+            return float('inf')
+        return heapq.nsmallest(self.top_trips_to_beat, costs)[-1]
+
+    def should_skip(self, dest_name, bound):
+        """True if a destination with this bound cannot place among the best trips found so far."""
+        if not self.enabled or bound is None:
+            return False
+        cutoff = self.cutoff()
+        if bound < cutoff:
+            return False
+        self.skipped += 1
+        logger.info(f" - Skipping the Airbnb phases for {dest_name}: its best possible {bound:.2f}/hour cannot beat the current top {self.top_trips_to_beat} ({cutoff:.2f}/hour).")
+        return True
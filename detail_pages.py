@@ -0,0 +1,95 @@
+# detail_pages.py
+
+import asyncio
+import logging
+
+from flight_scraper import scrape_flight_results, scrape_flight_results_async
+
+logger = logging.getLogger(__name__)
+
+def get_detail_tabs(config):
+    """How many Kiwi results pages Phase 6 loads at once (browser_settings.detail_page_tabs)."""
+    return max(1, config.get('browser_settings', {}).get('detail_page_tabs', 3))
+
+
+class DetailPagePool:
+    """
+    Phase 6 results pages for the sync runners, loaded one at a time on the
+    main page. The sync Playwright API cannot drive pages from several
+    threads, and a browser per extra tab costs more than it saves, so only
+    AsyncDetailPagePool loads several pages at once.
+    """
+    tabs = 1
+
+    def __init__(self, page):
+        self.page = page
+
+    def fetch(self, legs, config, log_func):
+        """
+        Scrapes each (origin, destination, date) leg's results page once.
+        Yields (leg, (flights, results_text)) as each finishes; the first
+        failure is raised once every leg has been tried.
+        """
+        first_error = None
+        for leg in dict.fromkeys(legs):
+            try:
+                scraped = scrape_flight_results(self.page, *leg, config, log_func)
+            except Exception as e:
+                first_error = first_error or e
+                continue
+            yield leg, scraped
+        if first_error:
+            raise first_error
+
+    def close(self):
+        """Nothing to release; the page belongs to the caller."""
+
+
+class AsyncDetailPagePool:
+    """
+    Async counterpart of DetailPagePool that loads up to tabs results pages
+    at once. Extra tabs are pages opened by open_page() (normally in the
+    destination page's own context) and are kept for the rest of the
+    destination.
+    """
+    def __init__(self, page, tabs, open_page):
+        self.tabs = tabs
+        self._open_page = open_page
+        self._idle_pages = asyncio.Queue()
+        self._idle_pages.put_nowait(page)
+        self._opened_pages = []
+        self._page_count = 1
+
+    async def _borrow_page(self):
+        if self._idle_pages.empty() and self._page_count < self.tabs:
+            self._page_count += 1
+            page = await self._open_page()
+            self._opened_pages.append(page)
+            return page
+        return await self._idle_pages.get()
+
+    async def _scrape(self, leg, config, log_func):
+        page = await self._borrow_page()
+        try:
+            return leg, await scrape_flight_results_async(page, *leg, config, log_func)
+        finally:
+            self._idle_pages.put_nowait(page)
+
+    async def fetch(self, legs, config, log_func):
+        """Async version of DetailPagePool.fetch."""
+        legs = list(dict.fromkeys(legs))
+        first_error = None
+        for next_done in asyncio.as_completed([self._scrape(leg, config, log_func) for leg in legs]):
+            try:
+                yield await next_done
+            except Exception as e:
+                first_error = first_error or e
+        if first_error:
+            raise first_error
+
+    async def close(self):
+        """Closes the extra tabs; the page the pool was given stays open."""
+        for page in self._opened_pages:
+            await page.close()
+        self._opened_pages = []
+        self._page_count = 1
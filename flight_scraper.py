@@ -1,117 +1,571 @@
-import json
-import time
-import random # ✅ MODIFICATION: Import random for delays
+import logging
 from playwright.sync_api import Page, Error, TimeoutError as PlaywrightTimeoutError
-import re
+from playwright.async_api import Page as AsyncPage, Error as AsyncError
 from datetime import datetime, timedelta
 
-# (The extract_prices_from_calendar function remains the same)
+from scraping_utils import parse_price_text
+from kiwi_network import KiwiResponseCapture, get_capture_settings
+from pacing import get_pacer
+from json_stream import JSONObjectStream
+from llm_cache import make_cache_key, completion_record
+from metrics import span, increment
+
+logger = logging.getLogger(__name__)
+
+# Collects every calendar day's date and price label in one browser round trip.
+CALENDAR_DAYS_JS = """
+() => Array.from(document.querySelectorAll('[data-test="CalendarDay"]')).map(day => {
+    const price = day.querySelector('[data-test="NewDatepickerPrice"]');
+    return [day.getAttribute('data-value'), price ? price.textContent : null];
+})
+"""
+
+# True once the calendar's first day differs from the one shown before clicking next.
+CALENDAR_MOVED_JS = """
+(previous) => {
+    const day = document.querySelector('[data-test="CalendarDay"]');
+    return Boolean(day) && day.getAttribute('data-value') !== previous;
+}
+"""
+
+# Set once Kiwi's cookie banner has been accepted; the browser daemon's profile keeps it between runs.
+KIWI_CONSENT_COOKIE = "__kwc_agreed"
+
+def _has_kiwi_consent(cookies):
+    return any(cookie['name'] == KIWI_CONSENT_COOKIE for cookie in cookies)
+
+def accept_cookie_banner(page, timeout_ms, pacer):
+    """Clicks Kiwi's cookie banner away, unless this browser context already agreed to it."""
+    if _has_kiwi_consent(page.context.cookies("https://www.kiwi.com")):
+        return
+    try:
+        page.get_by_role('button', name='Accept', exact=True).click(timeout=timeout_ms)
+        logger.debug("      - Cookie banner accepted.")
+        pacer.jitter("cookie_banner")
+    except Error: pass
+
+async def accept_cookie_banner_async(page, timeout_ms, pacer):
+    """Async version of accept_cookie_banner."""
+    if _has_kiwi_consent(await page.context.cookies("https://www.kiwi.com")):
+        return
+    try:
+        await page.get_by_role('button', name='Accept', exact=True).click(timeout=timeout_ms)
+        logger.debug("      - Cookie banner accepted.")
+        await pacer.jitter_async("cookie_banner")
+    except AsyncError: pass
+
+def _build_daily_prices(raw_days):
+    """Turns [date, price label] pairs from the calendar into {full_date, price} entries, cheapest first."""
+    daily_prices = []
+    for full_date, price_text in raw_days:
+        price = parse_price_text(price_text)
+        if full_date and price:
+            daily_prices.append({"full_date": full_date, "price": price})
+
+    daily_prices.sort(key=lambda x: x['price'])
+    return daily_prices
+
+def _merge_calendar_prices(all_prices, current_prices, start_date, search_end_date):
+    """Adds in-range prices to all_prices and returns the last date shown in the calendar."""
+    last_day_in_calendar = start_date
+    for price_info in current_prices:
+        day = datetime.strptime(price_info['full_date'], "%Y-%m-%d").date()
+        last_day_in_calendar = max(last_day_in_calendar, day)
+        if start_date <= day <= search_end_date:
+            all_prices[price_info['full_date']] = price_info
+    return last_day_in_calendar
+
+def _clean_flights(flights):
+    """Keeps the extracted flights that have a numeric price, cheapest first."""
+    flights = [f for f in flights if isinstance(f, dict) and isinstance(f.get('price'), (int, float))]
+    flights.sort(key=lambda x: x['price'])
+    return flights
+
+def _batch_extraction_request(search_ids, pages, config):
+    """
+    One streaming request covering several results pages. pages maps a caller
+    key to (departure_date, results_text); search_ids maps the same keys to the
+    short ids the model echoes back with each page's flights.
+    """
+    provider = config['api_settings']['provider']
+    model = config['api_settings']['models'][provider]['default']
+    sections = "\n\n".join(
+        f"=== SEARCH {search_ids[key]} (departing {departure_date}) ===\n{results_text}"
+        for key, (departure_date, results_text) in pages.items()
+    )
+    prompt = (
+        "Below are the texts of several flight search results pages, each introduced by a "
+        "'=== SEARCH <id> ===' line. For each search, in the order given, output one JSON object "
+        'on its own line in the form {"search": "<id>", "flights": [{"departure_time": "HH:MM", "arrival_time": "HH:MM", "price": 123}]}. '
+        "Use 24-hour times, keep a '+1' suffix on arrival times that land the next day, "
+        "and give the price as an integer.\n\n"
+        f"{sections}"
+    )
+    return dict(
+        model=model,
+        messages=[
+            {"role": "system", "content": "You are a highly accurate data extraction assistant that responds ONLY in valid JSON format."},
+            {"role": "user", "content": prompt}
+        ]
+    )
+
+class _BatchResults:
+    """Matches streamed {"search", "flights"} objects back to the caller's page keys."""
+    def __init__(self, pages):
+        self.search_ids = {key: f"S{i + 1}" for i, key in enumerate(pages)}
+        self._keys_by_search_id = {search_id: key for key, search_id in self.search_ids.items()}
+        self._parser = JSONObjectStream()
+        self._text = []
+        self.done = set()
+
+    def _match(self, objects):
+        for extracted in objects:
+            key = self._keys_by_search_id.get(str(extracted.get('search')))
+            if key is not None and key not in self.done:
+                self.done.add(key)
+                yield key, _clean_flights(extracted.get('flights', []))
+
+    def feed(self, text):
+        self._text.append(text)
+        yield from self._match(self._parser.feed(text))
+
+    def finish(self):
+        """Pages whose objects a stray brace held back until the response ended."""
+        yield from self._match(self._parser.finish())
+
+    @property
+    def complete(self):
+        """True once every page has its flights; only complete batches are cached."""
+        return len(self.done) == len(self.search_ids)
+
+    def missing(self):
+        for key in self.search_ids:
+            if key not in self.done:
+                yield key, []
+
+    @property
+    def text(self):
+        return "".join(self._text)
+
+def extract_flights_batch(client, pages, config, log_func):
+    """
+    Extracts the flights from several results pages with one streaming AI
+    request. pages maps any key to (departure_date, results_text). Yields
+    (key, flights) as soon as each page's JSON object has streamed in, then
+    (key, []) for pages the model skipped.
+    """
+    if not pages:
+        return
+    batch = _BatchResults(pages)
+    request = _batch_extraction_request(batch.search_ids, pages, config)
+    logger.info(f"        - Extracting {len(pages)} results page(s) with one AI request...")
+
+    cache = getattr(client, 'response_cache', None)
+    cache_key = make_cache_key(request) if cache else None
+    cached = cache.get(cache_key) if cache else None
+    if cached is not None:
+        yield from batch.feed(cached['choices'][0]['message']['content'])
+        yield from batch.finish()
+    else:
+        stream = client.chat.completions.create(stream=True, **request)
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield from batch.feed(chunk.choices[0].delta.content)
+        yield from batch.finish()
+        if cache and batch.complete:
+            cache.put(cache_key, request['model'], completion_record(request['model'], batch.text))
+
+    log_func(batch.text, "extract_flights_batch")
+    yield from batch.missing()
+
+async def extract_flights_batch_async(client, pages, config, log_func):
+    """Async version of extract_flights_batch; client is an AsyncRotatingClient."""
+    if not pages:
+        return
+    batch = _BatchResults(pages)
+    request = _batch_extraction_request(batch.search_ids, pages, config)
+    logger.info(f"        - Extracting {len(pages)} results page(s) with one AI request...")
+
+    cache = getattr(client, 'response_cache', None)
+    cache_key = make_cache_key(request) if cache else None
+    cached = cache.get(cache_key) if cache else None
+    if cached is not None:
+        for result in batch.feed(cached['choices'][0]['message']['content']):
+            yield result
+        for result in batch.finish():
+            yield result
+    else:
+        stream = await client.chat.completions.create(stream=True, **request)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                for result in batch.feed(chunk.choices[0].delta.content):
+                    yield result
+        for result in batch.finish():
+            yield result
+        if cache and batch.complete:
+            cache.put(cache_key, request['model'], completion_record(request['model'], batch.text))
+
+    log_func(batch.text, "extract_flights_batch")
+    for result in batch.missing():
+        yield result
+
+# Upper bounds on CalendarMoveNext clicks and on API payloads read while
+# waiting, so a chatty page cannot keep the wait loops going forever.
+MAX_CALENDAR_PAGES = 12
+MAX_CAPTURED_PAYLOADS = 50
+
+def _read_prices_from_network(page: Page, capture, start_date, search_end_date, timeout_ms):
+    """
+    Collects calendar prices from Kiwi's API responses, paging the calendar
+    forward as each month's payload arrives. Returns (prices, complete), where
+    complete is False when the payloads stopped before search_end_date, leaving
+    the calendar where they stopped; prices is None if no prices were seen.
+    """
+    months_moved = 0
+    while capture.wait_for_payload(timeout_ms):
+        known_days = len(capture.prices)
+        capture.process_pending()
+        if capture.covers(search_end_date) or months_moved >= MAX_CALENDAR_PAGES or capture.payloads_seen >= MAX_CAPTURED_PAYLOADS:
+            break
+        if len(capture.prices) > known_days:
+            page.locator('[data-test="CalendarMoveNext"]').click()
+            months_moved += 1
+
+    if not capture.prices:
+        return None, False
+    return capture.prices_in_range(start_date, search_end_date), capture.covers(search_end_date)
+
+def _read_flights_from_network(capture, departure_date, timeout_ms):
+    """Waits for Kiwi's itinerary payload and returns the flights on departure_date, cheapest first."""
+    while capture.wait_for_payload(timeout_ms):
+        capture.process_pending()
+        flights = capture.flights_on(departure_date)
+        if flights or capture.payloads_seen >= MAX_CAPTURED_PAYLOADS:
+            return flights
+    return []
+
 def extract_prices_from_calendar(page: Page) -> list:
     """
-    Directly scrapes the full date and price from the calendar view using
-    stable data-test attributes.
+    Reads the full date and price of every visible calendar day in a single
+    page.evaluate call, using stable data-test attributes.
     """
-    print("        - Directly parsing price data from calendar HTML...")
-    daily_prices = []
-    day_elements = page.locator('[data-test="CalendarDay"]').all()
-    
-    if not day_elements:
-        print("        - ❌ No active calendar day elements found.")
+    logger.debug("        - Directly parsing price data from calendar HTML...")
+    try:
+        raw_days = page.evaluate(CALENDAR_DAYS_JS)
+    except Error as e:
+        logger.error(f"        - ❌ Could not read calendar days. Error: {e}")
         return []
 
-    for day_element in day_elements:
-        try:
-            full_date = day_element.get_attribute('data-value')
-            price_element = day_element.locator('[data-test="NewDatepickerPrice"]')
-            price_text = price_element.inner_text(timeout=10000)
-            
-            price_match = re.search(r'(\d[\d,]*)', price_text)
-            if not price_match:
-                continue
-
-            price = int(price_match.group(1).replace(',', ''))
-            
-            if full_date and price:
-                daily_prices.append({
-                    "full_date": full_date,
-                    "price": price
-                })
-        except (Error, ValueError, AttributeError):
-            continue
-            
-    if daily_prices:
-        daily_prices.sort(key=lambda x: x.get('price', float('inf')))
+    if not raw_days:
+        logger.error("        - ❌ No active calendar day elements found.")
+        return []
 
-    return daily_prices
+    return _build_daily_prices(raw_days)
 
-def get_daily_prices_from_graph(page: Page, origin: str, destination: str, start_date: datetime.date, config: dict, log_func):
-    days_to_search = config['search_parameters']['days_to_search']
-    search_end_date = start_date + timedelta(days=days_to_search)
+def get_daily_prices_from_graph(page: Page, origin: str, destination: str, start_date: datetime.date, config: dict, log_func, end_date: datetime.date = None):
+    if end_date:
+        search_end_date = end_date
+    else:
+        days_to_search = config['search_parameters']['days_to_search']
+        search_end_date = start_date + timedelta(days=days_to_search)
     initial_url = f"https://www.kiwi.com/en/search/results/{origin}/{destination}/{start_date.strftime('%Y-%m-%d')}/no-return"
-    print(f"    - Scraping all monthly price data from: {initial_url}")
+    logger.debug(f"    - Scraping all monthly price data from: {initial_url}")
 
     all_prices = {}
     last_exception = None
+    capture_enabled, capture_timeout_ms = get_capture_settings(config)
+    pacer = get_pacer(config)
 
     for attempt in range(3):
+        capture = KiwiResponseCapture(page) if capture_enabled else None
         try:
-            page.goto(initial_url, timeout=90000)
-            time.sleep(random.uniform(2, 4)) # ✅ MODIFICATION: Wait after page load
-
-            try:
-                page.get_by_role('button', name='Accept', exact=True).click(timeout=7000)
-                print("      - Cookie banner accepted.")
-                time.sleep(random.uniform(1, 2.5)) # ✅ MODIFICATION: Wait after click
-            except Error: pass
-            
-            print("      - Clicking date input to reveal price calendar...")
+            pacer.throttle(initial_url)
+            increment("page_loads_total", site="kiwi.com")
+            with span("page_load", site="kiwi.com", url=initial_url):
+                page.goto(initial_url, timeout=90000)
+            pacer.jitter("page_load")
+
+            accept_cookie_banner(page, 7000, pacer)
+
+            logger.debug("      - Clicking date input to reveal price calendar...")
             date_input = page.locator('[data-test="SearchFieldDateInput"]')
             date_input.wait_for(state='visible', timeout=30000)
             date_input.click()
-            time.sleep(random.uniform(2, 3)) # ✅ MODIFICATION: Wait for calendar to render
+
+            if capture:
+                network_prices, complete = _read_prices_from_network(page, capture, start_date, search_end_date, capture_timeout_ms)
+                if complete:
+                    logger.info(f"      - Read {len(network_prices)} prices from Kiwi's API responses.")
+                    log_func({"route": f"{origin}->{destination}", "prices": network_prices}, "get_daily_prices_from_graph")
+                    return network_prices
+                if network_prices:
+                    # Keep what the payloads covered and read only the remaining months from the calendar
+                    all_prices.update((p['full_date'], p) for p in network_prices)
+                    logger.info(f"      - Kiwi's API responses stopped at {network_prices[-1]['full_date']}, reading the rest from the rendered calendar.")
+                else:
+                    logger.info("      - No calendar payload captured, falling back to the rendered calendar.")
 
             page.locator('[data-test="CalendarDay"]').first.wait_for(state='visible', timeout=30000)
-            
+
             while True:
-                # ... (rest of the logic is the same)
                 current_prices = extract_prices_from_calendar(page)
-                # ...
+                if not current_prices:
+                    break
+                last_day_in_calendar = _merge_calendar_prices(all_prices, current_prices, start_date, search_end_date)
                 if last_day_in_calendar >= search_end_date:
                     break
                 else:
+                    first_day_shown = page.locator('[data-test="CalendarDay"]').first.get_attribute('data-value')
                     page.locator('[data-test="CalendarMoveNext"]').click()
-                    time.sleep(random.uniform(2, 4)) # ✅ MODIFICATION: Wait for next month to load
+                    pacer.wait_for_function(page, CALENDAR_MOVED_JS, first_day_shown, "calendar_month")
 
             final_price_list = list(all_prices.values())
-            # ...
+            final_price_list.sort(key=lambda x: x['full_date'])
+            log_func({"route": f"{origin}->{destination}", "prices": final_price_list}, "get_daily_prices_from_graph")
             return final_price_list
 
         except Exception as e:
-            print(f"--- Attempt {attempt + 1} FAILED for price graph. Error: {e}")
+            logger.error(f"--- Attempt {attempt + 1} FAILED for price graph. Error: {e}")
             last_exception = e
-            if attempt < 2: time.sleep(10)
+            if isinstance(e, PlaywrightTimeoutError):
+                increment("timeouts_total", operation="price_graph")
+            if attempt < 2: increment("retries_total", operation="price_graph")
+            if attempt < 2: pacer.backoff(attempt)
+        finally:
+            if capture: capture.detach()
 
-    print(f"--- All scraping attempts for price graph failed. ---")
+    logger.error(f"--- All scraping attempts for price graph failed. ---")
     if last_exception:
         raise last_exception
     return []
 
-# (The get_detailed_flight_info function would have similar random delays added)
-def get_detailed_flight_info(page, origin, destination, departure_date, client, config, log_func):
+def get_daily_prices(page: Page, origin: str, destination: str, start_date: datetime.date, config: dict, log_func, price_cache=None):
+    """
+    Returns the price graph for the search window, scraping only the date
+    ranges that are missing or stale in price_cache.
+    """
+    if price_cache is None:
+        return get_daily_prices_from_graph(page, origin, destination, start_date, config, log_func)
+
+    search_end_date = start_date + timedelta(days=config['search_parameters']['days_to_search'])
+    cached_prices, missing_ranges = price_cache.lookup(origin, destination, start_date, search_end_date)
+    if not missing_ranges:
+        logger.debug(f"    - Using cached price graph for {origin} -> {destination}")
+        return sorted(cached_prices, key=lambda x: x['full_date'])
+
+    all_prices = {p['full_date']: p for p in cached_prices}
+    for range_start, range_end in missing_ranges:
+        scraped_prices = get_daily_prices_from_graph(page, origin, destination, range_start, config, log_func, end_date=range_end)
+        price_cache.store(origin, destination, range_start, range_end, scraped_prices)
+        all_prices.update((p['full_date'], p) for p in scraped_prices)
+    return sorted(all_prices.values(), key=lambda x: x['full_date'])
+
+def scrape_flight_results(page, origin, destination, departure_date, config, log_func):
+    """
+    Loads the one-way results page for departure_date. Returns (flights, None)
+    when Kiwi's itinerary payload was captured, otherwise (None, results_text)
+    with the text of the top result cards for the AI to extract.
+    """
+    url = f"https://www.kiwi.com/en/search/results/{origin}/{destination}/{departure_date}/no-return"
+    logger.debug(f"        - Scraping detailed flight info for: {departure_date}")
+    capture_enabled, capture_timeout_ms = get_capture_settings(config)
+    capture = KiwiResponseCapture(page) if capture_enabled else None
+    pacer = get_pacer(config)
+
+    try:
+        pacer.throttle(url)
+        increment("page_loads_total", site="kiwi.com")
+        with span("page_load", site="kiwi.com", url=url):
+            page.goto(url, timeout=90000, wait_until="domcontentloaded")
+        pacer.jitter("page_load")
+
+        accept_cookie_banner(page, 15000, pacer)
+
+        if capture:
+            flights = _read_flights_from_network(capture, departure_date, capture_timeout_ms)
+            if flights:
+                log_func({"departure_date": departure_date, "flights": flights}, "get_detailed_flight_info")
+                return flights, None
+            logger.info("        - No itinerary payload captured, falling back to the AI extraction.")
+
+        result_cards = page.locator('[data-test="ResultCardWrapper"]')
+        result_cards.first.wait_for(state='visible', timeout=60000)
+        return None, "\n---\n".join(card.inner_text() for card in result_cards.all()[:5])
+
+    except Exception as e:
+        logger.error(f"        - ❌ ERROR: Could not get detailed flight info for {departure_date}. Error: {e}")
+        raise e
+    finally:
+        if capture: capture.detach()
+
+# --- Async counterparts, used when several browser contexts scrape at once ---
+
+async def _read_prices_from_network_async(page: AsyncPage, capture, start_date, search_end_date, timeout_ms):
+    """Async version of _read_prices_from_network."""
+    months_moved = 0
+    while await capture.wait_for_payload_async(timeout_ms):
+        known_days = len(capture.prices)
+        await capture.process_pending_async()
+        if capture.covers(search_end_date) or months_moved >= MAX_CALENDAR_PAGES or capture.payloads_seen >= MAX_CAPTURED_PAYLOADS:
+            break
+        if len(capture.prices) > known_days:
+            await page.locator('[data-test="CalendarMoveNext"]').click()
+            months_moved += 1
+
+    if not capture.prices:
+        return None, False
+    return capture.prices_in_range(start_date, search_end_date), capture.covers(search_end_date)
+
+async def _read_flights_from_network_async(capture, departure_date, timeout_ms):
+    """Async version of _read_flights_from_network."""
+    while await capture.wait_for_payload_async(timeout_ms):
+        await capture.process_pending_async()
+        flights = capture.flights_on(departure_date)
+        if flights or capture.payloads_seen >= MAX_CAPTURED_PAYLOADS:
+            return flights
+    return []
+
+async def extract_prices_from_calendar_async(page: AsyncPage) -> list:
+    """Async version of extract_prices_from_calendar."""
+    logger.debug("        - Directly parsing price data from calendar HTML...")
+    try:
+        raw_days = await page.evaluate(CALENDAR_DAYS_JS)
+    except AsyncError as e:
+        logger.error(f"        - ❌ Could not read calendar days. Error: {e}")
+        return []
+
+    if not raw_days:
+        logger.error("        - ❌ No active calendar day elements found.")
+        return []
+
+    return _build_daily_prices(raw_days)
+
+async def get_daily_prices_from_graph_async(page: AsyncPage, origin: str, destination: str, start_date: datetime.date, config: dict, log_func, end_date: datetime.date = None):
+    """Async version of get_daily_prices_from_graph."""
+    if end_date:
+        search_end_date = end_date
+    else:
+        days_to_search = config['search_parameters']['days_to_search']
+        search_end_date = start_date + timedelta(days=days_to_search)
+    initial_url = f"https://www.kiwi.com/en/search/results/{origin}/{destination}/{start_date.strftime('%Y-%m-%d')}/no-return"
+    logger.debug(f"    - Scraping all monthly price data from: {initial_url}")
+
+    all_prices = {}
+    last_exception = None
+    capture_enabled, capture_timeout_ms = get_capture_settings(config)
+    pacer = get_pacer(config)
+
+    for attempt in range(3):
+        capture = KiwiResponseCapture(page) if capture_enabled else None
+        try:
+            await pacer.throttle_async(initial_url)
+            increment("page_loads_total", site="kiwi.com")
+            with span("page_load", site="kiwi.com", url=initial_url):
+                await page.goto(initial_url, timeout=90000)
+            await pacer.jitter_async("page_load")
+
+            await accept_cookie_banner_async(page, 7000, pacer)
+
+            logger.debug("      - Clicking date input to reveal price calendar...")
+            date_input = page.locator('[data-test="SearchFieldDateInput"]')
+            await date_input.wait_for(state='visible', timeout=30000)
+            await date_input.click()
+
+            if capture:
+                network_prices, complete = await _read_prices_from_network_async(page, capture, start_date, search_end_date, capture_timeout_ms)
+                if complete:
+                    logger.info(f"      - Read {len(network_prices)} prices from Kiwi's API responses.")
+                    log_func({"route": f"{origin}->{destination}", "prices": network_prices}, "get_daily_prices_from_graph")
+                    return network_prices
+                if network_prices:
+                    # Keep what the payloads covered and read only the remaining months from the calendar
+                    all_prices.update((p['full_date'], p) for p in network_prices)
+                    logger.info(f"      - Kiwi's API responses stopped at {network_prices[-1]['full_date']}, reading the rest from the rendered calendar.")
+                else:
+                    logger.info("      - No calendar payload captured, falling back to the rendered calendar.")
+
+            await page.locator('[data-test="CalendarDay"]').first.wait_for(state='visible', timeout=30000)
+
+            while True:
+                current_prices = await extract_prices_from_calendar_async(page)
+                if not current_prices:
+                    break
+                last_day_in_calendar = _merge_calendar_prices(all_prices, current_prices, start_date, search_end_date)
+                if last_day_in_calendar >= search_end_date:
+                    break
+                else:
+                    first_day_shown = await page.locator('[data-test="CalendarDay"]').first.get_attribute('data-value')
+                    await page.locator('[data-test="CalendarMoveNext"]').click()
+                    await pacer.wait_for_function_async(page, CALENDAR_MOVED_JS, first_day_shown, "calendar_month")
+
+            final_price_list = list(all_prices.values())
+            final_price_list.sort(key=lambda x: x['full_date'])
+            log_func({"route": f"{origin}->{destination}", "prices": final_price_list}, "get_daily_prices_from_graph")
+            return final_price_list
+
+        except Exception as e:
+            logger.error(f"--- Attempt {attempt + 1} FAILED for price graph. Error: {e}")
+            last_exception = e
+            if isinstance(e, PlaywrightTimeoutError):
+                increment("timeouts_total", operation="price_graph")
+            if attempt < 2: increment("retries_total", operation="price_graph")
+            if attempt < 2: await pacer.backoff_async(attempt)
+        finally:
+            if capture: capture.detach()
+
+    logger.error(f"--- All scraping attempts for price graph failed. ---")
+    if last_exception:
+        raise last_exception
+    return []
+
+async def get_daily_prices_async(page: AsyncPage, origin: str, destination: str, start_date: datetime.date, config: dict, log_func, price_cache=None):
+    """Async version of get_daily_prices."""
+    if price_cache is None:
+        return await get_daily_prices_from_graph_async(page, origin, destination, start_date, config, log_func)
+
+    search_end_date = start_date + timedelta(days=config['search_parameters']['days_to_search'])
+    cached_prices, missing_ranges = price_cache.lookup(origin, destination, start_date, search_end_date)
+    if not missing_ranges:
+        logger.debug(f"    - Using cached price graph for {origin} -> {destination}")
+        return sorted(cached_prices, key=lambda x: x['full_date'])
+
+    all_prices = {p['full_date']: p for p in cached_prices}
+    for range_start, range_end in missing_ranges:
+        scraped_prices = await get_daily_prices_from_graph_async(page, origin, destination, range_start, config, log_func, end_date=range_end)
+        price_cache.store(origin, destination, range_start, range_end, scraped_prices)
+        all_prices.update((p['full_date'], p) for p in scraped_prices)
+    return sorted(all_prices.values(), key=lambda x: x['full_date'])
+
+async def scrape_flight_results_async(page: AsyncPage, origin, destination, departure_date, config, log_func):
+    """Async version of scrape_flight_results."""
     url = f"https://www.kiwi.com/en/search/results/{origin}/{destination}/{departure_date}/no-return"
-    print(f"        - Scraping detailed flight info for: {departure_date}")
+    logger.debug(f"        - Scraping detailed flight info for: {departure_date}")
+    capture_enabled, capture_timeout_ms = get_capture_settings(config)
+    capture = KiwiResponseCapture(page) if capture_enabled else None
+    pacer = get_pacer(config)
 
     try:
-        page.goto(url, timeout=90000, wait_until="domcontentloaded")
-        time.sleep(random.uniform(2, 4)) # ✅ MODIFICATION: Wait after page load
+        await pacer.throttle_async(url)
+        increment("page_loads_total", site="kiwi.com")
+        with span("page_load", site="kiwi.com", url=url):
+            await page.goto(url, timeout=90000, wait_until="domcontentloaded")
+        await pacer.jitter_async("page_load")
+
+        await accept_cookie_banner_async(page, 15000, pacer)
 
-        try: 
-            page.get_by_role('button', name='Accept', exact=True).click(timeout=15000)
-            time.sleep(random.uniform(1, 2)) # ✅ MODIFICATION: Wait after click
-        except Error: pass
+        if capture:
+            flights = await _read_flights_from_network_async(capture, departure_date, capture_timeout_ms)
+            if flights:
+                log_func({"departure_date": departure_date, "flights": flights}, "get_detailed_flight_info")
+                return flights, None
+            logger.info("        - No itinerary payload captured, falling back to the AI extraction.")
 
-        # ... (rest of the function remains the same, including the error raising)
+        result_cards = page.locator('[data-test="ResultCardWrapper"]')
+        await result_cards.first.wait_for(state='visible', timeout=60000)
+        return None, "\n---\n".join([await card.inner_text() for card in (await result_cards.all())[:5]])
 
     except Exception as e:
-        print(f"        - ❌ ERROR: Could not get detailed flight info for {departure_date}. Error: {e}")
-        raise e
\ No newline at end of file
+        logger.error(f"        - ❌ ERROR: Could not get detailed flight info for {departure_date}. Error: {e}")
+        raise e
+    finally:
+        if capture: capture.detach()
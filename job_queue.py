@@ -0,0 +1,188 @@
+# job_queue.py
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class JobQueue:
+    """
+    Durable queue of destination jobs shared by a coordinator and any number
+    of worker processes through one SQLite file.
+
+    A worker leases a job for lease_seconds and keeps the lease alive with
+    heartbeats while it works. A lease that expires (the worker died or hung)
+    is handed to the next worker that asks, until a job has been tried
+    max_attempts times. Workers push each destination's trips back into the
+    queue, and the coordinator merges them into one results file.
+    """
+    def __init__(self, db_path, run_fingerprint, lease_seconds=300, max_attempts=3):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # Autocommit mode, so leases can take the write lock explicitly with BEGIN IMMEDIATE.
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                dest_id TEXT NOT NULL UNIQUE,
+                dest_name TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'queued',
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_expires)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.run_fingerprint = run_fingerprint
+
+    def _write(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    def queued_run(self):
+        """Fingerprint of the search the queued jobs belong to, or None for an empty queue."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'run'").fetchone()
+        return row[0] if row else None
+
+    def reset_for_run(self):
+        """Starts the queue over when it holds jobs for a different search."""
+        if self.queued_run() == self.run_fingerprint:
+            return False
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM jobs")
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('run', ?)", (self.run_fingerprint,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def enqueue(self, dest_id, dest_name):
+        """Adds a destination job. A destination already in the queue keeps its state. Returns True if added."""
+        return self._write("INSERT OR IGNORE INTO jobs (dest_id, dest_name, updated_at) VALUES (?, ?, ?)",
+                           (dest_id, dest_name, time.time())) > 0
+
+    def lease(self, worker_id):
+        """Claims the oldest queued job, or one whose lease has expired. Returns {id, dest_id, dest_name, attempts} or None."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET state = 'failed', error = 'lease expired after the last attempt', updated_at = ? "
+                    "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?", (now, now, self.max_attempts))
+                row = self._conn.execute(
+                    "SELECT id, dest_id, dest_name, attempts, worker FROM jobs "
+                    "WHERE state = 'queued' OR (state = 'leased' AND lease_expires < ?) ORDER BY id LIMIT 1", (now,)
+                ).fetchone()
+                if row:
+                    self._conn.execute(
+                        "UPDATE jobs SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                        (worker_id, now + self.lease_seconds, now, row[0]))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job_id, dest_id, dest_name, attempts, previous_worker = row
+        if previous_worker:
+            logger.info(f"--- Reclaimed {dest_name} from worker '{previous_worker}', whose lease expired ---")
+        return {"id": job_id, "dest_id": dest_id, "dest_name": dest_name, "attempts": attempts + 1}
+
+    def heartbeat(self, job_id, worker_id):
+        """Extends this worker's lease. False if the lease was lost to another worker."""
+        return self._write("UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                           (time.time() + self.lease_seconds, time.time(), job_id, worker_id)) > 0
+
+    def complete(self, job_id, worker_id, trips):
+        """Stores a finished job's trips (possibly none). False if the lease was lost meanwhile."""
+        return self._write("UPDATE jobs SET state = 'done', result = ?, error = NULL, updated_at = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                           (json.dumps(trips or [], ensure_ascii=False), time.time(), job_id, worker_id)) > 0
+
+    def fail(self, job_id, worker_id, error):
+        """Returns a failed job to the queue, or marks it failed once it has used all its attempts."""
+        return self._write(
+            "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, worker = NULL, lease_expires = NULL, error = ?, updated_at = ? "
+            "WHERE id = ? AND worker = ? AND state = 'leased'", (self.max_attempts, str(error), time.time(), job_id, worker_id)) > 0
+
+    def counts(self):
+        """Number of jobs in each state."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def is_drained(self):
+        """True once no job is queued or leased."""
+        counts = self.counts()
+        return not counts.get('queued') and not counts.get('leased')
+
+    def results(self):
+        """{dest_name: trips} for every finished destination that found trips."""
+        with self._lock:
+            rows = self._conn.execute("SELECT dest_name, result FROM jobs WHERE state = 'done'").fetchall()
+        return {dest_name: trips for dest_name, trips in ((name, json.loads(result)) for name, result in rows) if trips}
+
+    def failures(self):
+        """(dest_name, error) for every job that ran out of attempts."""
+        with self._lock:
+            return self._conn.execute("SELECT dest_name, error FROM jobs WHERE state = 'failed'").fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class Heartbeat:
+    """Keeps a job's lease alive from a background thread while the with-block runs."""
+    def __init__(self, job_queue, job_id, worker_id, interval_seconds):
+        self.job_queue = job_queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval_seconds = interval_seconds
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f"heartbeat-{job_id}", daemon=True)
+
+    def _beat(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                if not self.job_queue.heartbeat(self.job_id, self.worker_id):
+                    self.lost = True
+                    logger.warning("--- Lost the lease on the current job to another worker ---")
+                    return
+            except sqlite3.Error as e:
+                logger.warning(f"--- Heartbeat failed, will retry: {e} ---")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def default_worker_id():
+    """host:pid, unique per worker process on a machine."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def initialize_job_queue(config, run_fingerprint):
+    """Opens the job queue named by file_paths.job_queue_file, with lease settings from worker_settings."""
+    settings = config.get('worker_settings', {})
+    path = config['file_paths'].get('job_queue_file', 'job_queue.sqlite')
+    return JobQueue(path, run_fingerprint, settings.get('lease_seconds', 300), settings.get('max_attempts', 3))
@@ -0,0 +1,81 @@
+# json_stream.py
+
+import json
+
+class JSONObjectStream:
+    """
+    Incremental parser for model output that arrives in chunks. feed() returns
+    every top-level JSON object completed by the new text, so callers can act
+    on the first result while the rest is still streaming. Text outside
+    objects (prose, code fences, an enclosing array) is skipped. A candidate
+    that fails to parse, or is still open when finish() is called, is
+    rescanned from its next '{', so a stray brace in the prose costs at most
+    the object it swallowed.
+    """
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def _rescan(self, completed):
+        """Drops the current candidate's opening brace and scans the rest of it again."""
+        rest = "".join(self._buffer[1:])
+        self._reset()
+        completed.extend(self.feed(rest))
+
+    def feed(self, text):
+        completed = []
+        for i, char in enumerate(text):
+            if self._depth == 0:
+                if char == '{':
+                    self._buffer = [char]
+                    self._depth = 1
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        value = json.loads("".join(self._buffer))
+                    except json.JSONDecodeError:
+                        # Rescan the failed candidate, then carry on with the rest of this chunk
+                        self._buffer.extend(text[i + 1:])
+                        self._rescan(completed)
+                        return completed
+                    if isinstance(value, dict):
+                        completed.append(value)
+        return completed
+
+    def finish(self):
+        """Call when the stream ends: objects that an unclosed stray brace kept open, if any."""
+        completed = []
+        while self._depth > 0:
+            self._rescan(completed)
+        return completed
+
+
+def iter_json_objects(text):
+    """All top-level JSON objects in a complete piece of text, in order."""
+    parser = JSONObjectStream()
+    return parser.feed(text) + parser.finish()
+
+def first_json_object(text):
+    """The first JSON object in text, or None. Unlike a greedy {.*} match, it stops where that object ends."""
+    objects = iter_json_objects(text or "")
+    return objects[0] if objects else None
@@ -0,0 +1,182 @@
+# kiwi_network.py
+
+from datetime import date, datetime
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import TimeoutError as AsyncTimeoutError
+
+# Kiwi's search page loads calendar prices and itineraries from its GraphQL API.
+KIWI_API_MARKERS = ("/graphql", "umbrella", "api.skypicker.com")
+
+def is_kiwi_api_response(response):
+    """True for JSON responses from Kiwi's search API."""
+    url = response.url
+    if not any(marker in url for marker in KIWI_API_MARKERS):
+        return False
+    return "json" in response.headers.get('content-type', '')
+
+def _find_amount(value):
+    """Digs a numeric amount out of Kiwi's nested price objects ({"price": {"amount": "123"}} and friends)."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    if isinstance(value, dict):
+        for key in ('amount', 'price', 'ratedPrice', 'priceEur'):
+            if key in value:
+                amount = _find_amount(value[key])
+                if amount is not None:
+                    return amount
+    return None
+
+def _iter_dicts(payload):
+    """Yields every dict nested anywhere in a JSON payload."""
+    stack = [payload]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            yield node
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+
+def parse_price_calendar_payload(payload):
+    """Returns {YYYY-MM-DD: price} for every calendar day with a price in the payload."""
+    prices = {}
+    for node in _iter_dicts(payload):
+        day = node.get('date')
+        if not isinstance(day, str) or len(day) < 10:
+            continue
+        try:
+            full_date = date.fromisoformat(day[:10]).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+        amount = _find_amount(node.get('ratedPrice', node.get('price')))
+        if amount:
+            prices[full_date] = int(round(amount))
+    return prices
+
+def _local_time(stop):
+    """The localTime of a segment's source or destination, as a datetime."""
+    local_time = stop.get('localTime') if isinstance(stop, dict) else None
+    try:
+        return datetime.fromisoformat(local_time[:19])
+    except (TypeError, ValueError):
+        return None
+
+def parse_itineraries_payload(payload):
+    """
+    Returns one {departure_date, departure_time, arrival_time, price} flight per
+    itinerary in the payload. Arrival times on a later day get a "+1" suffix,
+    matching what the AI extraction produces.
+    """
+    flights = []
+    for node in _iter_dicts(payload):
+        sector = node.get('sector')
+        if not isinstance(sector, dict) or 'price' not in node:
+            continue
+        segments = [s.get('segment', s) for s in sector.get('sectorSegments', []) if isinstance(s, dict)]
+        if not segments:
+            continue
+        departure = _local_time(segments[0].get('source'))
+        arrival = _local_time(segments[-1].get('destination'))
+        price = _find_amount(node.get('price'))
+        if not departure or not arrival or not price:
+            continue
+
+        arrival_time = arrival.strftime("%H:%M")
+        if arrival.date() > departure.date():
+            arrival_time += "+1"
+        flights.append({
+            "departure_date": departure.strftime("%Y-%m-%d"),
+            "departure_time": departure.strftime("%H:%M"),
+            "arrival_time": arrival_time,
+            "price": int(round(price)),
+            "stops": len(segments) - 1
+        })
+    flights.sort(key=lambda x: x['price'])
+    return flights
+
+
+class KiwiResponseCapture:
+    """
+    Listens to a page's network responses and keeps the Kiwi API payloads, so
+    prices and itineraries can be read as soon as they arrive instead of
+    waiting for the page to render them. The response handler only queues
+    responses; bodies are read in process_pending, outside the event callback.
+    """
+    def __init__(self, page):
+        self.page = page
+        self.prices = {}
+        self.flights = []
+        self.payloads_seen = 0
+        self._pending = []
+        page.on("response", self._on_response)
+
+    def _on_response(self, response):
+        if is_kiwi_api_response(response):
+            self._pending.append(response)
+
+    def detach(self):
+        self.page.remove_listener("response", self._on_response)
+
+    def _ingest(self, payload):
+        self.payloads_seen += 1
+        self.prices.update(parse_price_calendar_payload(payload))
+        self.flights.extend(parse_itineraries_payload(payload))
+
+    def process_pending(self):
+        pending, self._pending = self._pending, []
+        for response in pending:
+            try:
+                self._ingest(response.json())
+            except Exception:
+                continue
+
+    async def process_pending_async(self):
+        pending, self._pending = self._pending, []
+        for response in pending:
+            try:
+                self._ingest(await response.json())
+            except Exception:
+                continue
+
+    def wait_for_payload(self, timeout_ms):
+        """Blocks until the next Kiwi API response arrives. Returns False on timeout."""
+        if self._pending:
+            return True
+        try:
+            self.page.wait_for_event("response", predicate=is_kiwi_api_response, timeout=timeout_ms)
+            return True
+        except PlaywrightTimeoutError:
+            return False
+
+    async def wait_for_payload_async(self, timeout_ms):
+        """Async version of wait_for_payload."""
+        if self._pending:
+            return True
+        try:
+            await self.page.wait_for_event("response", predicate=is_kiwi_api_response, timeout=timeout_ms)
+            return True
+        except AsyncTimeoutError:
+            return False
+
+    def prices_in_range(self, start_date, end_date):
+        """The captured prices between start_date and end_date as {full_date, price}, sorted by date."""
+        start, end = start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")
+        return [{"full_date": d, "price": p} for d, p in sorted(self.prices.items()) if start <= d <= end]
+
+    def covers(self, end_date):
+        return bool(self.prices) and max(self.prices) >= end_date.strftime("%Y-%m-%d")
+
+    def flights_on(self, departure_date):
+        """Captured flights departing on departure_date (YYYY-MM-DD), cheapest first."""
+        return sorted((f for f in self.flights if f['departure_date'] == departure_date), key=lambda x: x['price'])
+
+
+def get_capture_settings(config):
+    """(enabled, payload timeout in ms) for Kiwi response capture."""
+    browser_settings = config.get('browser_settings', {})
+    return browser_settings.get('capture_kiwi_responses', True), browser_settings.get('kiwi_response_timeout_seconds', 15) * 1000
@@ -0,0 +1,113 @@
+# llm_cache.py
+
+import logging
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from metrics import increment
+
+logger = logging.getLogger(__name__)
+
+# Request arguments that change how a call is sent but not what the model answers.
+TRANSPORT_PARAMS = {"timeout", "extra_headers", "extra_query", "stream"}
+
+def make_cache_key(request):
+    """
+    Content address of a chat completion request: a SHA-256 of its model,
+    messages and every other answer-affecting parameter, with keys sorted so
+    argument order does not matter.
+    """
+    relevant = {k: v for k, v in request.items() if k not in TRANSPORT_PARAMS}
+    canonical = json.dumps(relevant, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def completion_record(model, content):
+    """A chat completion dict holding content, for callers that assembled the text from a stream."""
+    return {
+        "id": "streamed-completion", "object": "chat.completion", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}]
+    }
+
+
+class LLMResponseCache:
+    """
+    On-disk cache of chat completion responses keyed by make_cache_key. Entries
+    expire after ttl_hours; beyond max_entries the least recently used ones
+    are evicted. Responses are stored as the provider's completion JSON, so
+    the SDK client and the plain HTTP client share entries.
+    """
+    def __init__(self, db_path, ttl_hours, max_entries):
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_responses_last_used ON llm_responses (last_used_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        """The cached response dict for key, or None if it is missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM llm_responses WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                increment("cache_lookups_total", cache="llm", result="miss")
+                return None
+            self._conn.execute("UPDATE llm_responses SET last_used_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        increment("cache_lookups_total", cache="llm", result="hit")
+        return json.loads(row[0])
+
+    def put(self, key, model, response):
+        """Stores a response dict, then drops expired and least recently used entries."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, model, response, created_at, last_used_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model, json.dumps(response, ensure_ascii=False), now, now)
+            )
+            self._conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._conn.execute(
+                "DELETE FROM llm_responses WHERE key IN (SELECT key FROM llm_responses ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        hit_rate = f", {self.hits / lookups:.0%} hit rate" if lookups else ""
+        return f"{self.hits} hits, {self.misses} misses{hit_rate}"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def initialize_llm_cache(config):
+    """Creates the LLM response cache from config, or returns None when it is disabled."""
+    cache_settings = config.get('cache_settings', {})
+    ttl_hours = cache_settings.get('llm_response_ttl_hours', 168)
+    if ttl_hours <= 0:
+        return None
+    db_path = config['file_paths'].get('llm_cache_file', 'llm_cache.sqlite')
+    max_entries = cache_settings.get('llm_cache_max_entries', 5000)
+    logger.info(f"--- Using LLM response cache '{db_path}' (TTL {ttl_hours}h, up to {max_entries} entries) ---")
+    return LLMResponseCache(db_path, ttl_hours, max_entries)
@@ -1,17 +1,81 @@
+import logging
 import json
 import os
-import time
-from datetime import date, timedelta, datetime, time as time_obj
+import asyncio
+from datetime import date, timedelta, datetime
+from contextlib import contextmanager
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import async_playwright
 import sys
 import random
+import re
+import time
+import argparse
 
 # Correct import for playwright-stealth version 1.0.6
-from playwright_stealth import stealth_sync
+from playwright_stealth import stealth_sync, stealth_async
 
 from api_handler import initialize_client
-from flight_scraper import get_daily_prices_from_graph, get_detailed_flight_info
-from airbnb_scraper import get_cheapest_accommodations, get_listing_calendar_availability
+from browser_daemon import USER_AGENT, connect_to_daemon, connect_to_daemon_async
+from flight_scraper import get_daily_prices, extract_flights_batch, get_daily_prices_async, extract_flights_batch_async
+from detail_pages import DetailPagePool, AsyncDetailPagePool, get_detail_tabs
+from price_cache import initialize_price_cache
+from results_db import initialize_results_db
+from checkpoint_journal import CheckpointJournal, initialize_checkpoint_journal, run_fingerprint, scoring_fingerprint, fingerprint
+from job_queue import Heartbeat, initialize_job_queue, default_worker_id
+from request_router import initialize_request_router
+from pacing import get_pacer
+from airbnb_sampling import AirbnbSampler
+from destination_scheduler import DestinationScheduler
+from trip_engine import calculate_exploration_hours, build_trip_candidates, match_accommodation_costs, score_trip_candidates, cost_per_hour_lower_bound
+from airbnb_scraper import get_cheapest_accommodations, get_listing_calendar_availability, get_cheapest_accommodations_async, get_listing_calendar_availability_async
+from structured_logging import setup_logging, log_context, log_phase, log_ai_response, current_destination
+from metrics import span, export_metrics
+from streaming import publish, streaming_run
+
+logger = logging.getLogger(__name__)
+
+@contextmanager
+def pipeline_phase(phase):
+    """Tags, logs, traces and streams one phase of a destination's search."""
+    publish("phase", destination=current_destination(), phase=phase, status="started")
+    with log_phase(logger, phase), span(f"phase:{phase}"):
+        yield
+    publish("phase", destination=current_destination(), phase=phase, status="finished")
+
+def open_browser_context(p, config):
+    """
+    The browser daemon's persistent-profile context when the daemon is
+    running, so cookies, cache and consent carry over between runs, or a
+    new context in a freshly launched browser.
+    """
+    browser = connect_to_daemon(p, config)
+    if browser is not None:
+        return browser.contexts[0] if browser.contexts else browser.new_context(user_agent=USER_AGENT)
+    browser = p.chromium.launch(headless=config.get('browser_settings', {}).get('headless', True))
+    return browser.new_context(user_agent=USER_AGENT)
+
+def open_stealth_page(context, request_router):
+    """A stealth-patched page in context that routes requests through request_router."""
+    request_router.install(context)
+    page = context.new_page()
+    stealth_sync(page)
+    return page
+
+def close_stealth_page(page):
+    """
+    Closes the page, then its browser. A local browser is shut down; from the
+    daemon's it only disconnects, so the tab is closed first.
+    """
+    browser = page.context.browser
+    page.close()
+    browser.close()
+
+async def open_stealth_tab_async(page):
+    """Another stealth-patched tab in page's browser context, sharing its request routing."""
+    tab = await page.context.new_page()
+    await stealth_async(tab)
+    return tab
 
 def load_config():
     """Loads config.json."""
@@ -25,276 +89,637 @@ def load_config():
         print("FATAL ERROR: config.json is invalid.")
         sys.exit(1)
 
-def log_api_response(response_data, function_name, file_path):
-    """Logs AI responses."""
-    try:
-        with open(file_path, "a", encoding="utf-8") as f:
-            f.write(f"--- Log from {function_name} at {time.ctime()} ---\n")
-            if isinstance(response_data, dict):
-                f.write(json.dumps(response_data, indent=2))
-            else:
-                f.write(str(response_data))
-            f.write("\n---\n\n")
-    except Exception as e:
-        print(f" - Warning: Could not write log. Error: {e}")
-
-def calculate_exploration_hours(outbound_arrival_str, return_departure_str, num_nights, config):
-    """Calculates usable exploration hours."""
-    day_starts = time_obj(config['search_parameters'].get('day_starts_at_hour', 8), 0)
-    day_ends = time_obj(config['search_parameters'].get('day_ends_at_hour', 21), 0)
-    buffer = config['search_parameters'].get('airport_buffer_hours', 2)
-    try:
-        def parse_time(time_str):
-            if "+1" in time_str: return datetime.strptime(time_str.split('+')[0], "%H:%M").time(), True
-            return datetime.strptime(time_str, "%H:%M").time(), False
-
-        outbound_arrival, _ = parse_time(outbound_arrival_str)
-        return_departure, _ = parse_time(return_departure_str)
-        
-        outbound_arrival_hours = outbound_arrival.hour + outbound_arrival.minute / 60.0
-        return_departure_hours = return_departure.hour + return_departure.minute / 60.0
-        day_starts_hours, day_ends_hours = day_starts.hour, day_ends.hour
-        
-        explore_starts = max(day_starts_hours, outbound_arrival_hours + buffer)
-        explore_ends = min(day_ends_hours, return_departure_hours - buffer)
-
-        if num_nights == 0:
-            total_hours = max(0, explore_ends - explore_starts)
-        else:
-            arrival_day_hours = max(0, day_ends_hours - explore_starts)
-            departure_day_hours = max(0, explore_ends - day_starts_hours)
-            full_day_count = max(0, num_nights - 1)
-            full_day_hours = full_day_count * (day_ends_hours - day_starts_hours)
-            total_hours = arrival_day_hours + departure_day_hours + full_day_hours
+def iter_enabled_destinations(config):
+    """Yields (dest_id, dest_name) for every city in an enabled country."""
+    for country_name, country_data in config['destinations'].items():
+        if not country_data.get("enabled", False):
+            continue
+        for dest_id, dest_name in country_data.get("cities", {}).items():
+            yield dest_id, dest_name
 
-        return round(total_hours, 2)
-    except (ValueError, IndexError, TypeError):
-        return 0.0
+def get_max_num_nights(params):
+    """Longest stay, in nights, allowed by max_trip_duration_days."""
+    max_trip_duration_days = params.get('max_trip_duration_days', 7)
+    return max(0, max_trip_duration_days - 1)
 
-def main():
-    config = load_config()
-    client = initialize_client(config)
-    
+def generate_trip_combinations(all_outbound_prices, all_return_prices, config):
+    """Phase 2: pairs outbound and return prices into trips within the allowed length."""
     params = config['search_parameters']
-    paths = config['file_paths']
-    log_func = lambda response, name: log_api_response(response, name, paths['log_file'])
+    return build_trip_candidates(all_outbound_prices, all_return_prices, get_max_num_nights(params), config,
+                                 top_k=params.get('num_combinations_to_keep', 500))
 
-    try:
-        start_date = datetime.strptime(params['start_date'], "%Y-%m-%d").date()
-    except (ValueError, TypeError):
-        start_date = date.today() + timedelta(days=1)
-    
-    print(f"--- Starting Trip Search ---")
-    
+def get_unique_listing_links(listings_by_duration):
+    """Phase 4 input: every listing link found across the sampled durations."""
+    all_unique_listing_links = set()
+    for duration_listings in listings_by_duration.values():
+        for listing in duration_listings:
+            all_unique_listing_links.add(listing['link'])
+    return all_unique_listing_links
+
+def estimate_trip_costs(potential_trips_raw, listings_by_duration, airbnb_calendar_cache, config):
+    """Phase 5: matches an available listing to each trip and ranks trips by estimated cost per hour."""
+    num_candidates_to_validate = config['search_parameters'].get('num_candidates_to_validate', 5)
+    accommodation_costs, matched_listings = match_accommodation_costs(potential_trips_raw, listings_by_duration, airbnb_calendar_cache)
+    return score_trip_candidates(potential_trips_raw, accommodation_costs, matched_listings, top_k=num_candidates_to_validate)
+
+def build_validated_trip(dest_name, trip_candidate, outbound_flights, return_flights, config):
+    """Phase 6: scores a candidate from its real flights. Returns None if it no longer qualifies."""
+    min_exploration_hours = config['search_parameters'].get('min_exploration_hours', 10)
+    cheapest_outbound, cheapest_return = outbound_flights[0], return_flights[0]
+    actual_flight_cost = cheapest_outbound.get('price', 0) + cheapest_return.get('price', 0)
+
+    exploration_hours = calculate_exploration_hours(cheapest_outbound.get('arrival_time', '00:00'), cheapest_return.get('departure_time', '00:00'), trip_candidate['num_nights'], config)
+
+    if exploration_hours < min_exploration_hours:
+        return None
+
+    actual_accommodation_details = trip_candidate['matched_airbnb_listing']
+    actual_total_accommodation_cost = actual_accommodation_details.get('total_accommodation_cost', 0) if actual_accommodation_details else 0
+    # The listing was priced for a sampled stay; candidates scored from per-night prices carry their own estimate,
+    # which the emitted listing then shows too so the totals add up. The sampled stay's price is kept alongside.
+    estimated_accommodation_cost = trip_candidate.get('estimated_accommodation_cost')
+    if estimated_accommodation_cost is not None and estimated_accommodation_cost != actual_total_accommodation_cost:
+        if actual_accommodation_details:
+            actual_accommodation_details = {**actual_accommodation_details,
+                                            "total_accommodation_cost": estimated_accommodation_cost,
+                                            "sampled_accommodation_cost": actual_total_accommodation_cost}
+        actual_total_accommodation_cost = estimated_accommodation_cost
+
+    total_cost = actual_flight_cost + actual_total_accommodation_cost
+    cost_per_hour = total_cost / exploration_hours if exploration_hours > 0 else float('inf')
+
+    if cost_per_hour == float('inf'): return None
+
+    logger.info(f" - ✅ Valid trip found!")
+    return {
+        "destination": dest_name, "outbound_date": trip_candidate['outbound_date'], "return_date": trip_candidate['return_date'],
+        "total_cost": round(total_cost, 2), "cost_per_hour_of_exploration": round(cost_per_hour, 2), "exploration_hours": exploration_hours,
+        "flights": {"total_price": actual_flight_cost, "outbound": cheapest_outbound, "return": cheapest_return},
+        "accommodation": actual_accommodation_details}
+
+class TripValidation:
+    """
+    Phase 6 bookkeeping shared by the sync and async runners. Each flight leg's
+    results page is scraped once. Pages that have to go through the AI are
+    extracted in batches of api_settings.extraction_batch_size, and a candidate
+    is validated as soon as both of its legs are known. Every leg's flights are
+    checkpointed in the journal.
+    """
+    def __init__(self, dest_id, dest_name, config, journal):
+        self.origin = config['search_parameters']['origin_city_id']
+        self.dest_id = dest_id
+        self.dest_name = dest_name
+        self.config = config
+        self.journal = journal
+        self.batch_size = max(1, config['api_settings'].get('extraction_batch_size', 4))
+        self.flights_by_leg = {}
+        self.pages_to_extract = {}
+        self.waiting = []
+        self.results = []
+        self.best_cost_per_hour = float('inf')
+
+    def legs(self, trip_candidate):
+        """(origin, destination, date) of the outbound and return flights."""
+        return [(self.origin, self.dest_id, trip_candidate['outbound_date']), (self.dest_id, self.origin, trip_candidate['return_date'])]
+
+    @staticmethod
+    def leg_key(leg):
+        origin, destination, departure_date = leg
+        return f"{origin}>{destination}@{departure_date}"
+
+    def is_pruned(self, trip_candidate):
+        return trip_candidate['estimated_cost_per_hour'] >= self.best_cost_per_hour
+
+    def legs_to_scrape(self, trip_candidate):
+        """Legs that still need their results page, stopping at a leg known to have no flights."""
+        for leg in self.legs(trip_candidate):
+            if leg not in self.flights_by_leg and leg not in self.pages_to_extract:
+                checkpointed = self.journal.get(self.dest_id, "flights", self.leg_key(leg))
+                if checkpointed is not None:
+                    self.flights_by_leg[leg] = checkpointed
+                else:
+                    yield leg
+            if self.flights_by_leg.get(leg) == []:
+                return
+
+    def record_scrape(self, leg, flights, results_text):
+        if flights is not None:
+            self.flights_by_leg[leg] = flights
+            self.journal.record(self.dest_id, "flights", flights, self.leg_key(leg))
+        else:
+            self.pages_to_extract[leg] = (leg[2], results_text)
+
+    def plan_wave(self, candidates, size):
+        """
+        Splits the candidates (cheapest estimate first) into those whose legs
+        are all scraped, up to size distinct legs to scrape next, and the rest.
+        Stops at the first candidate whose estimate can no longer beat the best
+        validated trip. Returns (ready, wave, remaining).
+        """
+        ready, wave, remaining = [], [], []
+        for i, trip_candidate in enumerate(candidates):
+            if self.is_pruned(trip_candidate):
+                break
+            legs = list(self.legs_to_scrape(trip_candidate))
+            if not legs:
+                ready.append(trip_candidate)
+                continue
+            new_legs = [leg for leg in legs if leg not in wave]
+            if wave and len(wave) + len(new_legs) > size:
+                remaining.extend(candidates[i:])
+                break
+            wave.extend(new_legs)
+            remaining.append(trip_candidate)
+        return ready, wave, remaining
+
+    def add_candidate(self, trip_candidate):
+        """Validates the candidate now or queues it for its pending legs. Returns True when a batch is due."""
+        legs = self.legs(trip_candidate)
+        if all(leg in self.flights_by_leg for leg in legs):
+            self._validate(trip_candidate)
+        elif not any(self.flights_by_leg.get(leg) == [] for leg in legs):
+            self.waiting.append(trip_candidate)
+        return len(self.pages_to_extract) >= self.batch_size
+
+    def take_batch(self):
+        pages, self.pages_to_extract = self.pages_to_extract, {}
+        return pages
+
+    def record_extraction(self, leg, flights):
+        """Stores a leg's extracted flights and validates every queued candidate it completes."""
+        if flights:
+            self.journal.record(self.dest_id, "flights", flights, self.leg_key(leg))
+        else:
+            logger.error(f"        - ❌ No flights could be extracted for {leg[0]} -> {leg[1]} on {leg[2]}.")
+        self.flights_by_leg[leg] = flights
+        for trip_candidate in [c for c in self.waiting if all(l in self.flights_by_leg for l in self.legs(c))]:
+            self.waiting.remove(trip_candidate)
+            self._validate(trip_candidate)
+
+    def _validate(self, trip_candidate):
+        outbound_flights, return_flights = (self.flights_by_leg[leg] for leg in self.legs(trip_candidate))
+        if not outbound_flights or not return_flights:
+            return
+        validated_trip = build_validated_trip(self.dest_name, trip_candidate, outbound_flights, return_flights, self.config)
+        if validated_trip:
+            self.results.append(validated_trip)
+            publish("trip", **validated_trip)
+            self.best_cost_per_hour = min(self.best_cost_per_hour, validated_trip['cost_per_hour_of_exploration'])
+
+def validate_trip_candidates(detail_pages, client, dest_id, dest_name, top_candidates, config, log_func, journal):
+    """
+    Phase 6: checks the top candidates against real flights, cheapest estimate
+    first. The distinct flight legs they need are loaded a wave at a time
+    through detail_pages. Returns the valid trips.
+    """
+    validation = TripValidation(dest_id, dest_name, config, journal)
+    remaining = list(top_candidates)
+    while remaining:
+        ready, wave, remaining = validation.plan_wave(remaining, detail_pages.tabs)
+        if ready:
+            # Validate what is known first; it may prune the candidates the wave was for.
+            for trip_candidate in ready:
+                if validation.add_candidate(trip_candidate):
+                    for leg, flights in extract_flights_batch(client, validation.take_batch(), config, log_func):
+                        validation.record_extraction(leg, flights)
+            continue
+        for leg, scraped in detail_pages.fetch(wave, config, log_func):
+            validation.record_scrape(leg, *scraped)
+
+    for leg, flights in extract_flights_batch(client, validation.take_batch(), config, log_func):
+        validation.record_extraction(leg, flights)
+    return validation.results
+
+async def validate_trip_candidates_async(detail_pages, client, dest_id, dest_name, top_candidates, config, log_func, journal):
+    """Async version of validate_trip_candidates."""
+    validation = TripValidation(dest_id, dest_name, config, journal)
+    remaining = list(top_candidates)
+    while remaining:
+        ready, wave, remaining = validation.plan_wave(remaining, detail_pages.tabs)
+        if ready:
+            for trip_candidate in ready:
+                if validation.add_candidate(trip_candidate):
+                    async for leg, flights in extract_flights_batch_async(client, validation.take_batch(), config, log_func):
+                        validation.record_extraction(leg, flights)
+            continue
+        async for leg, scraped in detail_pages.fetch(wave, config, log_func):
+            validation.record_scrape(leg, *scraped)
+
+    async for leg, flights in extract_flights_batch_async(client, validation.take_batch(), config, log_func):
+        validation.record_extraction(leg, flights)
+    return validation.results
+
+def validate_stored_trip_candidates(dest_id, dest_name, top_candidates, config, journal):
+    """
+    Phase 6 from the flights checkpointed in the journal alone, without
+    loading a page. Candidates with a leg that was never scraped are left
+    out. Returns (valid trips, number of candidates left out).
+    """
+    validation = TripValidation(dest_id, dest_name, config, journal)
+    left_out = 0
+    for trip_candidate in top_candidates:
+        if validation.is_pruned(trip_candidate):
+            break
+        if any(True for _ in validation.legs_to_scrape(trip_candidate)):
+            left_out += 1
+            continue
+        validation.add_candidate(trip_candidate)
+    return validation.results, left_out
+
+def select_final_results(final_results_for_dest, params):
+    """Keeps the best num_final_results_to_store trips for a destination."""
+    final_results_for_dest.sort(key=lambda x: x.get('cost_per_hour_of_exploration', float('inf')))
+    return final_results_for_dest[:params.get('num_final_results_to_store', 3)]
+
+def save_results(all_results, results_file):
+    """Writes all destination results to the results file, replacing it in one step so a crash cannot leave it half-written."""
+    temp_file = f"{results_file}.tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump(all_results, f, indent=2, ensure_ascii=False)
+    os.replace(temp_file, results_file)
+
+def load_previous_results(results_file):
+    """Loads results saved by earlier runs, if any."""
     all_results = {}
-    if os.path.exists(paths['results_file']):
+    if os.path.exists(results_file):
         try:
-            with open(paths['results_file'], "r", encoding="utf-8") as f:
+            with open(results_file, "r", encoding="utf-8") as f:
                 all_results = json.load(f)
-            print(f"--- Loaded {len(all_results)} previous results ---")
+            logger.info(f"--- Loaded {len(all_results)} previous results ---")
         except json.JSONDecodeError:
             all_results = {}
+    return all_results
 
-    with sync_playwright() as p:
-        user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"
-        
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page(user_agent=user_agent)
-        
-        # Apply stealth settings to the page
-        stealth_sync(page)
-        
-        print("--- Browser session started with stealth options ---")
+def load_resumable_results(results_file, journal):
+    """Earlier runs' results plus the trips checkpointed in the journal."""
+    all_results = load_previous_results(results_file)
+    all_results.update(journal.results())
+    return all_results
 
-        try:
-            for country_name, country_data in config['destinations'].items():
-                if not country_data.get("enabled", False):
-                    continue
+def candidates_inputs(journal, dest_id, config):
+    """Fingerprint of what Phases 2-5 rank a destination's candidates from: their parameters and the stored scraped data."""
+    listings_by_nights = get_stored_listings(journal, dest_id, config)
+    listing_links = sorted(get_unique_listing_links(listings_by_nights or {}))
+    return scoring_fingerprint(config, "candidates", [
+        journal.digest(dest_id, "outbound_prices"), journal.digest(dest_id, "return_prices"),
+        None if listings_by_nights is None else fingerprint(sorted(listings_by_nights.items())),
+        [journal.digest(dest_id, "calendar", listing_link) for listing_link in listing_links]])
 
-                for dest_id, dest_name in country_data.get("cities", {}).items():
-                    if dest_name in all_results:
-                        print(f"\n--- Skipping: {dest_name} ---")
-                        continue
+def results_inputs(journal, dest_id, config):
+    """Fingerprint of what Phase 6 validates a destination's trips from: the ranked candidates and their stored flights."""
+    origin = config['search_parameters']['origin_city_id']
+    ranked_inputs = candidates_inputs(journal, dest_id, config)
+    top_candidates = journal.get(dest_id, "candidates", inputs=ranked_inputs) or []
+    leg_keys = sorted({TripValidation.leg_key(leg) for trip_candidate in top_candidates
+                       for leg in ((origin, dest_id, trip_candidate['outbound_date']), (dest_id, origin, trip_candidate['return_date']))})
+    return scoring_fingerprint(config, "results", [
+        ranked_inputs, journal.digest(dest_id, "candidates", inputs=ranked_inputs),
+        [journal.digest(dest_id, "flights", leg_key) for leg_key in leg_keys]])
 
-                    print(f"\n--- Processing: {dest_name} ---")
-                
-                    # Phase 1: Get flight prices
-                    all_outbound_prices = get_daily_prices_from_graph(page, params['origin_city_id'], dest_id, start_date, config, log_func)
-                    all_return_prices = get_daily_prices_from_graph(page, dest_id, params['origin_city_id'], start_date, config, log_func)
-                    
-                    if not all_outbound_prices or not all_return_prices:
-                        print(f" - No flight data for {dest_name}.")
-                        continue
-                    
-                    # Phase 2: Generate trip combinations
-                    potential_trips_raw = []
-                    max_trip_duration_days = params.get('max_trip_duration_days', 7) 
-                    max_num_nights = max(0, max_trip_duration_days - 1)
-
-                    for ob in all_outbound_prices:
-                        for ret in all_return_prices:
-                            try:
-                                ob_date = datetime.strptime(ob['full_date'], "%Y-%m-%d").date()
-                                ret_date = datetime.strptime(ret['full_date'], "%Y-%m-%d").date()
-                                num_nights = (ret_date - ob_date).days
-
-                                if 0 <= num_nights <= max_num_nights:
-                                    potential_trips_raw.append({
-                                        "outbound_date": ob_date.strftime("%Y-%m-%d"),
-                                        "return_date": ret_date.strftime("%Y-%m-%d"),
-                                        "estimated_flight_cost": ob['price'] + ret['price'],
-                                        "num_nights": num_nights
-                                    })
-                            except (ValueError, TypeError):
-                                continue
-                    
-                    if not potential_trips_raw:
-                        print(" - No valid flight combinations.")
-                        continue
+def is_destination_current(journal, all_results, dest_id, dest_name, config):
+    """
+    True if a destination's checkpointed trips were computed from the current
+    parameters and scraped data. Results the journal knows nothing about (from
+    before it kept its inputs, or from workers) are kept as they are.
+    """
+    if journal.get(dest_id, "results", inputs=results_inputs(journal, dest_id, config)) is not None:
+        return True
+    return dest_name in all_results and not journal.has_destination(dest_id)
 
-                    # Phase 3: Search Airbnb
-                    all_sample_durations = [1, 2, 3, 5, 7, 10, 14]
-                    common_airbnb_durations = [d for d in all_sample_durations if d <= max_num_nights]
-                    
-                    top_initial_airbnb_listings_by_duration = {} 
-                    sample_airbnb_checkin = start_date.strftime("%Y-%m-%d")
-
-                    for duration in common_airbnb_durations:
-                        sample_airbnb_checkout = (datetime.strptime(sample_airbnb_checkin, "%Y-%m-%d").date() + timedelta(days=duration)).strftime("%Y-%m-%d")
-                        accommodations = get_cheapest_accommodations(
-                            page=page, destination_city=dest_name, specific_location_query=dest_name, 
-                            checkin=sample_airbnb_checkin, checkout=sample_airbnb_checkout,
-                            config=config, log_func=log_func
-                        )
-                        if accommodations:
-                            top_initial_airbnb_listings_by_duration[duration] = accommodations
-                    
-                    if not top_initial_airbnb_listings_by_duration:
-                        print(" - No Airbnb listings found.")
-                        continue
+def record_skipped_destination(journal, all_results, dest_id, dest_name, config):
+    """
+    Checkpoints a destination the scheduler skipped. Its earlier trips no
+    longer apply, but the skip depends on the other destinations' results, so
+    like partial results it never counts as current and later runs reconsider it.
+    """
+    all_results.pop(dest_name, None)
+    journal.record(dest_id, "results", {"dest_name": dest_name, "trips": []},
+                   inputs=fingerprint(["skipped", results_inputs(journal, dest_id, config)]))
+    publish("destination", destination=dest_name, status="skipped", trips=[])
 
-                    # Phase 4: Scan Airbnb calendars
-                    airbnb_calendar_cache = {}
-                    search_calendar_months = params.get('airbnb_calendar_months_to_scan', 6)
-                    all_unique_listing_links = set()
-                    for duration_listings in top_initial_airbnb_listings_by_duration.values():
-                        for listing in duration_listings:
-                            all_unique_listing_links.add(listing['link'])
-                    
-                    for listing_link in all_unique_listing_links:
-                        calendar_data = get_listing_calendar_availability(page, listing_link, search_calendar_months)
-                        if calendar_data:
-                            airbnb_calendar_cache[listing_link] = calendar_data
-                        else:
-                            airbnb_calendar_cache[listing_link] = {}
-                    
-                    # Phase 5: Estimate total costs
-                    potential_trips_with_estimates = []
-                    min_exploration_hours = params.get('min_exploration_hours', 10)
-
-                    for trip in potential_trips_raw:
-                        num_nights = trip['num_nights']
-                        
-                        rough_exploration_hours = calculate_exploration_hours("12:00", "12:00", num_nights, config)
-                        if rough_exploration_hours < min_exploration_hours:
-                            continue
-
-                        chosen_airbnb_for_estimation = None
-                        if num_nights > 0:
-                            if not top_initial_airbnb_listings_by_duration: continue
-                            best_duration_match = min(top_initial_airbnb_listings_by_duration.keys(), key=lambda d: abs(d - num_nights))
-                            
-                            for cached_listing in top_initial_airbnb_listings_by_duration[best_duration_match]:
-                                listing_calendar = airbnb_calendar_cache.get(cached_listing['link'])
-                                if listing_calendar:
-                                    all_dates_available = True
-                                    current_date = datetime.strptime(trip['outbound_date'], "%Y-%m-%d").date()
-                                    while current_date < datetime.strptime(trip['return_date'], "%Y-%m-%d").date():
-                                        if not listing_calendar.get(current_date.strftime("%Y-%m-%d"), False):
-                                            all_dates_available = False
-                                            break
-                                        current_date += timedelta(days=1)
-                                    if all_dates_available:
-                                        chosen_airbnb_for_estimation = cached_listing
-                                        break
-                            if not chosen_airbnb_for_estimation:
-                                continue
-                        else:
-                            chosen_airbnb_for_estimation = {"name": "N/A (Day Trip)", "total_accommodation_cost": 0, "link": "N/A", "rating": "N/A"}
-
-                        estimated_total_accommodation_cost = chosen_airbnb_for_estimation.get('total_accommodation_cost', 0)
-                        estimated_total_cost = trip['estimated_flight_cost'] + estimated_total_accommodation_cost
-                        estimated_cost_per_hour = estimated_total_cost / rough_exploration_hours if rough_exploration_hours > 0 else float('inf')
-
-                        if estimated_cost_per_hour != float('inf'):
-                            potential_trips_with_estimates.append({**trip, 
-                                "estimated_total_cost": estimated_total_cost, 
-                                "estimated_cost_per_hour": estimated_cost_per_hour, 
-                                "matched_airbnb_listing": chosen_airbnb_for_estimation})
-
-                    potential_trips_with_estimates.sort(key=lambda x: x['estimated_cost_per_hour'])
-
-                    # Phase 6: Detailed validation
-                    final_results_for_dest = []
-                    best_cost_per_hour_overall = float('inf')
-                    num_candidates_to_validate = params.get('num_candidates_to_validate', 5)
-                    top_candidates = potential_trips_with_estimates[:num_candidates_to_validate]
-
-                    for trip_candidate in top_candidates:
-                        if trip_candidate['estimated_cost_per_hour'] >= best_cost_per_hour_overall:
-                            break
-
-                        outbound_flights = get_detailed_flight_info(page, params['origin_city_id'], dest_id, trip_candidate['outbound_date'], client, config, log_func)
-                        if not outbound_flights: continue
-                        return_flights = get_detailed_flight_info(page, dest_id, params['origin_city_id'], trip_candidate['return_date'], client, config, log_func)
-                        if not return_flights: continue
-                        
-                        cheapest_outbound, cheapest_return = outbound_flights[0], return_flights[0]
-                        actual_flight_cost = cheapest_outbound.get('price', 0) + cheapest_return.get('price', 0)
-                        
-                        exploration_hours = calculate_exploration_hours(cheapest_outbound.get('arrival_time', '00:00'), cheapest_return.get('departure_time', '00:00'), trip_candidate['num_nights'], config)
-                        
-                        if exploration_hours < min_exploration_hours:
-                            continue
-                        
-                        actual_accommodation_details = trip_candidate['matched_airbnb_listing']
-                        actual_total_accommodation_cost = actual_accommodation_details.get('total_accommodation_cost', 0) if actual_accommodation_details else 0
-                        
-                        total_cost = actual_flight_cost + actual_total_accommodation_cost
-                        cost_per_hour = total_cost / exploration_hours if exploration_hours > 0 else float('inf')
-
-                        if cost_per_hour == float('inf'): continue
-                        
-                        print(f" - ✅ Valid trip found!")
-                        final_results_for_dest.append({
-                            "destination": dest_name, "outbound_date": trip_candidate['outbound_date'], "return_date": trip_candidate['return_date'],
-                            "total_cost": round(total_cost, 2), "cost_per_hour_of_exploration": round(cost_per_hour, 2), "exploration_hours": exploration_hours,
-                            "flights": {"total_price": actual_flight_cost, "outbound": cheapest_outbound, "return": cheapest_return},
-                            "accommodation": actual_accommodation_details})
-                        best_cost_per_hour_overall = min(best_cost_per_hour_overall, cost_per_hour)
-                    
-                    if final_results_for_dest:
-                        final_results_for_dest.sort(key=lambda x: x.get('cost_per_hour_of_exploration', float('inf')))
-                        all_results[dest_name] = final_results_for_dest[:params.get('num_final_results_to_store', 3)]
-                        with open(paths['results_file'], "w", encoding="utf-8") as f:
-                            json.dump(all_results, f, indent=2, ensure_ascii=False)
-                            print(f"\n--- Saved results for {dest_name} ---")
-                    else:
-                        print(f"\n--- No valid trips for {dest_name} ---")
+def record_destination_results(journal, all_results, dest_id, dest_name, dest_results, config, partial=False):
+    """
+    Checkpoints a finished destination with the fingerprint of its inputs.
+    Partial results (some candidates could not be checked) never count as
+    current. The results file itself is only written when the run ends.
+    """
+    inputs = results_inputs(journal, dest_id, config)
+    journal.record(dest_id, "results", {"dest_name": dest_name, "trips": dest_results or []},
+                   inputs=fingerprint(["partial", inputs]) if partial else inputs)
+    if dest_results:
+        all_results[dest_name] = dest_results
+        logger.info(f"\n--- Checkpointed results for {dest_name} ---")
+    else:
+        # Trips found from earlier inputs no longer apply.
+        all_results.pop(dest_name, None)
+        logger.info(f"\n--- No valid trips for {dest_name} ---")
+    publish("destination", destination=dest_name, status="finished", trips=dest_results or [])
 
-        except (PlaywrightTimeoutError, Exception) as e:
-            # Catch any Playwright timeout or other unexpected error
-            error_type = type(e).__name__
-            print(f"\n--- A FATAL {error_type.upper()} OCCURRED ---")
-            print(f"--- Error Details: {e} ---")
-            screenshot_path = "error_screenshot.png"
-            page.screenshot(path=screenshot_path)
-            print(f"--- Screenshot saved to '{screenshot_path}'. It will be uploaded as a workflow artifact. ---")
-            raise # Re-raise the exception to fail the workflow
+def get_start_date(params):
+    """Parses start_date from the config, defaulting to tomorrow."""
+    try:
+        return datetime.strptime(params['start_date'], "%Y-%m-%d").date()
+    except (ValueError, TypeError):
+        return date.today() + timedelta(days=1)
+
+def get_destination_prices(page, dest_id, start_date, config, log_func, price_cache, journal):
+    """Phase 1: the outbound and return price graphs for a destination, checkpointed in the journal."""
+    origin = config['search_parameters']['origin_city_id']
+    all_outbound_prices = journal.get(dest_id, "outbound_prices")
+    if all_outbound_prices is None:
+        all_outbound_prices = get_daily_prices(page, origin, dest_id, start_date, config, log_func, price_cache)
+        journal.record(dest_id, "outbound_prices", all_outbound_prices)
+    all_return_prices = journal.get(dest_id, "return_prices")
+    if all_return_prices is None:
+        all_return_prices = get_daily_prices(page, dest_id, origin, start_date, config, log_func, price_cache)
+        journal.record(dest_id, "return_prices", all_return_prices)
+    return all_outbound_prices, all_return_prices
+
+async def get_destination_prices_async(page, dest_id, start_date, config, log_func, price_cache, journal):
+    """Async version of get_destination_prices."""
+    origin = config['search_parameters']['origin_city_id']
+    all_outbound_prices = journal.get(dest_id, "outbound_prices")
+    if all_outbound_prices is None:
+        all_outbound_prices = await get_daily_prices_async(page, origin, dest_id, start_date, config, log_func, price_cache)
+        journal.record(dest_id, "outbound_prices", all_outbound_prices)
+    all_return_prices = journal.get(dest_id, "return_prices")
+    if all_return_prices is None:
+        all_return_prices = await get_daily_prices_async(page, dest_id, origin, start_date, config, log_func, price_cache)
+        journal.record(dest_id, "return_prices", all_return_prices)
+    return all_outbound_prices, all_return_prices
+
+def destination_lower_bound(all_outbound_prices, all_return_prices, config):
+    """Best cost per exploration hour a destination could reach given only its flight prices."""
+    if not all_outbound_prices or not all_return_prices:
+        return float('inf')
+    return cost_per_hour_lower_bound(all_outbound_prices, all_return_prices, get_max_num_nights(config['search_parameters']), config)
+
+def plan_airbnb_searches(journal, dest_id, potential_trips_raw, config):
+    """Phase 3's search plan for the candidates, reusing the Airbnb searches already checkpointed for the destination."""
+    stored = {}
+    for key, listings in journal.items(dest_id, "listings").items():
+        checkin, nights = key.split("+")
+        stored[(date.fromisoformat(checkin).toordinal(), int(nights))] = listings
+    return AirbnbSampler(potential_trips_raw, config, stored)
+
+def get_stored_listings(journal, dest_id, config):
+    """
+    Phase 3's {nights: listings} from the checkpointed Airbnb searches alone,
+    or None if the prices are missing or a planned stay needs a new search.
+    """
+    all_outbound_prices, all_return_prices = journal.get(dest_id, "outbound_prices"), journal.get(dest_id, "return_prices")
+    if not all_outbound_prices or not all_return_prices:
+        return None
+    potential_trips_raw = generate_trip_combinations(all_outbound_prices, all_return_prices, config)
+    if not potential_trips_raw:
+        return {}
+    sampler = plan_airbnb_searches(journal, dest_id, potential_trips_raw, config)
+    for _ in sampler:
+        return None
+    return sampler.listings_by_nights
+
+def get_stored_trip_inputs(journal, dest_id, config):
+    """
+    (outbound prices, return prices, listings by nights, calendars) as
+    checkpointed with the current parameters, or None if any was not.
+    """
+    all_outbound_prices, all_return_prices = journal.get(dest_id, "outbound_prices"), journal.get(dest_id, "return_prices")
+    if all_outbound_prices is None or all_return_prices is None:
+        return None
+    if not all_outbound_prices or not all_return_prices:
+        return all_outbound_prices, all_return_prices, {}, {}
+    listings_by_nights = get_stored_listings(journal, dest_id, config)
+    if listings_by_nights is None:
+        return None
+    airbnb_calendar_cache = {link: journal.get(dest_id, "calendar", link) for link in get_unique_listing_links(listings_by_nights)}
+    if None in airbnb_calendar_cache.values():
+        return None
+    return all_outbound_prices, all_return_prices, listings_by_nights, airbnb_calendar_cache
+
+def find_trip_candidates(page, dest_id, dest_name, start_date, config, log_func, price_cache, journal):
+    """Runs Phases 1-5 for one destination, checkpointing each step. Returns the candidates to validate, or None."""
+    params = config['search_parameters']
+
+    # Phase 1: Get flight prices (usually already scraped while ordering the destinations)
+    with pipeline_phase("prices"):
+        all_outbound_prices, all_return_prices = get_destination_prices(page, dest_id, start_date, config, log_func, price_cache, journal)
+
+        if not all_outbound_prices or not all_return_prices:
+            logger.info(f" - No flight data for {dest_name}.")
+            return None
+
+    # Phase 2: Generate trip combinations (recomputed from the prices; it takes milliseconds)
+    with pipeline_phase("combinations"):
+        potential_trips_raw = generate_trip_combinations(all_outbound_prices, all_return_prices, config)
+        if not potential_trips_raw:
+            logger.info(" - No valid flight combinations.")
+            return None
+
+    # Phase 3: Search Airbnb for the stays the best flight candidates need, reusing
+    # the searches earlier runs already made for the same stays
+    with pipeline_phase("airbnb_search"):
+        sampler = plan_airbnb_searches(journal, dest_id, potential_trips_raw, config)
+        for nights, checkin, checkout in sampler:
+            accommodations = get_cheapest_accommodations(
+                page=page, destination_city=dest_name, specific_location_query=dest_name,
+                checkin=checkin, checkout=checkout,
+                config=config, log_func=log_func
+            ) or []
+            journal.record(dest_id, "listings", accommodations, f"{checkin}+{nights}")
+            sampler.record(nights, accommodations)
+        if sampler.reused:
+            logger.info(f" - Reused {len(sampler.reused)} stored Airbnb searches for the planned stays.")
+        if sampler.skipped:
+            logger.info(f" - Airbnb prices stable at ~{sampler.estimates[-1]:.0f}/night after {len(sampler.estimates)} searches; skipped the remaining {sampler.skipped}.")
+        top_initial_airbnb_listings_by_duration = sampler.listings_by_nights
+
+        if not top_initial_airbnb_listings_by_duration:
+            logger.info(" - No Airbnb listings found.")
+            return None
+
+    # Phase 4: Scan Airbnb calendars
+    with pipeline_phase("airbnb_calendars"):
+        airbnb_calendar_cache = {}
+        search_calendar_months = params.get('airbnb_calendar_months_to_scan', 6)
+        for listing_link in get_unique_listing_links(top_initial_airbnb_listings_by_duration):
+            calendar_data = journal.get(dest_id, "calendar", listing_link)
+            if calendar_data is None:
+                calendar_data = get_listing_calendar_availability(page, listing_link, search_calendar_months, config) or {}
+                journal.record(dest_id, "calendar", calendar_data, listing_link)
+            airbnb_calendar_cache[listing_link] = calendar_data
+
+    # Phase 5: Estimate total costs
+    with pipeline_phase("estimates"):
+        potential_trips_with_estimates = estimate_trip_costs(potential_trips_raw, top_initial_airbnb_listings_by_duration, airbnb_calendar_cache, config)
+        num_candidates_to_validate = params.get('num_candidates_to_validate', 5)
+        return potential_trips_with_estimates[:num_candidates_to_validate]
+
+async def find_trip_candidates_async(page, dest_id, dest_name, start_date, config, log_func, price_cache, journal):
+    """Async version of find_trip_candidates."""
+    params = config['search_parameters']
+
+    # Phase 1: Get flight prices (usually already scraped while ordering the destinations)
+    with pipeline_phase("prices"):
+        all_outbound_prices, all_return_prices = await get_destination_prices_async(page, dest_id, start_date, config, log_func, price_cache, journal)
+
+        if not all_outbound_prices or not all_return_prices:
+            logger.info(f" - No flight data for {dest_name}.")
+            return None
+
+    # Phase 2: Generate trip combinations (recomputed from the prices; it takes milliseconds)
+    with pipeline_phase("combinations"):
+        potential_trips_raw = generate_trip_combinations(all_outbound_prices, all_return_prices, config)
+        if not potential_trips_raw:
+            logger.info(" - No valid flight combinations.")
+            return None
+
+    # Phase 3: Search Airbnb for the stays the best flight candidates need, reusing
+    # the searches earlier runs already made for the same stays
+    with pipeline_phase("airbnb_search"):
+        sampler = plan_airbnb_searches(journal, dest_id, potential_trips_raw, config)
+        for nights, checkin, checkout in sampler:
+            accommodations = await get_cheapest_accommodations_async(
+                page=page, destination_city=dest_name, specific_location_query=dest_name,
+                checkin=checkin, checkout=checkout,
+                config=config, log_func=log_func
+            ) or []
+            journal.record(dest_id, "listings", accommodations, f"{checkin}+{nights}")
+            sampler.record(nights, accommodations)
+        if sampler.reused:
+            logger.info(f" - Reused {len(sampler.reused)} stored Airbnb searches for the planned stays.")
+        if sampler.skipped:
+            logger.info(f" - Airbnb prices stable at ~{sampler.estimates[-1]:.0f}/night after {len(sampler.estimates)} searches; skipped the remaining {sampler.skipped}.")
+        top_initial_airbnb_listings_by_duration = sampler.listings_by_nights
+
+        if not top_initial_airbnb_listings_by_duration:
+            logger.info(" - No Airbnb listings found.")
+            return None
+
+    # Phase 4: Scan Airbnb calendars
+    with pipeline_phase("airbnb_calendars"):
+        airbnb_calendar_cache = {}
+        search_calendar_months = params.get('airbnb_calendar_months_to_scan', 6)
+        for listing_link in get_unique_listing_links(top_initial_airbnb_listings_by_duration):
+            calendar_data = journal.get(dest_id, "calendar", listing_link)
+            if calendar_data is None:
+                calendar_data = await get_listing_calendar_availability_async(page, listing_link, search_calendar_months, config) or {}
+                journal.record(dest_id, "calendar", calendar_data, listing_link)
+            airbnb_calendar_cache[listing_link] = calendar_data
 
-        browser.close()
-        print("\n--- Browser session closed ---")
+    # Phase 5: Estimate total costs
+    with pipeline_phase("estimates"):
+        potential_trips_with_estimates = estimate_trip_costs(potential_trips_raw, top_initial_airbnb_listings_by_duration, airbnb_calendar_cache, config)
+        num_candidates_to_validate = params.get('num_candidates_to_validate', 5)
+        return potential_trips_with_estimates[:num_candidates_to_validate]
 
+def store_validated_trips(results_db, dest_id, final_results_for_dest, config):
+    """Adds every validated trip, before the per-destination cap, to the results database."""
+    if results_db and final_results_for_dest:
+        results_db.add_trips(config['search_parameters']['origin_city_id'], dest_id, final_results_for_dest)
+
+def process_destination(page, client, dest_id, dest_name, start_date, config, log_func, price_cache=None, journal=None, detail_pages=None, results_db=None):
+    """
+    Runs Phases 1-6 for one destination. Returns its best trips, or None.
+    Steps already checkpointed in the journal are not repeated. Phase 6 loads
+    results pages through detail_pages, or one at a time on page without it.
+    Every validated trip is added to results_db.
+    """
+    journal = journal or CheckpointJournal(None, {})
+    detail_pages = detail_pages or DetailPagePool(page)
+    top_candidates = journal.get(dest_id, "candidates", inputs=candidates_inputs(journal, dest_id, config))
+    if top_candidates is None:
+        top_candidates = find_trip_candidates(page, dest_id, dest_name, start_date, config, log_func, price_cache, journal) or []
+        journal.record(dest_id, "candidates", top_candidates, inputs=candidates_inputs(journal, dest_id, config))
+    else:
+        logger.info(" - Reusing the ranked candidates from the checkpoint journal; their inputs are unchanged.")
+    if not top_candidates:
+        return None
+
+    # Phase 6: Detailed validation
+    with pipeline_phase("validation"):
+        final_results_for_dest = validate_trip_candidates(detail_pages, client, dest_id, dest_name, top_candidates, config, log_func, journal)
+    store_validated_trips(results_db, dest_id, final_results_for_dest, config)
+    return select_final_results(final_results_for_dest, config['search_parameters']) if final_results_for_dest else None
+
+async def process_destination_async(page, client, dest_id, dest_name, start_date, config, log_func, price_cache=None, journal=None, detail_pages=None, results_db=None):
+    """Async version of process_destination."""
+    journal = journal or CheckpointJournal(None, {})
+    detail_pages = detail_pages or AsyncDetailPagePool(page, 1, None)
+    top_candidates = journal.get(dest_id, "candidates", inputs=candidates_inputs(journal, dest_id, config))
+    if top_candidates is None:
+        top_candidates = await find_trip_candidates_async(page, dest_id, dest_name, start_date, config, log_func, price_cache, journal) or []
+        journal.record(dest_id, "candidates", top_candidates, inputs=candidates_inputs(journal, dest_id, config))
+    else:
+        logger.info(" - Reusing the ranked candidates from the checkpoint journal; their inputs are unchanged.")
+    if not top_candidates:
+        return None
+
+    # Phase 6: Detailed validation
+    with pipeline_phase("validation"):
+        final_results_for_dest = await validate_trip_candidates_async(detail_pages, client, dest_id, dest_name, top_candidates, config, log_func, journal)
+    store_validated_trips(results_db, dest_id, final_results_for_dest, config)
+    return select_final_results(final_results_for_dest, config['search_parameters']) if final_results_for_dest else None
+
+def rescore_destination(dest_id, dest_name, stored_inputs, config, journal, results_db=None):
+    """
+    Phases 2, 5 and 6 recomputed from a destination's stored scraped data.
+    Returns (best trips or None, number of candidates left out for want of flights).
+    """
+    all_outbound_prices, all_return_prices, listings_by_nights, airbnb_calendar_cache = stored_inputs
+    top_candidates = journal.get(dest_id, "candidates", inputs=candidates_inputs(journal, dest_id, config))
+    if top_candidates is None:
+        top_candidates = []
+        potential_trips_raw = generate_trip_combinations(all_outbound_prices, all_return_prices, config) if all_outbound_prices and all_return_prices else None
+        if potential_trips_raw and listings_by_nights:
+            num_candidates_to_validate = config['search_parameters'].get('num_candidates_to_validate', 5)
+            top_candidates = estimate_trip_costs(potential_trips_raw, listings_by_nights, airbnb_calendar_cache, config)[:num_candidates_to_validate]
+        journal.record(dest_id, "candidates", top_candidates, inputs=candidates_inputs(journal, dest_id, config))
+
+    final_results_for_dest, left_out = validate_stored_trip_candidates(dest_id, dest_name, top_candidates, config, journal)
+    store_validated_trips(results_db, dest_id, final_results_for_dest, config)
+    return (select_final_results(final_results_for_dest, config['search_parameters']) if final_results_for_dest else None), left_out
+
+def rescore_results(config):
+    """
+    --rescore: recomputes every enabled destination whose results are out of
+    date from the scraped data in the checkpoint journal, without a browser
+    or AI calls. Destinations whose scraped inputs are missing or were
+    scraped with other parameters are left for a full run.
+    """
+    paths = config['file_paths']
+    start_date = get_start_date(config['search_parameters'])
+    journal = initialize_checkpoint_journal(config, start_date)
+    results_db = initialize_results_db(config)
+    all_results = load_resumable_results(paths['results_file'], journal)
+
+    logger.info("--- Rescoring from the checkpoint journal ---")
+    needs_full_run = []
+    for dest_id, dest_name in iter_enabled_destinations(config):
+        with log_context(destination=dest_id), span("rescore", name=dest_name):
+            if is_destination_current(journal, all_results, dest_id, dest_name, config):
+                logger.info(f"\n--- Skipping: {dest_name} (results are up to date) ---")
+                continue
+            stored_inputs = get_stored_trip_inputs(journal, dest_id, config)
+            if stored_inputs is None:
+                needs_full_run.append(dest_name)
+                logger.info(f"\n--- {dest_name}: no scraped data for the current search parameters ---")
+                continue
+            logger.info(f"\n--- Rescoring: {dest_name} ---")
+            dest_results, left_out = rescore_destination(dest_id, dest_name, stored_inputs, config, journal, results_db)
+            if left_out:
+                logger.info(f" - {left_out} candidates need flights that were never scraped; the next full run checks them.")
+            record_destination_results(journal, all_results, dest_id, dest_name, dest_results, config, partial=bool(left_out))
+
+    save_results(all_results, paths['results_file'])
+    export_metrics(config)
+    journal.close()
+    results_db.close()
+    if needs_full_run:
+        logger.info(f"--- Run a full search for: {', '.join(needs_full_run)} ---")
+    print_final_results(all_results)
+
+def print_final_results(all_results):
+    """Prints the stored results for every destination."""
     print("\n\n--- FINAL RESULTS ---")
     for dest_name, results in all_results.items():
         print(f"\n--- {dest_name} ---")
@@ -305,5 +730,359 @@ def main():
             print(f"   - Exploration Hours: {result['exploration_hours']}")
             print(f"   - Cost per Hour: PLN{result['cost_per_hour_of_exploration']}")
 
+def start_browser_session(p, config, request_router):
+    """Opens the sync runners' browser page and its Phase 6 page pool. Returns (page, detail_pages)."""
+    page = open_stealth_page(open_browser_context(p, config), request_router)
+    detail_pages = DetailPagePool(page)
+
+    logger.info("--- Browser session started with stealth options ---")
+    return page, detail_pages
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Searches Kiwi.com and Airbnb for the most cost-effective trips.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--coordinator", action="store_true", help="Queue the enabled destinations for workers, wait for them and merge their results")
+    mode.add_argument("--worker", action="store_true", help="Process destinations leased from the job queue until it is drained")
+    mode.add_argument("--rescore", action="store_true", help="Recompute out-of-date results from the scraped data in the checkpoint journal, without loading any page")
+    parser.add_argument("--worker-id", help="Stable name for this worker (default host:pid); reusing it resumes the worker's checkpoint journal")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    config = load_config()
+    if args.worker:
+        worker_id = args.worker_id or default_worker_id()
+        config = worker_config(config, worker_id)
+        setup_logging(config)
+        run_worker(config, worker_id)
+        return
+    setup_logging(config)
+    if args.coordinator:
+        run_coordinator(config)
+        return
+    with streaming_run(config):
+        if args.rescore:
+            rescore_results(config)
+        else:
+            run_search(config)
+
+def run_search(config):
+    """Searches every enabled destination, in sync or async mode as configured, and saves the results."""
+    if config.get('browser_settings', {}).get('async_mode', False):
+        asyncio.run(async_main(config))
+        return
+
+    client = initialize_client(config)
+    price_cache = initialize_price_cache(config)
+    request_router = initialize_request_router(config)
+    pacer = get_pacer(config)
+
+    params = config['search_parameters']
+    paths = config['file_paths']
+    log_func = log_ai_response
+
+    start_date = get_start_date(params)
+
+    logger.info(f"--- Starting Trip Search ---")
+
+    journal = initialize_checkpoint_journal(config, start_date)
+    results_db = initialize_results_db(config)
+    all_results = load_resumable_results(paths['results_file'], journal)
+
+    with sync_playwright() as p:
+        page, detail_pages = start_browser_session(p, config, request_router)
+
+        scheduler = DestinationScheduler(config, all_results)
+        try:
+            for dest_id, dest_name in iter_enabled_destinations(config):
+                if is_destination_current(journal, all_results, dest_id, dest_name, config):
+                    logger.info(f"\n--- Skipping: {dest_name} (results are up to date) ---")
+                    continue
+                if not scheduler.enabled:
+                    scheduler.add(dest_id, dest_name)
+                    continue
+                # Scrape every destination's price graphs first, to order them by their best possible trip
+                with log_context(destination=dest_id), span("scout", name=dest_name):
+                    logger.info(f"\n--- Scouting flight prices: {dest_name} ---")
+                    prices = get_destination_prices(page, dest_id, start_date, config, log_func, price_cache, journal)
+                    scheduler.add(dest_id, dest_name, destination_lower_bound(*prices, config))
+
+            for dest_id, dest_name, bound in scheduler.ordered():
+                with log_context(destination=dest_id), span("destination", name=dest_name):
+                    if scheduler.should_skip(dest_name, bound):
+                        record_skipped_destination(journal, all_results, dest_id, dest_name, config)
+                        continue
+                    logger.info(f"\n--- Processing: {dest_name} ---")
+                    dest_results = process_destination(page, client, dest_id, dest_name, start_date, config, log_func, price_cache, journal, detail_pages, results_db)
+                    record_destination_results(journal, all_results, dest_id, dest_name, dest_results, config)
+
+        except (PlaywrightTimeoutError, Exception) as e:
+            # Catch any Playwright timeout or other unexpected error
+            error_type = type(e).__name__
+            logger.critical(f"\n--- A FATAL {error_type.upper()} OCCURRED ---")
+            logger.error(f"--- Error Details: {e} ---")
+            screenshot_path = "error_screenshot.png"
+            page.screenshot(path=screenshot_path)
+            logger.info(f"--- Screenshot saved to '{screenshot_path}'. It will be uploaded as a workflow artifact. ---")
+            raise # Re-raise the exception to fail the workflow
+        finally:
+            detail_pages.close()
+            # Write the journal's results to the results file, even when the run failed part-way
+            save_results(all_results, paths['results_file'])
+            export_metrics(config)
+            journal.close()
+            results_db.close()
+
+        close_stealth_page(page)
+        logger.info("\n--- Browser session closed ---")
+        if request_router.enabled:
+            logger.info(f"--- Request router: {request_router.summary()} ---")
+        logger.info(f"--- Pacing: {pacer.summary()} ---")
+        if scheduler.enabled:
+            logger.info(f"--- Branch and bound: {scheduler.skipped} destinations skipped on their flight-price bound ---")
+        if client.response_cache:
+            logger.info(f"--- LLM response cache: {client.response_cache.summary()} ---")
+
+    print_final_results(all_results)
+
+def worker_config(config, worker_id):
+    """
+    The config for one worker process: its journal, log and metrics files get
+    the worker id as a suffix, so workers sharing a directory do not write
+    over each other. Caches and the job queue stay shared.
+    """
+    suffix = re.sub(r'[^\w.-]', '_', worker_id)
+    paths = dict(config['file_paths'])
+    for key, default in (('journal_file', 'trip_journal.jsonl'), ('log_file', 'run_log.jsonl'),
+                         ('trace_file', 'run_trace.json'), ('prometheus_file', 'run_metrics.prom')):
+        paths[key] = f"{paths.get(key, default)}.{suffix}"
+    return {**config, 'file_paths': paths}
+
+def run_coordinator(config):
+    """
+    Queues every enabled destination that has no results yet, waits until
+    the workers have drained the queue, then merges their trips into the
+    results file. Exits non-zero if any destination failed on every attempt.
+    """
+    paths = config['file_paths']
+    poll_seconds = config.get('worker_settings', {}).get('poll_seconds', 15)
+    start_date = get_start_date(config['search_parameters'])
+    job_queue = initialize_job_queue(config, run_fingerprint(config, start_date))
+    if job_queue.reset_for_run():
+        logger.info("--- Started a new job queue for this search ---")
+
+    all_results = load_previous_results(paths['results_file'])
+    added = sum(job_queue.enqueue(dest_id, dest_name) for dest_id, dest_name in iter_enabled_destinations(config) if dest_name not in all_results)
+    logger.info(f"--- Queued {added} destinations. Start workers with: python main_controller.py --worker ---")
+
+    last_counts = None
+    while not job_queue.is_drained():
+        counts = job_queue.counts()
+        if counts != last_counts:
+            logger.info(f"--- Jobs: {', '.join(f'{count} {state}' for state, count in sorted(counts.items()))} ---")
+            last_counts = counts
+        time.sleep(poll_seconds)
+
+    all_results.update(job_queue.results())
+    save_results(all_results, paths['results_file'])
+    failures = job_queue.failures()
+    for dest_name, error in failures:
+        logger.error(f"--- {dest_name} failed on every attempt: {error} ---")
+    job_queue.close()
+
+    print_final_results(all_results)
+    if failures:
+        sys.exit(1)
+
+def run_worker(config, worker_id):
+    """
+    Leases destination jobs from the queue and runs Phases 1-6 for each,
+    keeping the lease alive with heartbeats, until no job is queued or
+    leased. A destination that fails goes back to the queue for another try.
+    """
+    settings = config.get('worker_settings', {})
+    poll_seconds = settings.get('poll_seconds', 15)
+    heartbeat_seconds = settings.get('heartbeat_seconds', 60)
+    start_date = get_start_date(config['search_parameters'])
+    job_queue = initialize_job_queue(config, run_fingerprint(config, start_date))
+    if job_queue.queued_run() != job_queue.run_fingerprint:
+        logger.critical("--- The job queue holds no jobs for this search. Start the coordinator first. ---")
+        sys.exit(1)
+
+    client = initialize_client(config)
+    price_cache = initialize_price_cache(config)
+    request_router = initialize_request_router(config)
+    pacer = get_pacer(config)
+    log_func = log_ai_response
+    journal = initialize_checkpoint_journal(config, start_date)
+    results_db = initialize_results_db(config)
+
+    logger.info(f"--- Starting worker '{worker_id}' ---")
+
+    with sync_playwright() as p:
+        page, detail_pages = start_browser_session(p, config, request_router)
+        try:
+            while True:
+                job = job_queue.lease(worker_id)
+                if job is None:
+                    if job_queue.is_drained():
+                        break
+                    # Other workers hold the remaining jobs; wait in case one of their leases expires.
+                    time.sleep(poll_seconds)
+                    continue
+
+                dest_id, dest_name = job['dest_id'], job['dest_name']
+                with log_context(destination=dest_id), span("destination", name=dest_name):
+                    logger.info(f"\n--- Processing: {dest_name} (attempt {job['attempts']}) ---")
+                    try:
+                        with Heartbeat(job_queue, job['id'], worker_id, heartbeat_seconds):
+                            dest_results = process_destination(page, client, dest_id, dest_name, start_date, config, log_func, price_cache, journal, detail_pages, results_db)
+                    except (PlaywrightTimeoutError, Exception) as e:
+                        logger.error(f"--- {dest_name} failed: {type(e).__name__}: {e} ---")
+                        try:
+                            page.screenshot(path=f"error_screenshot_{dest_id}.png")
+                        except Exception:
+                            pass
+                        job_queue.fail(job['id'], worker_id, f"{type(e).__name__}: {e}")
+                        continue
+
+                    record_destination_results(journal, {}, dest_id, dest_name, dest_results, config)
+                    if not job_queue.complete(job['id'], worker_id, dest_results):
+                        logger.warning(f"--- Lost the lease on {dest_name} before finishing; another worker has taken it over ---")
+        finally:
+            detail_pages.close()
+            export_metrics(config)
+            job_queue.close()
+            journal.close()
+            results_db.close()
+
+        close_stealth_page(page)
+        logger.info(f"\n--- Worker '{worker_id}' finished ---")
+        logger.info(f"--- Pacing: {pacer.summary()} ---")
+        if client.response_cache:
+            logger.info(f"--- LLM response cache: {client.response_cache.summary()} ---")
+
+async def async_main(config):
+    """
+    Runs several destinations at once, each on a page borrowed from a pool of
+    isolated, stealth-patched browser contexts. Destinations that fail are
+    reported and the first error is re-raised once the others have finished.
+    """
+    client = initialize_client(config, use_async=True)
+    price_cache = initialize_price_cache(config)
+    request_router = initialize_request_router(config)
+    pacer = get_pacer(config)
+
+    params = config['search_parameters']
+    paths = config['file_paths']
+    browser_settings = config.get('browser_settings', {})
+    pool_size = max(1, browser_settings.get('context_pool_size', 3))
+    log_func = log_ai_response
+
+    start_date = get_start_date(params)
+
+    logger.info(f"--- Starting Trip Search (async, {pool_size} browser contexts) ---")
+
+    journal = initialize_checkpoint_journal(config, start_date)
+    results_db = initialize_results_db(config)
+    all_results = load_resumable_results(paths['results_file'], journal)
+
+    async with async_playwright() as p:
+        # The contexts stay isolated from each other; on the browser daemon they start
+        # with its profile's cookies, so consent and sessions carry over.
+        browser = await connect_to_daemon_async(p, config)
+        profile_cookies = await browser.contexts[0].cookies() if browser is not None and browser.contexts else []
+        if browser is None:
+            browser = await p.chromium.launch(headless=browser_settings.get('headless', True))
+        page_pool = asyncio.Queue()
+        for _ in range(pool_size):
+            context = await browser.new_context(user_agent=USER_AGENT)
+            if profile_cookies:
+                await context.add_cookies(profile_cookies)
+            await request_router.install_async(context)
+            page = await context.new_page()
+            await stealth_async(page)
+            page_pool.put_nowait(page)
+
+        logger.info("--- Browser contexts started with stealth options ---")
+
+        async def scout_destination(dest_id, dest_name):
+            with log_context(destination=dest_id), span("scout", name=dest_name):
+                page = await page_pool.get()
+                try:
+                    logger.info(f"\n--- Scouting flight prices: {dest_name} ---")
+                    prices = await get_destination_prices_async(page, dest_id, start_date, config, log_func, price_cache, journal)
+                    return destination_lower_bound(*prices, config)
+                finally:
+                    page_pool.put_nowait(page)
+
+        async def run_destination(dest_id, dest_name, bound):
+            with log_context(destination=dest_id), span("destination", name=dest_name):
+                page = await page_pool.get()
+                if scheduler.should_skip(dest_name, bound):
+                    page_pool.put_nowait(page)
+                    record_skipped_destination(journal, all_results, dest_id, dest_name, config)
+                    return
+                detail_pages = AsyncDetailPagePool(page, get_detail_tabs(config), lambda: open_stealth_tab_async(page))
+                try:
+                    logger.info(f"\n--- Processing: {dest_name} ---")
+                    dest_results = await process_destination_async(page, client, dest_id, dest_name, start_date, config, log_func, price_cache, journal, detail_pages, results_db)
+                except (PlaywrightTimeoutError, Exception) as e:
+                    error_type = type(e).__name__
+                    logger.critical(f"\n--- A FATAL {error_type.upper()} OCCURRED for {dest_name} ---")
+                    logger.error(f"--- Error Details: {e} ---")
+                    screenshot_path = f"error_screenshot_{dest_id}.png"
+                    try:
+                        await page.screenshot(path=screenshot_path)
+                        logger.info(f"--- Screenshot saved to '{screenshot_path}'. It will be uploaded as a workflow artifact. ---")
+                    except Exception:
+                        pass
+                    raise
+                finally:
+                    await detail_pages.close()
+                    page_pool.put_nowait(page)
+
+                record_destination_results(journal, all_results, dest_id, dest_name, dest_results, config)
+
+        pending_destinations = []
+        for dest_id, dest_name in iter_enabled_destinations(config):
+            if is_destination_current(journal, all_results, dest_id, dest_name, config):
+                logger.info(f"\n--- Skipping: {dest_name} (results are up to date) ---")
+                continue
+            pending_destinations.append((dest_id, dest_name))
+
+        scheduler = DestinationScheduler(config, all_results)
+        bounds = [None] * len(pending_destinations)
+        if scheduler.enabled:
+            # A destination whose scouting failed keeps no bound; processing it reports the error.
+            bounds = await asyncio.gather(*(scout_destination(dest_id, dest_name) for dest_id, dest_name in pending_destinations), return_exceptions=True)
+        for (dest_id, dest_name), bound in zip(pending_destinations, bounds):
+            scheduler.add(dest_id, dest_name, None if isinstance(bound, BaseException) else bound)
+
+        # Started best bound first; the page pool hands out pages in that order, so later
+        # destinations are checked against the trips the earlier ones found.
+        outcomes = await asyncio.gather(*(run_destination(*destination) for destination in scheduler.ordered()), return_exceptions=True)
+        errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+
+        # Write the journal's results to the results file; failed destinations resume from the journal next run
+        save_results(all_results, paths['results_file'])
+        export_metrics(config)
+        journal.close()
+        results_db.close()
+
+        await browser.close()
+        logger.info("\n--- Browser session closed ---")
+        if request_router.enabled:
+            logger.info(f"--- Request router: {request_router.summary()} ---")
+        logger.info(f"--- Pacing: {pacer.summary()} ---")
+        if scheduler.enabled:
+            logger.info(f"--- Branch and bound: {scheduler.skipped} destinations skipped on their flight-price bound ---")
+        if client.response_cache:
+            logger.info(f"--- LLM response cache: {client.response_cache.summary()} ---")
+
+    print_final_results(all_results)
+    if errors:
+        raise errors[0] # Re-raise to fail the workflow
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
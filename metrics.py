@@ -0,0 +1,167 @@
+# metrics.py
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from structured_logging import current_destination
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "trip_search_"
+
+# Upper bounds (seconds) of the latency histogram buckets; page loads and LLM
+# calls range from sub-second to minutes.
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, math.inf)
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _escape_label_value(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (f'{k}="{_escape_label_value(v)}"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.total += value
+        self.count += 1
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                break
+
+
+class MetricsRegistry:
+    """
+    Collects timing spans, counters and latency histograms for one run.
+
+    Spans nest naturally: they are recorded as Chrome trace "complete" events
+    on one track per destination (or per thread outside a destination), and
+    chrome://tracing or Perfetto stacks overlapping spans on a track. Every
+    span's duration also feeds the span_duration_seconds histogram.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._counters = {}
+        self._histograms = {}
+        self._events = []
+        self._tracks = {}
+
+    def _track_id(self):
+        track = current_destination() or threading.current_thread().name
+        if track not in self._tracks:
+            self._tracks[track] = len(self._tracks) + 1
+        return self._tracks[track]
+
+    @contextmanager
+    def span(self, name, /, **args):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            ended = time.perf_counter()
+            with self._lock:
+                self._events.append({
+                    "name": name, "ph": "X", "pid": 1, "tid": self._track_id(),
+                    "ts": round((started - self._origin) * 1e6), "dur": round((ended - started) * 1e6),
+                    "args": {k: str(v) for k, v in args.items()}
+                })
+            self.observe("span_duration_seconds", ended - started, span=name)
+
+    def increment(self, name, value=1, **labels):
+        with self._lock:
+            key = (name, _label_key(labels))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        with self._lock:
+            key = (name, _label_key(labels))
+            if key not in self._histograms:
+                self._histograms[key] = _Histogram(buckets)
+            self._histograms[key].observe(value)
+
+    def chrome_trace(self):
+        """The recorded spans as a Chrome trace-event document."""
+        with self._lock:
+            track_names = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": track}}
+                           for track, tid in self._tracks.items()]
+            return {"traceEvents": track_names + list(self._events), "displayTimeUnit": "ms"}
+
+    def prometheus_text(self):
+        """Counters and histograms in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} counter")
+                for (metric, labels), value in sorted(self._counters.items()):
+                    if metric == name:
+                        lines.append(f"{METRIC_PREFIX}{name}{_format_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} histogram")
+                for (metric, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for upper, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if upper == math.inf else repr(float(upper))
+                        lines.append(f"{METRIC_PREFIX}{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}")
+                    lines.append(f"{METRIC_PREFIX}{name}_sum{_format_labels(labels)} {histogram.total}")
+                    lines.append(f"{METRIC_PREFIX}{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def slowest_spans(self, limit=5):
+        """(span name, total seconds, count) for the spans that took the most time overall."""
+        with self._lock:
+            totals = [(dict(labels).get('span'), h.total, h.count)
+                      for (name, labels), h in self._histograms.items() if name == "span_duration_seconds"]
+        return sorted(totals, key=lambda x: x[1], reverse=True)[:limit]
+
+
+def _write_atomically(path, text):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+_registry = MetricsRegistry()
+
+def span(name, /, **args):
+    """Times the enclosed block as a trace span named name."""
+    return _registry.span(name, **args)
+
+def increment(name, value=1, **labels):
+    _registry.increment(name, value, **labels)
+
+def observe(name, value, **labels):
+    _registry.observe(name, value, **labels)
+
+def export_metrics(config):
+    """Writes the run's Chrome trace and Prometheus textfile to file_paths, unless metrics_settings disables it."""
+    if not config.get('metrics_settings', {}).get('enabled', True):
+        return
+    trace_file = config['file_paths'].get('trace_file', 'run_trace.json')
+    prometheus_file = config['file_paths'].get('prometheus_file', 'run_metrics.prom')
+    _write_atomically(trace_file, json.dumps(_registry.chrome_trace()))
+    _write_atomically(prometheus_file, _registry.prometheus_text())
+    slowest = ", ".join(f"{name} {seconds:.1f}s/{count}x" for name, seconds, count in _registry.slowest_spans())
+    logger.info(f"--- Metrics written to '{trace_file}' and '{prometheus_file}' (slowest: {slowest or 'none'}) ---")
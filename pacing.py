@@ -0,0 +1,185 @@
+# pacing.py
+
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+from playwright.sync_api import Error
+from playwright.async_api import Error as AsyncError
+
+class _TokenBucket:
+    """
+    Per-host request budget. Callers reserve a token up front and are told
+    how long to wait for it, so concurrent callers queue up instead of all
+    waking at once.
+    """
+    def __init__(self, requests_per_minute, burst):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+
+    def reserve(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class Pacer:
+    """
+    Replaces fixed random sleeps in the scrapers. Page loads draw from a
+    per-host token bucket, small configurable jitter keeps the request
+    pattern human-like, and readiness is detected from selectors and page
+    functions rather than guessed. Every wait is recorded by reason so the
+    time spent can be tuned from config.
+    """
+    def __init__(self, settings):
+        self.jitter_range = tuple(settings.get('jitter_seconds', [0.3, 1.2]))
+        self.retry_backoff_seconds = settings.get('retry_backoff_seconds', 5)
+        self.ready_timeout_ms = settings.get('ready_timeout_seconds', 10) * 1000
+        self._host_settings = settings.get('hosts', {})
+        self._default_host_settings = settings.get('default', {"requests_per_minute": 30, "burst": 5})
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+        self.seconds_by_reason = Counter()
+        self.waits_by_reason = Counter()
+
+    def _bucket_for(self, url):
+        host = urlparse(url).hostname or ""
+        site = next((h for h in self._host_settings if host == h or host.endswith("." + h)), None)
+        key = site or host
+        if key not in self._buckets:
+            settings = self._host_settings.get(site, self._default_host_settings)
+            self._buckets[key] = _TokenBucket(settings.get('requests_per_minute', 30), settings.get('burst', 5))
+        return key, self._buckets[key]
+
+    def _record(self, reason, seconds):
+        with self._lock:
+            self.seconds_by_reason[reason] += seconds
+            self.waits_by_reason[reason] += 1
+
+    def _reserve(self, url):
+        with self._lock:
+            host, bucket = self._bucket_for(url)
+            return host, bucket.reserve()
+
+    def _jitter_seconds(self):
+        low, high = self.jitter_range
+        return random.uniform(low, high) if high > 0 else 0.0
+
+    # --- Sync ---
+
+    def throttle(self, url):
+        """Blocks until the URL's host has budget for another page load."""
+        host, delay = self._reserve(url)
+        if delay:
+            time.sleep(delay)
+        self._record(f"rate_limit:{host}", delay)
+
+    def jitter(self, reason):
+        """A short random pause after an interaction."""
+        delay = self._jitter_seconds()
+        time.sleep(delay)
+        self._record(f"jitter:{reason}", delay)
+
+    def backoff(self, attempt, reason="retry"):
+        """Exponential pause before retry number attempt + 1."""
+        delay = self.retry_backoff_seconds * (2 ** attempt) + self._jitter_seconds()
+        time.sleep(delay)
+        self._record(reason, delay)
+
+    def wait_for_selector(self, page, selector, reason, state='visible', timeout_ms=None):
+        """Waits until selector reaches state. Returns False on timeout instead of raising."""
+        started = time.monotonic()
+        try:
+            page.locator(selector).first.wait_for(state=state, timeout=timeout_ms or self.ready_timeout_ms)
+            return True
+        except Error:
+            return False
+        finally:
+            self._record(f"ready:{reason}", time.monotonic() - started)
+
+    def wait_for_function(self, page, expression, arg, reason, timeout_ms=None):
+        """Waits until a page function returns truthy. Returns False on timeout instead of raising."""
+        started = time.monotonic()
+        try:
+            page.wait_for_function(expression, arg=arg, timeout=timeout_ms or self.ready_timeout_ms)
+            return True
+        except Error:
+            return False
+        finally:
+            self._record(f"ready:{reason}", time.monotonic() - started)
+
+    # --- Async ---
+
+    async def throttle_async(self, url):
+        """Async version of throttle."""
+        host, delay = self._reserve(url)
+        if delay:
+            await asyncio.sleep(delay)
+        self._record(f"rate_limit:{host}", delay)
+
+    async def jitter_async(self, reason):
+        """Async version of jitter."""
+        delay = self._jitter_seconds()
+        await asyncio.sleep(delay)
+        self._record(f"jitter:{reason}", delay)
+
+    async def backoff_async(self, attempt, reason="retry"):
+        """Async version of backoff."""
+        delay = self.retry_backoff_seconds * (2 ** attempt) + self._jitter_seconds()
+        await asyncio.sleep(delay)
+        self._record(reason, delay)
+
+    async def wait_for_selector_async(self, page, selector, reason, state='visible', timeout_ms=None):
+        """Async version of wait_for_selector."""
+        started = time.monotonic()
+        try:
+            await page.locator(selector).first.wait_for(state=state, timeout=timeout_ms or self.ready_timeout_ms)
+            return True
+        except AsyncError:
+            return False
+        finally:
+            self._record(f"ready:{reason}", time.monotonic() - started)
+
+    async def wait_for_function_async(self, page, expression, arg, reason, timeout_ms=None):
+        """Async version of wait_for_function."""
+        started = time.monotonic()
+        try:
+            await page.wait_for_function(expression, arg=arg, timeout=timeout_ms or self.ready_timeout_ms)
+            return True
+        except AsyncError:
+            return False
+        finally:
+            self._record(f"ready:{reason}", time.monotonic() - started)
+
+    def summary(self):
+        with self._lock:
+            total = sum(self.seconds_by_reason.values())
+            top = ", ".join(f"{reason} {seconds:.1f}s/{self.waits_by_reason[reason]}x"
+                            for reason, seconds in self.seconds_by_reason.most_common(6))
+        return f"{total:.1f}s spent waiting" + (f" ({top})" if top else "")
+
+
+_pacers = {}
+_pacers_lock = threading.Lock()
+
+def get_pacer(config):
+    """
+    The shared Pacer for config['pacing']. Callers with the same pacing
+    settings share one set of host buckets; different settings (or no config
+    at all) get their own Pacer rather than silently reusing the first one.
+    """
+    settings = (config or {}).get('pacing', {})
+    key = json.dumps(settings, sort_keys=True)
+    with _pacers_lock:
+        if key not in _pacers:
+            _pacers[key] = Pacer(settings)
+        return _pacers[key]
@@ -0,0 +1,107 @@
+# price_cache.py
+
+import logging
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+
+from metrics import increment
+
+logger = logging.getLogger(__name__)
+
+# Missing dates this close together are fetched with a single calendar scrape,
+# since Kiwi shows a whole month per page anyway.
+RANGE_MERGE_GAP_DAYS = 7
+
+class PriceGraphCache:
+    """
+    On-disk cache of Kiwi calendar prices keyed by (origin, destination, date).
+    Every scraped date is stored with its scrape time, including dates that had
+    no price, so only missing or stale date ranges need to go back to the browser.
+    """
+    def __init__(self, db_path, ttl_hours):
+        self.ttl_seconds = ttl_hours * 3600
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS price_graph (
+                origin TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                date TEXT NOT NULL,
+                price INTEGER,
+                scraped_at REAL NOT NULL,
+                PRIMARY KEY (origin, destination, date)
+            )
+        """)
+        self._conn.commit()
+
+    def lookup(self, origin, destination, start_date, end_date):
+        """
+        Returns (prices, missing_ranges) for start_date..end_date inclusive.
+        prices holds the fresh cached {full_date, price} entries; missing_ranges
+        lists the (range_start, range_end) dates that still need scraping.
+        """
+        fresh_after = time.time() - self.ttl_seconds
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT date, price FROM price_graph WHERE origin = ? AND destination = ? AND date BETWEEN ? AND ? AND scraped_at >= ?",
+                (origin, destination, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d"), fresh_after)
+            ).fetchall()
+
+        fresh_dates = {row[0] for row in rows}
+        prices = [{"full_date": row[0], "price": row[1]} for row in rows if row[1]]
+
+        missing_ranges = []
+        current_date = start_date
+        while current_date <= end_date:
+            if current_date.strftime("%Y-%m-%d") not in fresh_dates:
+                if missing_ranges and (current_date - missing_ranges[-1][1]).days <= RANGE_MERGE_GAP_DAYS:
+                    missing_ranges[-1] = (missing_ranges[-1][0], current_date)
+                else:
+                    missing_ranges.append((current_date, current_date))
+            current_date += timedelta(days=1)
+
+        increment("cache_lookups_total", cache="price_graph", result="miss" if missing_ranges else "hit")
+        return prices, missing_ranges
+
+    def store(self, origin, destination, start_date, end_date, prices):
+        """
+        Records a scrape of start_date..end_date. Dates absent from prices are
+        stored as having no price, but only up to the last date that had one:
+        a scrape that stopped short leaves its tail missing rather than cached
+        as "no flight", and an empty or failed scrape stores nothing.
+        """
+        if not prices:
+            return
+        scraped_at = time.time()
+        price_by_date = {p['full_date']: p['price'] for p in prices}
+        observed_end = min(end_date, date.fromisoformat(max(price_by_date)))
+        rows = []
+        current_date = start_date
+        while current_date <= observed_end:
+            date_str = current_date.strftime("%Y-%m-%d")
+            rows.append((origin, destination, date_str, price_by_date.get(date_str), scraped_at))
+            current_date += timedelta(days=1)
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO price_graph (origin, destination, date, price, scraped_at) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def initialize_price_cache(config):
+    """Creates the price graph cache from config, or returns None when it is disabled."""
+    cache_settings = config.get('cache_settings', {})
+    ttl_hours = cache_settings.get('price_graph_ttl_hours', 12)
+    if ttl_hours <= 0:
+        return None
+    db_path = config['file_paths'].get('price_cache_file', 'price_cache.sqlite')
+    logger.info(f"--- Using price graph cache '{db_path}' (TTL {ttl_hours}h) ---")
+    return PriceGraphCache(db_path, ttl_hours)
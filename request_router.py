@@ -0,0 +1,105 @@
+# request_router.py
+
+import re
+from collections import Counter
+from urllib.parse import urlparse
+
+class RequestRouter:
+    """
+    Aborts requests the scrapers never read (images, fonts, media, analytics)
+    using per-site rules from browser_settings.resource_blocking, and counts
+    what was blocked and how many bytes the allowed responses weighed.
+
+    A site's rules apply to requests whose host ends with one of its "hosts";
+    other requests use the "default" rules. Allow patterns win over any block rule.
+    """
+    def __init__(self, settings):
+        self.enabled = settings.get('enabled', False)
+        self._sites = [
+            (tuple(site.get('hosts', [])), self._compile_rules(site))
+            for site in settings.get('sites', {}).values()
+        ]
+        self._default_rules = self._compile_rules(settings.get('default', {}))
+
+        self.requests_allowed = 0
+        self.requests_blocked = 0
+        self.bytes_received = 0
+        self.blocked_by_reason = Counter()
+
+    @staticmethod
+    def _compile_rules(rules):
+        return {
+            "block_resource_types": set(rules.get('block_resource_types', [])),
+            "block_url_patterns": [re.compile(pattern) for pattern in rules.get('block_url_patterns', [])],
+            "allow_url_patterns": [re.compile(pattern) for pattern in rules.get('allow_url_patterns', [])],
+        }
+
+    def _rules_for(self, url):
+        host = urlparse(url).hostname or ""
+        for hosts, rules in self._sites:
+            if any(host == h or host.endswith("." + h) for h in hosts):
+                return rules
+        return self._default_rules
+
+    def block_reason(self, url, resource_type):
+        """Why a request should be blocked, or None to let it through."""
+        rules = self._rules_for(url)
+        if any(pattern.search(url) for pattern in rules['allow_url_patterns']):
+            return None
+        if resource_type in rules['block_resource_types']:
+            return f"type:{resource_type}"
+        for pattern in rules['block_url_patterns']:
+            if pattern.search(url):
+                return f"url:{pattern.pattern}"
+        return None
+
+    def _decide(self, route):
+        reason = self.block_reason(route.request.url, route.request.resource_type)
+        if reason:
+            self.requests_blocked += 1
+            self.blocked_by_reason[reason] += 1
+        else:
+            self.requests_allowed += 1
+        return reason
+
+    def handle_route(self, route):
+        if self._decide(route):
+            route.abort()
+        else:
+            route.continue_()
+
+    async def handle_route_async(self, route):
+        if self._decide(route):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    def record_response(self, response):
+        try:
+            self.bytes_received += int(response.headers.get('content-length', 0))
+        except (ValueError, TypeError):
+            pass
+
+    def install(self, context):
+        """Routes every request of a sync browser context through the rules."""
+        if not self.enabled:
+            return
+        context.route("**/*", self.handle_route)
+        context.on("response", self.record_response)
+
+    async def install_async(self, context):
+        """Async version of install."""
+        if not self.enabled:
+            return
+        await context.route("**/*", self.handle_route_async)
+        context.on("response", self.record_response)
+
+    def summary(self):
+        top_reasons = ", ".join(f"{reason} x{count}" for reason, count in self.blocked_by_reason.most_common(5))
+        return (f"{self.requests_blocked} requests blocked, {self.requests_allowed} allowed, "
+                f"{self.bytes_received / 1_000_000:.1f} MB received" + (f" (top: {top_reasons})" if top_reasons else ""))
+
+
+def initialize_request_router(config):
+    """Creates the request router from browser_settings.resource_blocking."""
+    return RequestRouter(config.get('browser_settings', {}).get('resource_blocking', {}))
@@ -0,0 +1,231 @@
+# results_db.py
+"""
+Every validated trip from every run, in SQLite, with a query CLI:
+
+    python results_db.py cheapest --from 2026-11-01 --to 2026-11-30
+    python results_db.py best --budget 1500
+    python results_db.py history --destination Paris
+    python results_db.py export --output final_trips.json
+
+Add --json before the command (python results_db.py --json best ...) to
+print JSON instead of a table.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, datetime
+
+logger = logging.getLogger(__name__)
+
+# Columns shown by the query commands, in order.
+TRIP_COLUMNS = ("destination", "outbound_date", "return_date", "num_nights", "total_cost", "cost_per_hour",
+                "exploration_hours", "flight_cost", "accommodation_cost", "found_at")
+
+class ResultsDatabase:
+    """
+    Append-only store of validated trips, uncapped and kept across runs. Each
+    run gets its own run_id, so a trip found again by a later run is a new
+    row and a destination's price history can be read back. Indexed for
+    lookups by destination, travel dates, total cost and cost per hour.
+    """
+    def __init__(self, db_path, run_id=None):
+        self.run_id = run_id or datetime.now().strftime("%Y%m%dT%H%M%S")
+        self._lock = threading.Lock()
+        # Workers write from several processes, so wait for the write lock rather than failing.
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS trips (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT NOT NULL,
+                found_at REAL NOT NULL,
+                origin TEXT,
+                dest_id TEXT,
+                destination TEXT NOT NULL COLLATE NOCASE,
+                outbound_date TEXT NOT NULL,
+                return_date TEXT NOT NULL,
+                num_nights INTEGER NOT NULL,
+                total_cost REAL NOT NULL,
+                cost_per_hour REAL NOT NULL,
+                exploration_hours REAL NOT NULL,
+                flight_cost REAL,
+                accommodation_cost REAL,
+                trip TEXT NOT NULL,
+                UNIQUE (run_id, destination, outbound_date, return_date)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS trips_destination ON trips (destination, run_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS trips_dates ON trips (outbound_date, return_date)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS trips_total_cost ON trips (total_cost)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS trips_cost_per_hour ON trips (cost_per_hour)")
+        self._conn.commit()
+
+    def add_trips(self, origin, dest_id, trips):
+        """Stores a destination's validated trips for this run. A trip found twice in one run keeps its latest version."""
+        found_at = time.time()
+        rows = []
+        for trip in trips:
+            flight_cost = trip.get('flights', {}).get('total_price')
+            rows.append((
+                self.run_id, found_at, origin, dest_id, trip['destination'], trip['outbound_date'], trip['return_date'],
+                (date.fromisoformat(trip['return_date']) - date.fromisoformat(trip['outbound_date'])).days,
+                trip['total_cost'], trip['cost_per_hour_of_exploration'], trip['exploration_hours'],
+                flight_cost, None if flight_cost is None else round(trip['total_cost'] - flight_cost, 2),
+                json.dumps(trip, ensure_ascii=False)
+            ))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO trips (run_id, found_at, origin, dest_id, destination, outbound_date, return_date, num_nights, "
+                "total_cost, cost_per_hour, exploration_hours, flight_cost, accommodation_cost, trip) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            names = [column[0] for column in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    @staticmethod
+    def _trip_filters(date_from=None, date_to=None, destination=None, max_total_cost=None, latest_only=True):
+        """WHERE clause and parameters shared by the trip queries."""
+        clauses, params = [], []
+        if date_from:
+            clauses.append("outbound_date >= ?")
+            params.append(date_from)
+        if date_to:
+            clauses.append("return_date <= ?")
+            params.append(date_to)
+        if destination:
+            clauses.append("(destination = ? OR dest_id = ?)")
+            params.extend([destination, destination])
+        if max_total_cost is not None:
+            clauses.append("total_cost <= ?")
+            params.append(max_total_cost)
+        if latest_only:
+            # A destination's most recent run holds its current prices.
+            clauses.append("run_id = (SELECT MAX(latest.run_id) FROM trips AS latest WHERE latest.destination = trips.destination)")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def cheapest(self, date_from=None, date_to=None, destination=None, limit=20):
+        """Cheapest trips by total cost across all destinations, travelling within date_from..date_to."""
+        where, params = self._trip_filters(date_from, date_to, destination)
+        return self._query(f"SELECT {', '.join(TRIP_COLUMNS)} FROM trips{where} ORDER BY total_cost LIMIT ?", (*params, limit))
+
+    def best_cost_per_hour(self, max_total_cost=None, date_from=None, date_to=None, destination=None, limit=20):
+        """Trips with the lowest cost per exploration hour, optionally within a total budget."""
+        where, params = self._trip_filters(date_from, date_to, destination, max_total_cost)
+        return self._query(f"SELECT {', '.join(TRIP_COLUMNS)} FROM trips{where} ORDER BY cost_per_hour LIMIT ?", (*params, limit))
+
+    def price_history(self, destination, date_from=None, date_to=None):
+        """Per run, the cheapest trip found for a destination (optionally within a date window), oldest run first."""
+        where, params = self._trip_filters(date_from, date_to, destination, latest_only=False)
+        return self._query(
+            f"SELECT run_id, MIN(found_at) AS found_at, COUNT(*) AS trips, MIN(total_cost) AS cheapest_total_cost, "
+            f"MIN(cost_per_hour) AS best_cost_per_hour, MIN(flight_cost) AS cheapest_flight_cost "
+            f"FROM trips{where} GROUP BY run_id ORDER BY run_id", params)
+
+    def export(self, per_destination=3):
+        """{destination: trips} in the final_trips.json layout: each destination's best trips from its latest run."""
+        rows = self._query(
+            "SELECT destination, trip FROM trips" + self._trip_filters()[0] + " ORDER BY destination, cost_per_hour")
+        exported = {}
+        for row in rows:
+            trips = exported.setdefault(row['destination'], [])
+            if len(trips) < per_destination:
+                trips.append(json.loads(row['trip']))
+        return exported
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def initialize_results_db(config):
+    """Opens the results database named by file_paths.results_db_file."""
+    db_path = config['file_paths'].get('results_db_file', 'trips.sqlite')
+    return ResultsDatabase(db_path)
+
+def _print_table(rows):
+    if not rows:
+        print("No trips found.")
+        return
+    columns = list(rows[0].keys())
+    cells = [[_format_cell(column, row[column]) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(row[i]) for row in cells)) for i, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)).rstrip())
+    for row in cells:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+
+def _format_cell(column, value):
+    if value is None:
+        return "-"
+    if column == "found_at":
+        return datetime.fromtimestamp(value).strftime("%Y-%m-%d %H:%M")
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+def main():
+    parser = argparse.ArgumentParser(description="Queries the validated trips stored by every run.")
+    parser.add_argument("--config", default="config.json", help="Config file naming the database (default config.json)")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_trip_filters(command):
+        command.add_argument("--from", dest="date_from", metavar="YYYY-MM-DD", help="Earliest outbound date")
+        command.add_argument("--to", dest="date_to", metavar="YYYY-MM-DD", help="Latest return date")
+        command.add_argument("--destination", help="Destination name or id")
+        command.add_argument("--limit", type=int, default=20)
+
+    add_trip_filters(commands.add_parser("cheapest", help="Cheapest trips across all destinations"))
+    best = commands.add_parser("best", help="Best cost per exploration hour, optionally under a budget")
+    add_trip_filters(best)
+    best.add_argument("--budget", type=float, help="Maximum total cost")
+    history = commands.add_parser("history", help="Cheapest price found per run for a destination")
+    history.add_argument("--destination", required=True, help="Destination name or id")
+    history.add_argument("--from", dest="date_from", metavar="YYYY-MM-DD", help="Earliest outbound date")
+    history.add_argument("--to", dest="date_to", metavar="YYYY-MM-DD", help="Latest return date")
+    export = commands.add_parser("export", help="Each destination's best trips from its latest run, as final_trips.json")
+    export.add_argument("--output", help="Write to this file instead of stdout")
+    export.add_argument("--per-destination", type=int, help="Trips per destination (default num_final_results_to_store)")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = json.load(f)
+    db_path = config['file_paths'].get('results_db_file', 'trips.sqlite')
+    if not os.path.exists(db_path):
+        sys.exit(f"No results database at '{db_path}' yet; it is created by the first search.")
+    results_db = ResultsDatabase(db_path)
+
+    if args.command == "cheapest":
+        rows = results_db.cheapest(args.date_from, args.date_to, args.destination, args.limit)
+    elif args.command == "best":
+        rows = results_db.best_cost_per_hour(args.budget, args.date_from, args.date_to, args.destination, args.limit)
+    elif args.command == "history":
+        rows = results_db.price_history(args.destination, args.date_from, args.date_to)
+    else:
+        per_destination = args.per_destination or config['search_parameters'].get('num_final_results_to_store', 3)
+        exported = json.dumps(results_db.export(per_destination), indent=2, ensure_ascii=False)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(exported)
+        else:
+            print(exported)
+        results_db.close()
+        return
+    results_db.close()
+
+    if args.json:
+        print(json.dumps(rows, indent=2, ensure_ascii=False))
+    else:
+        _print_table(rows)
+
+if __name__ == "__main__":
+    main()
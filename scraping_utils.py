@@ -0,0 +1,38 @@
+# scraping_utils.py
+
+import re
+
+# A run of digits with the grouping/decimal separators sites use: "1,234.50", "1.234,50", "1 234", "1'234".
+# Spaces and apostrophes only count as separators before a 3-digit group, so "300 2 nights" stays 300.
+_NUMBER_PATTERN = re.compile(r"\d+(?:[\s'\u00a0\u202f]\d{3}(?!\d)|[.,]\d+)*")
+
+def parse_price_text(price_text):
+    """
+    Parses the first amount in a price label into an int, whatever the currency
+    format ("PLN 1,234", "1.234 €", "1 234,50 zł", "$1,234.50"). Returns None
+    if there is no number.
+    """
+    number_match = _NUMBER_PATTERN.search(price_text or "")
+    if not number_match:
+        return None
+
+    number = re.sub(r"[\s'\u00a0\u202f]", "", number_match.group(0))
+    if ',' in number and '.' in number:
+        decimal_separator = ',' if number.rfind(',') > number.rfind('.') else '.'
+    elif number.count(',') == 1 and len(number.split(',')[1]) != 3:
+        decimal_separator = ','
+    elif number.count('.') == 1 and len(number.split('.')[1]) != 3:
+        decimal_separator = '.'
+    else:
+        decimal_separator = None
+
+    if decimal_separator:
+        integer_part, _, fraction_part = number.rpartition(decimal_separator)
+        number = re.sub(r"[.,]", "", integer_part) + "." + fraction_part
+    else:
+        number = re.sub(r"[.,]", "", number)
+
+    try:
+        return int(round(float(number)))
+    except ValueError:
+        return None
@@ -0,0 +1,245 @@
+# streaming.py
+"""
+Live events from a running search: every trip as soon as Phase 6 validates
+it, phase progress, the best-so-far ranking across destinations and the
+end of the run. Consume them with stream_trips() / astream_trips() or, with
+streaming_settings.enabled, as Server-Sent Events from
+http://<host>:<port>/events (the current ranking is also at /ranking).
+
+Each event is {"event": type, "data": {...}, "at": unix time}, with type one
+of "phase", "trip", "ranking", "destination" or "done".
+"""
+
+import asyncio
+import heapq
+import json
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Idle SSE connections get a comment line this often, so proxies keep them open.
+KEEPALIVE_SECONDS = 15
+
+_CLOSED = object()
+
+class Subscription:
+    """
+    One consumer's queue of events. A bounded subscription drops events it
+    has no room for, and counts them, rather than slowing the search down.
+    """
+    def __init__(self, max_pending=None):
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._events = queue.Queue()
+
+    def put(self, event):
+        if self.max_pending and self._events.qsize() >= self.max_pending:
+            self.dropped += 1
+            return
+        self._events.put(event)
+
+    def get(self, timeout=None):
+        """The next event, _CLOSED once closed, or None after timeout seconds without one."""
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._events.put(_CLOSED)
+
+    def __iter__(self):
+        while True:
+            event = self.get()
+            if event is _CLOSED:
+                return
+            yield event
+
+
+class EventHub:
+    """Fans the pipeline's events out to every subscription, and keeps the best-so-far ranking."""
+    def __init__(self):
+        self.ranking_size = 10
+        self._lock = threading.Lock()
+        self._subscriptions = []
+        self._trips = []
+
+    def configure(self, config):
+        """Starts a new run's ranking with streaming_settings.ranking_size entries."""
+        with self._lock:
+            self.ranking_size = max(1, config.get('streaming_settings', {}).get('ranking_size', 10))
+            self._trips = []
+
+    def subscribe(self, max_pending=None):
+        subscription = Subscription(max_pending)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+        if subscription.dropped:
+            logger.warning(f"--- A slow event stream consumer missed {subscription.dropped} events ---")
+
+    def ranking(self):
+        """The best trips found so far in this run, by cost per exploration hour."""
+        with self._lock:
+            return heapq.nsmallest(self.ranking_size, self._trips, key=lambda trip: trip['cost_per_hour_of_exploration'])
+
+    def trips_found(self):
+        with self._lock:
+            return len(self._trips)
+
+    def publish(self, event_type, data):
+        with self._lock:
+            if event_type == "trip":
+                self._trips.append(data)
+            subscriptions = list(self._subscriptions)
+        if not subscriptions:
+            return
+        self._send(subscriptions, event_type, data)
+        if event_type == "trip":
+            self._send(subscriptions, "ranking", {"trips": self.ranking()})
+
+    @staticmethod
+    def _send(subscriptions, event_type, data):
+        event = {"event": event_type, "data": data, "at": time.time()}
+        for subscription in subscriptions:
+            subscription.put(event)
+
+
+_hub = EventHub()
+
+def publish(event_type, **data):
+    """Sends an event to every current consumer. Cheap when nobody is listening."""
+    _hub.publish(event_type, data)
+
+
+class _EventStreamHandler(BaseHTTPRequestHandler):
+    """GET /events streams the events as SSE; GET /ranking returns the current ranking as JSON."""
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/events":
+            self._stream_events()
+        elif path == "/ranking":
+            body = json.dumps({"trips": _hub.ranking()}, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error(404)
+
+    def _write_event(self, event):
+        payload = json.dumps({**event['data'], "at": event['at']}, ensure_ascii=False)
+        self.wfile.write(f"event: {event['event']}\ndata: {payload}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _stream_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        subscription = _hub.subscribe(self.server.max_pending_events)
+        try:
+            # A consumer joining mid-run starts from the current ranking.
+            self._write_event({"event": "ranking", "data": {"trips": _hub.ranking()}, "at": time.time()})
+            while True:
+                event = subscription.get(timeout=KEEPALIVE_SECONDS)
+                if event is _CLOSED:
+                    break
+                if event is None:
+                    self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+                    continue
+                self._write_event(event)
+                if event['event'] == "done":
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            _hub.unsubscribe(subscription)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Event stream: {format % args}")
+
+
+def start_event_server(config):
+    """Serves the events over HTTP from a background thread, or returns None when streaming_settings disables it."""
+    settings = config.get('streaming_settings', {})
+    if not settings.get('enabled', False):
+        return None
+    host, port = settings.get('host', '127.0.0.1'), settings.get('port', 8765)
+    server = ThreadingHTTPServer((host, port), _EventStreamHandler)
+    server.daemon_threads = True
+    server.max_pending_events = settings.get('max_pending_events', 1000)
+    threading.Thread(target=server.serve_forever, name="event-server", daemon=True).start()
+    logger.info(f"--- Streaming trips as Server-Sent Events on http://{host}:{port}/events ---")
+    return server
+
+@contextmanager
+def streaming_run(config):
+    """
+    Wraps one run: starts a fresh ranking and the event server (if enabled),
+    then publishes "done" and stops the server when the block ends.
+    """
+    _hub.configure(config)
+    server = start_event_server(config)
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        publish("done", trips_found=_hub.trips_found(), error=error)
+        if server:
+            server.shutdown()
+            server.server_close()
+
+def stream_trips(config):
+    """
+    Runs the search in a background thread and yields its events as they
+    happen; the run's exception, if any, is raised once they are all out.
+    Stopping early does not stop the search.
+    """
+    from main_controller import run_search
+
+    subscription = _hub.subscribe()
+    errors = []
+
+    def run():
+        try:
+            with streaming_run(config):
+                run_search(config)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            subscription.close()
+
+    threading.Thread(target=run, name="trip-search", daemon=True).start()
+    try:
+        yield from subscription
+    finally:
+        _hub.unsubscribe(subscription)
+    if errors:
+        raise errors[0]
+
+async def astream_trips(config):
+    """Async iterator version of stream_trips."""
+    loop = asyncio.get_running_loop()
+    events = stream_trips(config)
+    while True:
+        event = await loop.run_in_executor(None, next, events, _CLOSED)
+        if event is _CLOSED:
+            return
+        yield event
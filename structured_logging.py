@@ -0,0 +1,166 @@
+# structured_logging.py
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# The destination and phase being worked on, tagged onto every record. Context
+# variables follow asyncio tasks, so concurrent destinations keep their own tags.
+_destination = contextvars.ContextVar('log_destination', default=None)
+_phase = contextvars.ContextVar('log_phase', default=None)
+
+# AI responses go to the JSONL file only; they are too long for the console.
+AI_RESPONSE_LOGGER = "trip_search.ai_responses"
+
+# Libraries whose debug output would drown the run's own records.
+QUIET_LIBRARIES = ("asyncio", "httpx", "httpcore", "openai", "urllib3")
+
+class _ContextFilter(logging.Filter):
+    """Copies the current destination and phase onto the record, in the thread that logged it."""
+    def filter(self, record):
+        record.destination = _destination.get()
+        record.phase = _phase.get()
+        return True
+
+
+class JSONLinesFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, destination, phase and any structured extras."""
+    EXTRA_FIELDS = ("duration_ms", "function", "data")
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "destination": getattr(record, "destination", None),
+            "phase": getattr(record, "phase", None),
+        }
+        for field in self.EXTRA_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread without ever blocking the scraper. When
+    the bounded queue is full the record is dropped and counted instead.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Keep the structured fields as they are; only pre-render the message text.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.msg = f"{record.msg}\n{record.exc_text}"
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_queue_handler = None
+
+def setup_logging(config):
+    """
+    Configures logging for the run from logging_settings:
+    - the console shows plain messages at `level` (DEBUG brings back the
+      per-listing and per-page progress lines);
+    - a background thread writes JSONL records at `file_level` to
+      file_paths.log_file, rotating at `max_bytes`.
+    Safe to call more than once; later calls are ignored.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+    settings = config.get('logging_settings', {})
+    log_file = config.get('file_paths', {}).get('log_file', 'run_log.jsonl')
+
+    root = logging.getLogger()
+    root.setLevel(logging.DEBUG)
+    for library in QUIET_LIBRARIES:
+        logging.getLogger(library).setLevel(logging.WARNING)
+
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(getattr(logging, str(settings.get('level', 'INFO')).upper(), logging.INFO))
+    console_handler.setFormatter(logging.Formatter("%(message)s"))
+    root.addHandler(console_handler)
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=settings.get('max_bytes', 5_000_000), backupCount=settings.get('backup_count', 3), encoding="utf-8")
+    file_handler.setFormatter(JSONLinesFormatter())
+
+    _queue_handler = _DroppingQueueHandler(queue.Queue(maxsize=settings.get('queue_size', 10000)))
+    _queue_handler.setLevel(getattr(logging, str(settings.get('file_level', 'DEBUG')).upper(), logging.DEBUG))
+    _queue_handler.addFilter(_ContextFilter())
+    root.addHandler(_queue_handler)
+
+    ai_logger = logging.getLogger(AI_RESPONSE_LOGGER)
+    ai_logger.propagate = False
+    ai_logger.addHandler(_queue_handler)
+
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, file_handler, respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Flushes the queued records to disk and stops the writer thread."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    if _queue_handler.dropped:
+        print(f"--- Logging: {_queue_handler.dropped} records dropped because the log queue was full ---")
+
+@contextmanager
+def log_context(destination=None, phase=None):
+    """Tags every record logged inside the block with a destination and/or phase."""
+    tokens = []
+    if destination is not None:
+        tokens.append((_destination, _destination.set(destination)))
+    if phase is not None:
+        tokens.append((_phase, _phase.set(phase)))
+    try:
+        yield
+    finally:
+        for variable, token in reversed(tokens):
+            variable.reset(token)
+
+def current_destination():
+    """The destination tag of the current thread or asyncio task, or None."""
+    return _destination.get()
+
+@contextmanager
+def log_phase(logger, phase):
+    """Tags the block's records with phase and logs how long it took."""
+    started = time.perf_counter()
+    with log_context(phase=phase):
+        try:
+            yield
+        finally:
+            duration_ms = round((time.perf_counter() - started) * 1000, 1)
+            logger.debug(f" - {phase} took {duration_ms / 1000:.1f}s", extra={"duration_ms": duration_ms})
+
+def log_ai_response(response_data, function_name):
+    """Queues an AI response for the JSONL log; structured responses stay structured."""
+    logging.getLogger(AI_RESPONSE_LOGGER).info(f"AI response from {function_name}", extra={"function": function_name, "data": response_data})
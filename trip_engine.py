@@ -0,0 +1,199 @@
+# trip_engine.py
+
+from datetime import date, datetime, time as time_obj
+import numpy as np
+
+from availability_index import build_availability_indexes
+
+DAY_TRIP_LISTING = {"name": "N/A (Day Trip)", "total_accommodation_cost": 0, "link": "N/A", "rating": "N/A"}
+
+def calculate_exploration_hours(outbound_arrival_str, return_departure_str, num_nights, config):
+    """Calculates usable exploration hours."""
+    day_starts = time_obj(config['search_parameters'].get('day_starts_at_hour', 8), 0)
+    day_ends = time_obj(config['search_parameters'].get('day_ends_at_hour', 21), 0)
+    buffer = config['search_parameters'].get('airport_buffer_hours', 2)
+    try:
+        def parse_time(time_str):
+            if "+1" in time_str: return datetime.strptime(time_str.split('+')[0], "%H:%M").time(), True
+            return datetime.strptime(time_str, "%H:%M").time(), False
+
+        outbound_arrival, _ = parse_time(outbound_arrival_str)
+        return_departure, _ = parse_time(return_departure_str)
+
+        outbound_arrival_hours = outbound_arrival.hour + outbound_arrival.minute / 60.0
+        return_departure_hours = return_departure.hour + return_departure.minute / 60.0
+        day_starts_hours, day_ends_hours = day_starts.hour, day_ends.hour
+
+        explore_starts = max(day_starts_hours, outbound_arrival_hours + buffer)
+        explore_ends = min(day_ends_hours, return_departure_hours - buffer)
+
+        if num_nights == 0:
+            total_hours = max(0, explore_ends - explore_starts)
+        else:
+            arrival_day_hours = max(0, day_ends_hours - explore_starts)
+            departure_day_hours = max(0, explore_ends - day_starts_hours)
+            full_day_count = max(0, num_nights - 1)
+            full_day_hours = full_day_count * (day_ends_hours - day_starts_hours)
+            total_hours = arrival_day_hours + departure_day_hours + full_day_hours
+
+        return round(total_hours, 2)
+    except (ValueError, IndexError, TypeError):
+        return 0.0
+
+def rough_hours_by_nights(max_num_nights, config):
+    """Noon-to-noon exploration hours for every stay length 0..max_num_nights, as an array."""
+    return np.array([calculate_exploration_hours("12:00", "12:00", n, config) for n in range(max_num_nights + 1)], dtype=np.float64)
+
+def max_hours_by_nights(max_num_nights, config):
+    """Most exploration hours each stay length 0..max_num_nights allows: arriving at midnight, leaving just before the next."""
+    return np.array([calculate_exploration_hours("00:00", "23:59", n, config) for n in range(max_num_nights + 1)], dtype=np.float64)
+
+def _price_list_to_arrays(price_list):
+    """Parses each {full_date, price} once into ordinal-day and price arrays."""
+    ordinals, prices = [], []
+    for entry in price_list:
+        try:
+            ordinals.append(date.fromisoformat(entry['full_date']).toordinal())
+            prices.append(int(entry['price']))
+        except (KeyError, ValueError, TypeError):
+            continue
+    return np.array(ordinals, dtype=np.int64), np.array(prices, dtype=np.int64)
+
+def _top_k_indices(values, top_k):
+    """Indices of the top_k smallest values, in ascending order."""
+    if top_k and len(values) > top_k:
+        candidate_indices = np.argpartition(values, top_k - 1)[:top_k]
+    else:
+        candidate_indices = np.arange(len(values))
+    return candidate_indices[np.argsort(values[candidate_indices], kind='stable')]
+
+
+def cost_per_hour_lower_bound(all_outbound_prices, all_return_prices, max_num_nights, config):
+    """
+    The lowest cost per exploration hour any trip from these price graphs can
+    reach: a flight pair's calendar price over the most hours its stay could
+    give, with free accommodation. inf when no pair can meet min_exploration_hours.
+    """
+    min_exploration_hours = config['search_parameters'].get('min_exploration_hours', 10)
+    outbound_ordinals, outbound_prices = _price_list_to_arrays(all_outbound_prices)
+    return_ordinals, return_prices = _price_list_to_arrays(all_return_prices)
+
+    nights = return_ordinals[np.newaxis, :] - outbound_ordinals[:, np.newaxis]
+    hours = max_hours_by_nights(max_num_nights, config)[np.clip(nights, 0, max_num_nights)]
+    possible = (nights >= 0) & (nights <= max_num_nights) & (hours >= min_exploration_hours) & (hours > 0)
+    if not possible.any():
+        return float('inf')
+    flight_costs = outbound_prices[:, np.newaxis] + return_prices[np.newaxis, :]
+    return float(np.min(flight_costs[possible] / hours[possible]))
+
+
+class TripCandidates:
+    """
+    Flight date pairs held as parallel arrays, so Phase 5 can score every
+    candidate at once instead of one dict at a time.
+    """
+    def __init__(self, outbound_ordinals, return_ordinals, flight_costs, rough_hours):
+        self.outbound_ordinals = outbound_ordinals
+        self.return_ordinals = return_ordinals
+        self.num_nights = return_ordinals - outbound_ordinals
+        self.flight_costs = flight_costs
+        self.rough_hours = rough_hours
+
+    def __len__(self):
+        return len(self.outbound_ordinals)
+
+    def to_dicts(self, indices=None):
+        """The candidates as Phase 2 trip dicts."""
+        if indices is None:
+            indices = range(len(self))
+        return [{
+            "outbound_date": date.fromordinal(int(self.outbound_ordinals[i])).strftime("%Y-%m-%d"),
+            "return_date": date.fromordinal(int(self.return_ordinals[i])).strftime("%Y-%m-%d"),
+            "estimated_flight_cost": int(self.flight_costs[i]),
+            "num_nights": int(self.num_nights[i])
+        } for i in indices]
+
+
+def build_trip_candidates(all_outbound_prices, all_return_prices, max_num_nights, config, top_k=None):
+    """
+    Phase 2: pairs every outbound and return price whose night count fits
+    0..max_num_nights and whose rough exploration hours meet the minimum.
+    Keeps the top_k pairs by flight cost per rough hour (all of them if top_k is falsy).
+    """
+    min_exploration_hours = config['search_parameters'].get('min_exploration_hours', 10)
+    outbound_ordinals, outbound_prices = _price_list_to_arrays(all_outbound_prices)
+    return_ordinals, return_prices = _price_list_to_arrays(all_return_prices)
+
+    nights = return_ordinals[np.newaxis, :] - outbound_ordinals[:, np.newaxis]
+    hours_by_nights = rough_hours_by_nights(max_num_nights, config)
+    window_mask = (nights >= 0) & (nights <= max_num_nights)
+    ob_idx, ret_idx = np.nonzero(window_mask)
+
+    rough_hours = hours_by_nights[nights[ob_idx, ret_idx]]
+    keep = (rough_hours >= min_exploration_hours) & (rough_hours > 0)
+    ob_idx, ret_idx, rough_hours = ob_idx[keep], ret_idx[keep], rough_hours[keep]
+    flight_costs = outbound_prices[ob_idx] + return_prices[ret_idx]
+
+    order = _top_k_indices(flight_costs / rough_hours, top_k)
+    return TripCandidates(outbound_ordinals[ob_idx][order], return_ordinals[ret_idx][order], flight_costs[order], rough_hours[order])
+
+
+def match_accommodation_costs(candidates, listings_by_duration, airbnb_calendar_cache):
+    """
+    For each candidate, picks the first listing from the closest sampled
+    duration whose calendar is free for every night of the stay, and prices
+    the stay at that listing's per-night price times the candidate's nights.
+    Returns (accommodation_costs, matched_listings); unmatched stays get NaN and None.
+    """
+    accommodation_costs = np.full(len(candidates), np.nan)
+    matched_listings = [None] * len(candidates)
+
+    day_trips = np.flatnonzero(candidates.num_nights == 0)
+    accommodation_costs[day_trips] = 0
+    for i in day_trips:
+        matched_listings[i] = DAY_TRIP_LISTING
+
+    if not listings_by_duration:
+        return accommodation_costs, matched_listings
+
+    availability_indexes = build_availability_indexes(airbnb_calendar_cache)
+    sampled_durations = np.array(sorted(listings_by_duration.keys()), dtype=np.int64)
+    best_duration_matches = sampled_durations[np.argmin(np.abs(sampled_durations[np.newaxis, :] - candidates.num_nights[:, np.newaxis]), axis=1)]
+
+    for duration in sampled_durations:
+        unmatched = np.flatnonzero((best_duration_matches == duration) & (candidates.num_nights > 0))
+        for cached_listing in listings_by_duration[int(duration)]:
+            if not len(unmatched):
+                break
+            availability_index = availability_indexes.get(cached_listing['link'])
+            if availability_index is None:
+                continue
+            is_free = availability_index.available_mask(candidates.outbound_ordinals[unmatched], candidates.return_ordinals[unmatched])
+            per_night_cost = cached_listing.get('total_accommodation_cost', 0) / duration
+            accommodation_costs[unmatched[is_free]] = per_night_cost * candidates.num_nights[unmatched[is_free]]
+            for i in unmatched[is_free]:
+                matched_listings[i] = cached_listing
+            unmatched = unmatched[~is_free]
+
+    return accommodation_costs, matched_listings
+
+
+def score_trip_candidates(candidates, accommodation_costs, matched_listings, top_k=None):
+    """
+    Phase 5: total cost and cost per rough hour for every candidate in one
+    pass. Returns the top_k matched trips as dicts, cheapest per hour first.
+    """
+    estimated_total_costs = candidates.flight_costs + accommodation_costs
+    estimated_costs_per_hour = estimated_total_costs / candidates.rough_hours
+
+    matched = np.flatnonzero(np.isfinite(estimated_costs_per_hour))
+    order = matched[_top_k_indices(estimated_costs_per_hour[matched], top_k)]
+
+    potential_trips_with_estimates = []
+    for i, trip in zip(order, candidates.to_dicts(order)):
+        potential_trips_with_estimates.append({**trip,
+            "estimated_accommodation_cost": round(accommodation_costs[i].item(), 2),
+            "estimated_total_cost": estimated_total_costs[i].item(),
+            "estimated_cost_per_hour": estimated_costs_per_hour[i].item(),
+            "matched_airbnb_listing": matched_listings[i]})
+    return potential_trips_with_estimates